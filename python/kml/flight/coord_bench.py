@@ -0,0 +1,103 @@
+"""
+coord_utils 坐标转换的性能与精度测试
+
+在国内范围随机生成坐标，对比单点函数逐个调用、批量函数和批量函数快速模式(fast=True，偏移量网格插值)的吞吐量。
+误差(米)：反算结果再按公式正算回 GCJ-02 与原坐标的偏差；正算的快速模式与按公式计算的批量结果比较。
+快速模式第一次运行时会先生成偏移量网格(不计入耗时)：
+
+    python -m python.kml.flight.coord_bench --points 1000000
+"""
+import argparse
+import math
+import time
+from functools import partial
+
+import numpy as np
+
+from python.kml.flight.coord_utils import gcj02_to_wgs84, gcj02_to_wgs84_batch, gcj02_to_wgs84_exact, \
+    gcj02_to_wgs84_exact_batch, load_offset_grid, wgs84_to_gcj02, wgs84_to_gcj02_batch
+
+# 随机点的范围，比 out_of_china 的范围略小，避免边界两侧一侧偏移一侧不偏移
+LNG_RANGE = (74.0, 134.7)
+LAT_RANGE = (4.2, 53.2)
+
+
+def random_points(n, seed=1):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(*LNG_RANGE, n), rng.uniform(*LAT_RANGE, n)
+
+
+def scalar(func):
+    """逐点调用单点函数"""
+    def convert(lng, lat):
+        result = np.array([func(x, y) for x, y in zip(lng.tolist(), lat.tolist())])
+        return result[:, 0], result[:, 1]
+    return convert
+
+
+def distance_m(lng, lat, lng2, lat2):
+    """近距离两点间的距离(米)"""
+    dx = (lng2 - lng) * (math.pi / 180 * 6378137.0) * np.cos(np.radians(lat))
+    dy = (lat2 - lat) * (math.pi / 180 * 6378137.0)
+    return np.hypot(dx, dy)
+
+
+def inverse_error_m(lng, lat, wgs_lng, wgs_lat):
+    """反算结果正算回 GCJ-02 后与原坐标的距离(米)"""
+    return distance_m(lng, lat, *wgs84_to_gcj02_batch(wgs_lng, wgs_lat))
+
+
+def forward_error_m(lng, lat, gcj_lng, gcj_lat):
+    """正算结果与按公式计算的批量结果的距离(米)"""
+    return distance_m(gcj_lng, gcj_lat, *wgs84_to_gcj02_batch(lng, lat))
+
+
+def bench(name, convert, lng, lat, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = convert(lng, lat)
+        best = min(best, time.perf_counter() - start)
+    return name, best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='coord_utils 坐标转换性能测试')
+    parser.add_argument('--points', type=int, default=1000000, help='批量函数的点数')
+    parser.add_argument('--scalar-points', type=int, default=100000, help='单点函数逐个调用的点数(按比例折算吞吐量)')
+    parser.add_argument('--repeat', type=int, default=3, help='每项取最快的一次')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    lng, lat = random_points(args.points, args.seed)
+    small_lng, small_lat = lng[:args.scalar_points], lat[:args.scalar_points]
+    load_offset_grid()
+    cases = [
+        bench('wgs84_to_gcj02 单点', scalar(wgs84_to_gcj02), small_lng, small_lat, 1),
+        bench('gcj02_to_wgs84 单点', scalar(gcj02_to_wgs84), small_lng, small_lat, 1),
+        bench('gcj02_to_wgs84_exact 单点', scalar(gcj02_to_wgs84_exact), small_lng, small_lat, 1),
+        bench('wgs84_to_gcj02_batch', wgs84_to_gcj02_batch, lng, lat, args.repeat),
+        bench('gcj02_to_wgs84_batch', gcj02_to_wgs84_batch, lng, lat, args.repeat),
+        bench('gcj02_to_wgs84_exact_batch', gcj02_to_wgs84_exact_batch, lng, lat, args.repeat),
+        bench('wgs84_to_gcj02_batch fast', partial(wgs84_to_gcj02_batch, fast=True), lng, lat, args.repeat),
+        bench('gcj02_to_wgs84_batch fast', partial(gcj02_to_wgs84_batch, fast=True), lng, lat, args.repeat),
+        bench('gcj02_to_wgs84_exact_batch fast', partial(gcj02_to_wgs84_exact_batch, fast=True), lng, lat,
+              args.repeat),
+    ]
+    print(f'{"":<34}{"点数":>10}{"耗时(ms)":>12}{"万点/秒":>10}{"误差max(m)":>14}{"p99(m)":>10}')
+    for name, seconds, (out_lng, out_lat) in cases:
+        n = len(out_lng)
+        line = f'{name:<34}{n:>10}{seconds * 1000:>12.1f}{n / seconds / 10000:>10.1f}'
+        if 'gcj02_to_wgs84' in name:
+            error = inverse_error_m(lng[:n], lat[:n], out_lng, out_lat)
+        elif 'fast' in name:
+            error = forward_error_m(lng[:n], lat[:n], out_lng, out_lat)
+        else:
+            error = None
+        if error is not None:
+            line += f'{error.max():>14.3g}{np.percentile(error, 99):>10.3g}'
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
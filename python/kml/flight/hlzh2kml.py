@@ -5,7 +5,7 @@
 import datetime
 import xml.etree.ElementTree as ET
 from math import radians, sin, cos, sqrt, atan2
-from python.kml.flight.coord_utils import gcj02_to_wgs84
+from python.kml.flight.coord_utils import gcj02_to_wgs84_batch
 
 
 def distance(lat1, lon1, lat2, lon2):
@@ -23,19 +23,21 @@ def read_data():
     从文件中读取数据并返回
     :return:
     """
-    _data = []
+    longitudes, latitudes, timestamps = [], [], []
     # 打开文本文件并逐行读取数据
     with open('hlzh.txt', 'r') as f:
         for line in f:
             # 分割每一行数据，获取经纬度和时间戳
             line_data = line.strip().split('|')
-            longitude, latitude = float(line_data[1]), float(line_data[3])
-            longitude, latitude = gcj02_to_wgs84(longitude, latitude)
-            timestamp = datetime.datetime.strptime(line_data[8].strip('"'), '%Y-%m-%d %H:%M:%S%f')
-
-            # 存储经纬度和时间戳到数据列表中
-            _data.append({'longitude': longitude, 'latitude': latitude, 'timestamp': timestamp})
-    return _data
+            longitudes.append(float(line_data[1]))
+            latitudes.append(float(line_data[3]))
+            timestamps.append(datetime.datetime.strptime(line_data[8].strip('"'), '%Y-%m-%d %H:%M:%S%f'))
+    # 读完后一次性转换全部坐标
+    longitudes, latitudes = gcj02_to_wgs84_batch(longitudes, latitudes)
+
+    # 存储经纬度和时间戳到数据列表中
+    return [{'longitude': longitude, 'latitude': latitude, 'timestamp': timestamp}
+            for longitude, latitude, timestamp in zip(longitudes.tolist(), latitudes.tolist(), timestamps)]
 
 
 def fix_data(_data):
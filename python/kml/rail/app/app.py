@@ -1,46 +1,115 @@
-from flask import Flask, request, jsonify, render_template, session
-import pickle
-import folium
+from flask import Flask, Response, request, jsonify, render_template, session
+import hashlib
+import json
 import os
 import math
+from functools import lru_cache
+
+from export import FORMATS as EXPORT_FORMATS, export_path
+from geometry import json_with_fragments
+from metrics import RequestMetrics, phase
+from name_search import SEARCH_FIELDS
+from path_store import create_path_store, new_exploration_id
+from rail_data import RailData
+from simplify import snap_tolerance, tolerance_for_zoom
+from tiles import MAX_ZOOM as MAX_TILE_ZOOM
+from traversal import iter_connected_ways
 
 DATA_DIR = 'data'
-NODE_TO_WAYS_PATH = os.path.join(DATA_DIR, 'node_to_ways.pkl')
-WAY_TO_NODES_PATH = os.path.join(DATA_DIR, 'way_to_nodes.pkl')
-NODE_COORDS_PATH = os.path.join(DATA_DIR, 'node_coords.pkl')
-WAY_TO_META_PATH = os.path.join(DATA_DIR, 'way_to_meta.pkl')
-
-# 加载索引
-with open(NODE_TO_WAYS_PATH, 'rb') as f:
-    node_to_ways = pickle.load(f)
-with open(WAY_TO_NODES_PATH, 'rb') as f:
-    way_to_nodes = pickle.load(f)
-with open(NODE_COORDS_PATH, 'rb') as f:
-    node_coords = pickle.load(f)
-with open(WAY_TO_META_PATH, 'rb') as f:
-    way_to_meta = pickle.load(f)
+GRAPH_DIR = os.path.join(DATA_DIR, 'graph')
+TILE_CACHE_DIR = os.path.join(DATA_DIR, 'tiles')
+
+# 索引在首次使用时才加载(mmap只读映射，多个worker共享同一份内存页)
+data = RailData(GRAPH_DIR, geometry_cache_size=int(os.environ.get('RAIL_GEOMETRY_CACHE', 20000)),
+                tile_cache_dir=TILE_CACHE_DIR)
+if os.environ.get('RAIL_PRELOAD') == '1':
+    # gunicorn --preload 时在master进程中加载，worker直接继承
+    data.preload()
 
 app = Flask(__name__)
 app.secret_key = 'a_very_secret_key_123456'  # 用于session
 
-# 递归查找轨道
+# 全局累计链路存在服务端，session里只保存探索id
+# RAIL_PATH_STORE=memory(默认，进程内LRU) 或 sqlite:路径(多worker部署时共享)
+# RAIL_PATH_MAX_AGE_DAYS: SQLite 中探索的保留天数(默认30，从最后一次追加算起)
+path_store = create_path_store(os.environ.get('RAIL_PATH_STORE', 'memory'),
+                               max_age_days=float(os.environ.get('RAIL_PATH_MAX_AGE_DAYS', 30)))
+
+# 请求耗时统计(/metrics)；RAIL_SLOW_REQUEST_MS 设置后超过该耗时的请求把各阶段耗时写入日志，
+# RAIL_SLOW_REQUEST_LOG 为日志文件(默认输出到 stderr)；
+# RAIL_METRICS_DIR 为多 worker 共享的统计目录，设置后 /metrics 输出所有 worker 的合计
+slow_ms = os.environ.get('RAIL_SLOW_REQUEST_MS')
+metrics = RequestMetrics(slow_ms=float(slow_ms) if slow_ms else None, slow_log=os.environ.get('RAIL_SLOW_REQUEST_LOG'),
+                         multiprocess_dir=os.environ.get('RAIL_METRICS_DIR'))
+
+@app.before_request
+def start_request_metrics():
+    metrics.start()
+
+@app.after_request
+def finish_request_metrics(resp):
+    rule = request.url_rule
+    metrics.finish(rule.rule if rule else 'unmatched', request.method, resp.status_code, request.full_path.rstrip('?'))
+    return resp
+
+def cache_metrics():
+    """坐标缓存和推荐缓存的命中情况，索引未加载时不输出"""
+    if not data.loaded:
+        return []
+    geometry = data.geometry.stats()
+    recommend = _recommend_at_junction.cache_info()
+    return [
+        ('rail_geometry_cache_size', 'gauge', '坐标缓存中的way数', geometry['size']),
+        ('rail_geometry_cache_hits_total', 'counter', '坐标缓存命中次数', geometry['hits']),
+        ('rail_geometry_cache_misses_total', 'counter', '坐标缓存未命中次数', geometry['misses']),
+        ('rail_recommend_cache_hits_total', 'counter', '推荐结果缓存命中次数', recommend.hits),
+        ('rail_recommend_cache_misses_total', 'counter', '推荐结果缓存未命中次数', recommend.misses),
+    ]
+
+metrics.add_collector(cache_metrics)
+
+def current_exploration_id():
+    if 'exploration_id' not in session:
+        session['exploration_id'] = new_exploration_id()
+    return session['exploration_id']
+
+# 推荐结果按路口(前两条way, 可选way)缓存的条数
+RECOMMEND_CACHE_SIZE = 65536
+
+# 查找相连轨道(显式栈遍历，不受递归深度限制)
 MAX_DEPTH = 1000
 
-def find_connected_ways(start_way_id, max_depth=MAX_DEPTH):
-    visited_ways = set()
-    result = []
-    def dfs(way_id, depth):
-        if depth > max_depth or way_id in visited_ways:
-            return
-        visited_ways.add(way_id)
-        result.append(way_id)
-        nodes = way_to_nodes.get(way_id, [])
-        for n in nodes:
-            for next_way in node_to_ways.get(n, set()):
-                if next_way != way_id:
-                    dfs(next_way, depth+1)
-    dfs(start_way_id, 1)
-    return result
+# /nearest 搜索半径上限(米)
+MAX_NEAREST_RADIUS = 200000
+# /bbox 最多返回的way数
+MAX_BBOX_WAYS = 1000
+
+def valid_latlon(lat, lon):
+    """纬度在[-90, 90]、经度在[-180, 180]内(NaN 不合法)"""
+    return -90 <= lat <= 90 and -180 <= lon <= 180
+
+class InvalidParameter(ValueError):
+    """请求参数不合法，返回 400"""
+
+@app.errorhandler(InvalidParameter)
+def invalid_parameter(e):
+    return jsonify({'error': str(e)}), 400
+
+def request_tolerance():
+    """
+    请求参数 tolerance(米) 或 zoom(地图缩放级别) → 折线简化容差，都不传时返回原始精度。
+    tolerance 取整到缩放级别对应的容差，用作坐标缓存的键时不会因为任意小数产生大量缓存项
+    """
+    tolerance = request.args.get('tolerance', type=float)
+    if tolerance is None:
+        zoom = request.args.get('zoom', type=int)
+        return tolerance_for_zoom(zoom) if zoom is not None else 0
+    if not math.isfinite(tolerance):
+        raise InvalidParameter(f'tolerance 不合法: {tolerance}')
+    return snap_tolerance(tolerance)
+
+def find_connected_ways(start_way_id, max_depth=MAX_DEPTH, max_ways=None):
+    return [wid for wid, _ in iter_connected_ways(data.graph.neighbor_ways, start_way_id, max_depth, max_ways)]
 
 def find_next_choices(start_way_id, max_depth=20, total_path=None):
     """
@@ -49,31 +118,12 @@ def find_next_choices(start_way_id, max_depth=20, total_path=None):
     """
     if total_path is None:
         total_path = []  # int列表
-    visited_ways = set()
-    path = []
-    current_way = start_way_id
-    for _ in range(max_depth):
-        visited_ways.add(current_way)
-        path.append(current_way)
-        nodes = way_to_nodes.get(current_way, [])
-        neighbor_ways = set()
-        for n in nodes:
-            neighbor_ways.update(node_to_ways.get(n, set()))
-        neighbor_ways.discard(current_way)  # 排除当前way
-        neighbor_ways -= visited_ways
-        neighbor_ways -= set(total_path)  # 排除全局累计链路中出现过的way，避免往回走
-        if len(neighbor_ways) == 1:
-            current_way = list(neighbor_ways)[0]
-        else:
-            return {
-                'current_way': current_way,
-                'choices': list(neighbor_ways),
-                'path': path,
-                'visited_path': path
-            }
+    # 排除全局累计链路中出现过的way，避免往回走；无分支链整段跳过，见 RailGraph.advance_until_branch
+    with phase('find_next_choices'):
+        path, choices, current_way = data.graph.advance_until_branch(start_way_id, max_depth, total_path)
     return {
         'current_way': current_way,
-        'choices': list(neighbor_ways),
+        'choices': choices,
         'path': path,
         'visited_path': path
     }
@@ -82,20 +132,22 @@ def find_next_choices(start_way_id, max_depth=20, total_path=None):
 def index():
     return render_template('index.html')
 
-@app.route('/ways/<int:way_id>')
-def get_ways(way_id):
-    if request.args.get('reset') == '1':
-        session['total_path'] = []
-    if 'total_path' not in session or not isinstance(session['total_path'], list):
-        session['total_path'] = []
-    else:
-        session['total_path'] = [x for x in session['total_path'] if isinstance(x, dict) and 'way_id' in x]
-    total_path = session['total_path']
-    int_path = [x['way_id'] for x in total_path]
-    result = find_next_choices(way_id, total_path=int_path)
+# auto=single 时沿唯一可选轨道继续前进(原来由前端循环请求)，auto=recommend 时在分叉处也沿推荐方向前进；
+# 每次请求最多前进 max_steps 步(默认 AUTO_MAX_STEPS，取值范围 1 到 AUTO_STEPS_LIMIT)，可用 max_distance(米)限制距离
+AUTO_MAX_STEPS = 50
+AUTO_STEPS_LIMIT = 500
+
+def advance_exploration(exploration_id, way_id):
+    """
+    从way_id前进到下一个分叉，并把经过的way追加到全局累计链路
+    :return: (find_next_choices 的结果, 追加后的累计链路)
+    """
+    with phase('session'):
+        exploration = path_store.load(exploration_id)
+    result = find_next_choices(way_id, total_path=exploration.way_ids)
     visited_path = result['visited_path']
     new_path = []
-    if not total_path:
+    if not len(exploration):
         new_path.append({'way_id': visited_path[0], 'type': 'manual'})
         start = 1
     else:
@@ -105,28 +157,102 @@ def get_ways(way_id):
             new_path.append({'way_id': visited_path[i], 'type': 'manual'})
         else:
             new_path.append({'way_id': visited_path[i], 'type': 'auto'})
-    for item in new_path:
-        if not any(x['way_id']==item['way_id'] for x in total_path):
-            total_path.append(item)
-    session['total_path'] = total_path
-    result['total_path'] = total_path
-    # 新增：返回轨道坐标数据
-    def way_coords(wid):
-        nodes = way_to_nodes.get(wid, [])
-        return [node_coords[n] for n in nodes if n in node_coords]
-    result['path_coords'] = [
-        {'id': wid, 'coords': way_coords(wid), 'meta': way_to_meta.get(wid, {})}
-        for wid in result['path']
-    ]
-    result['choice_coords'] = [
-        {'id': wid, 'coords': way_coords(wid), 'meta': way_to_meta.get(wid, {})}
-        for wid in result['choices']
-    ]
-    result['total_path_coords'] = [
-        {'id': x['way_id'], 'coords': way_coords(x['way_id']), 'meta': way_to_meta.get(x['way_id'], {}), 'type': x['type']}
-        for x in total_path
-    ]
-    # === 推荐逻辑 ===
+    with phase('session'):
+        return result, path_store.append(exploration_id, new_path).items
+
+@app.route('/ways/<int:way_id>')
+def get_ways(way_id):
+    reset = request.args.get('reset') == '1'
+    with phase('session'):
+        exploration_id = current_exploration_id()
+        if reset:
+            path_store.reset(exploration_id)
+    result, total_path = advance_exploration(exploration_id, way_id)
+    auto = request.args.get('auto')
+    if auto == '1':
+        auto = 'single'
+    if auto in ('single', 'recommend'):
+        geometry = data.geometry
+        max_steps = min(max(request.args.get('max_steps', AUTO_MAX_STEPS, type=int), 1), AUTO_STEPS_LIMIT)
+        max_distance = request.args.get('max_distance', type=float)
+        path = list(result['path'])
+        with phase('coords'):
+            distance = sum(geometry.length(wid) for wid in path)
+        steps = 1
+        while True:
+            choices = result['choices']
+            if not choices:
+                stop = 'end'
+                break
+            if steps >= max_steps:
+                stop = 'max_steps'
+                break
+            if max_distance is not None and distance >= max_distance:
+                stop = 'max_distance'
+                break
+            if len(choices) == 1:
+                next_way = choices[0]
+            elif auto == 'recommend':
+                with phase('recommend'):
+                    next_way = recommend_choice(total_path, choices)
+            else:
+                next_way = None
+            if next_way is None:
+                stop = 'branch'
+                break
+            result, total_path = advance_exploration(exploration_id, next_way)
+            path.extend(result['path'])
+            with phase('coords'):
+                distance += sum(geometry.length(wid) for wid in result['path'])
+            steps += 1
+        # 多步前进合并成一次响应：path 为本次请求经过的全部way，choices 为最后停下处的可选way
+        result['path'] = result['visited_path'] = path
+        result['auto'] = {'steps': steps, 'distance_m': round(distance, 1), 'stop_reason': stop}
+    # since=客户端已有的链路条数，只返回之后新增的部分；不传时返回整条链路
+    since = request.args.get('since', type=int)
+    if since is None or since < 0 or since > len(total_path) or reset:
+        since = 0
+    delta = total_path[since:]
+    result['total_path'] = delta
+    result['total_path_offset'] = since
+    result['total_path_length'] = len(total_path)
+    # 坐标数据：直接拼接缓存中预先序列化好的片段
+    geometry = data.geometry
+    encoding = 'polyline' if request.args.get('encoding') == 'polyline' else 'coords'
+    tolerance = request_tolerance()
+    with phase('recommend'):
+        recommend = recommend_choice(total_path, result['choices'])
+    with phase('coords'):
+        fragments = {
+            'path_coords': [geometry.way_json(wid, encoding, tolerance) for wid in result['path']],
+            'choice_coords': [
+                geometry.way_json(wid, encoding, tolerance, recommend=True) if wid == recommend
+                else geometry.way_json(wid, encoding, tolerance)
+                for wid in result['choices']
+            ],
+            'total_path_coords': [geometry.way_json(x['way_id'], encoding, tolerance, type=x['type']) for x in delta],
+        }
+    with phase('json'):
+        body = json_with_fragments(result, fragments)
+    return Response(body, mimetype='application/json')
+
+def recommend_choice(total_path, choices):
+    """
+    推荐下一条way，只取决于累计链路的最后两条way和可选way，结果按路口缓存
+    :return: 推荐的way id，没有时返回None
+    """
+    if len(total_path) < 2 or not choices:
+        return None
+    return _recommend_at_junction(int(total_path[-2]['way_id']), int(total_path[-1]['way_id']),
+                                  tuple(int(wid) for wid in choices))
+
+@lru_cache(maxsize=RECOMMEND_CACHE_SIZE)
+def _recommend_at_junction(prev2_id, prev1_id, choices):
+    """
+    排除往回走的，name与上一条相同的优先，终点离前两条way终点连线最近的优先
+    :param choices: 可选way id 的元组
+    """
+    geometry = data.geometry
     def dist(p1, p2):
         return math.hypot(p1[0]-p2[0], p1[1]-p2[1])
     def point_line_dist(p, a, b):
@@ -139,77 +265,295 @@ def get_ways(way_id):
         num = abs((y2-y1)*x0 - (x2-x1)*y0 + x2*y1 - y2*x1)
         den = math.hypot(y2-y1, x2-x1)
         return num/den if den else 0
-    if len(result['total_path_coords']) >= 2 and result['choice_coords']:
-        prev2 = result['total_path_coords'][-2]
-        prev1 = result['total_path_coords'][-1]
-        a = prev2['coords'][-1] if prev2['coords'] else None
-        b = prev1['coords'][-1] if prev1['coords'] else None
-        prev1_name = prev1['meta'].get('tags', {}).get('name')
-        # 1. 排除往回走
-        filtered = []
-        for c in result['choice_coords']:
-            if not c['coords']: continue
-            c_end = c['coords'][-1]
-            if dist(c_end, a) < dist(c_end, b):
-                continue
-            filtered.append(c)
-        # 2. name相同优先（都为空不算）
-        name_matched = []
-        if prev1_name:
-            for c in filtered:
-                cname = c['meta'].get('tags', {}).get('name')
-                if cname and cname == prev1_name:
-                    name_matched.append(c)
-        # 3. 终点更靠近直线
-        candidates = name_matched if name_matched else filtered
-        best_idx = -1
-        best_score = float('inf')
-        for idx, c in enumerate(result['choice_coords']):
-            if c not in candidates: continue
-            c_end = c['coords'][-1]
-            score = point_line_dist(c_end, a, b)
-            if score < best_score:
-                best_score = score
-                best_idx = idx
-        if best_idx >= 0:
-            result['choice_coords'][best_idx]['recommend'] = True
-    return jsonify(result)
+    prev2 = geometry.coords(prev2_id)
+    prev1 = geometry.coords(prev1_id)
+    if not prev2 or not prev1:
+        return None
+    a = prev2[-1]
+    b = prev1[-1]
+    prev1_name = geometry.meta(prev1_id).get('tags', {}).get('name')
+    # 1. 排除往回走
+    filtered = []
+    for wid in choices:
+        coords = geometry.coords(wid)
+        if not coords: continue
+        c_end = coords[-1]
+        if dist(c_end, a) < dist(c_end, b):
+            continue
+        filtered.append(wid)
+    # 2. name相同优先（都为空不算）
+    name_matched = []
+    if prev1_name:
+        for wid in filtered:
+            cname = geometry.meta(wid).get('tags', {}).get('name')
+            if cname and cname == prev1_name:
+                name_matched.append(wid)
+    # 3. 终点更靠近直线
+    candidates = name_matched if name_matched else filtered
+    best = None
+    best_score = float('inf')
+    for wid in choices:
+        if wid not in candidates: continue
+        score = point_line_dist(geometry.coords(wid)[-1], a, b)
+        if score < best_score:
+            best_score = score
+            best = wid
+    return best
+
+@app.route('/connected/<int:way_id>')
+def get_connected(way_id):
+    """
+    流式返回相连轨道，每行一个JSON: {"way_id":..,"depth":..}
+    参数: max_depth、max_ways、order(dfs/bfs)
+    """
+    max_depth = request.args.get('max_depth', MAX_DEPTH, type=int)
+    max_ways = request.args.get('max_ways', type=int)
+    order = request.args.get('order', 'dfs')
+    if order not in ('dfs', 'bfs'):
+        return jsonify({'error': f'未知的遍历顺序: {order}'}), 400
+    def generate():
+        for wid, depth in iter_connected_ways(data.graph.neighbor_ways, way_id, max_depth, max_ways, order=order):
+            yield json.dumps({'way_id': wid, 'depth': depth}) + '\n'
+    return Response(generate(), mimetype='application/x-ndjson')
+
+@app.route('/nearest')
+def get_nearest():
+    """距离点最近的轨道: /nearest?lat=&lon=&k="""
+    lat = request.args.get('lat', type=float)
+    lon = request.args.get('lon', type=float)
+    if lat is None or lon is None:
+        return jsonify({'error': '缺少参数 lat/lon'}), 400
+    if not valid_latlon(lat, lon):
+        return jsonify({'error': f'坐标超出范围: lat={lat}, lon={lon}'}), 400
+    k = min(max(request.args.get('k', 5, type=int), 1), 50)
+    radius = request.args.get('radius', 50000, type=float)
+    max_radius = min(radius, MAX_NEAREST_RADIUS) if radius >= 0 else 0
+    ways = [
+        {'id': wid, 'distance': round(dist, 1), 'name': data.graph.way_tags(wid, ('name',)).get('name')}
+        for wid, dist in data.spatial.nearest(lat, lon, k, max_radius)
+    ]
+    return jsonify({'ways': ways})
+
+@app.route('/bbox')
+def get_bbox():
+    """范围内的轨道: /bbox?min_lat=&min_lon=&max_lat=&max_lon=&limit="""
+    try:
+        box = [float(request.args[k]) for k in ('min_lat', 'min_lon', 'max_lat', 'max_lon')]
+    except (KeyError, ValueError):
+        return jsonify({'error': '缺少参数 min_lat/min_lon/max_lat/max_lon'}), 400
+    if not (valid_latlon(box[0], box[1]) and valid_latlon(box[2], box[3])):
+        return jsonify({'error': f'坐标超出范围: {box}'}), 400
+    limit = min(max(request.args.get('limit', MAX_BBOX_WAYS, type=int), 0), MAX_BBOX_WAYS)
+    return jsonify({'ways': data.spatial.bbox_ways(*box, limit=limit)})
+
+@app.route('/search')
+def search_ways():
+    """按名称/线路编号/运营方搜索轨道: /search?q=&page=&size="""
+    q = request.args.get('q', '')
+    page = max(request.args.get('page', 1, type=int), 1)
+    size = min(max(request.args.get('size', 20, type=int), 1), 200)
+    total, hits = data.names.search(q, (page - 1) * size, size)
+    results = []
+    for wid, score in hits:
+        tags = data.graph.way_tags(wid, SEARCH_FIELDS)
+        results.append({'id': wid, 'name': tags.get('name'), 'ref': tags.get('ref'),
+                        'operator': tags.get('operator'), 'score': score})
+    return jsonify({'total': total, 'page': page, 'size': size, 'results': results})
+
+def parse_latlon(text):
+    """'lat,lon' → (lat, lon)，格式不对或超出范围返回 None"""
+    try:
+        lat, lon = (float(x) for x in text.split(','))
+    except (AttributeError, ValueError):
+        return None
+    return (lat, lon) if valid_latlon(lat, lon) else None
+
+@app.route('/route')
+def get_route():
+    """两条轨道间沿轨道的最短路径: /route?from_way=&to_way= 或 /route?from=lat,lon&to=lat,lon"""
+    ends = []
+    for key in ('from', 'to'):
+        way_id = request.args.get(f'{key}_way', type=int)
+        if way_id is None:
+            point = parse_latlon(request.args.get(key))
+            if point is None:
+                return jsonify({'error': f'缺少参数 {key}_way 或 {key}=lat,lon'}), 400
+            nearest = data.spatial.nearest(point[0], point[1], 1)
+            if not nearest:
+                return jsonify({'error': f'{key} 附近没有轨道'}), 404
+            way_id = nearest[0][0]
+        ends.append(way_id)
+    try:
+        router = data.router
+    except KeyError as e:
+        return jsonify({'error': e.args[0]}), 503
+    try:
+        # 不在同一个连通分量时不可能有路径，不必让 A* 搜完整个网络
+        disconnected = not data.components.connected(*ends)
+    except KeyError:
+        disconnected = False
+    if disconnected and all(data.graph.way_index(w) >= 0 for w in ends):
+        return jsonify({'error': '两条轨道之间没有相连的路径', 'from_way': ends[0], 'to_way': ends[1]}), 404
+    try:
+        with phase('route'):
+            found = router.route(*ends)
+    except KeyError as e:
+        return jsonify({'error': f'way {e.args[0]} 不存在'}), 404
+    if found is None:
+        return jsonify({'error': '两条轨道之间没有相连的路径', 'from_way': ends[0], 'to_way': ends[1]}), 404
+    ways, distance = found
+    geometry = data.geometry
+    encoding = 'polyline' if request.args.get('encoding') == 'polyline' else 'coords'
+    tolerance = request_tolerance()
+    result = {'from_way': ends[0], 'to_way': ends[1], 'distance_m': round(distance, 1), 'ways': ways}
+    # route_coords 与 /ways 的 total_path_coords 格式相同
+    with phase('coords'):
+        fragments = {'route_coords': [geometry.way_json(wid, encoding, tolerance, type='route') for wid in ways]}
+    with phase('json'):
+        body = json_with_fragments(result, fragments)
+    return Response(body, mimetype='application/json')
+
+@app.route('/components')
+def get_components():
+    """
+    互不相连的铁路网络，按way数从大到小: /components?limit=&min_ways=
+    传 way= 时只返回该way所在网络的统计
+    """
+    try:
+        components = data.components
+    except KeyError as e:
+        return jsonify({'error': e.args[0]}), 503
+    way_id = request.args.get('way', type=int)
+    if way_id is not None:
+        component = components.component_of(way_id)
+        if component < 0:
+            return jsonify({'error': f'way {way_id} 不存在'}), 404
+        return jsonify(dict(components.summary(component), way_id=way_id))
+    limit = min(request.args.get('limit', 20, type=int), 1000)
+    min_ways = request.args.get('min_ways', 1, type=int)
+    return jsonify({'count': components.count, 'components': components.largest(limit, min_ways)})
+
+@app.route('/components/<int:component>')
+def get_component(component):
+    try:
+        components = data.components
+    except KeyError as e:
+        return jsonify({'error': e.args[0]}), 503
+    if not 0 <= component < components.count:
+        return jsonify({'error': f'网络 {component} 不存在'}), 404
+    return jsonify(components.summary(component))
+
+@app.route('/reachable')
+def get_reachable():
+    """两条way是否相连: /reachable?from_way=&to_way=，只查表，不遍历网络"""
+    ends = [request.args.get('from_way', type=int), request.args.get('to_way', type=int)]
+    if None in ends:
+        return jsonify({'error': '缺少参数 from_way 或 to_way'}), 400
+    try:
+        components = data.components
+    except KeyError as e:
+        return jsonify({'error': e.args[0]}), 503
+    labels = [components.component_of(w) for w in ends]
+    for way_id, label in zip(ends, labels):
+        if label < 0:
+            return jsonify({'error': f'way {way_id} 不存在'}), 404
+    return jsonify({'from_way': ends[0], 'to_way': ends[1], 'connected': labels[0] == labels[1],
+                    'from_component': labels[0], 'to_component': labels[1]})
+
+@app.route('/tiles/<int:z>/<int:x>/<int:y>.mvt')
+def get_tile(z, x, y):
+    """全网矢量瓦片(Mapbox Vector Tile)，图层 rail"""
+    if not (0 <= z <= MAX_TILE_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        return jsonify({'error': '瓦片坐标超出范围'}), 404
+    resp = Response(data.tiles.tile(z, x, y), mimetype='application/vnd.mapbox-vector-tile')
+    resp.headers['Cache-Control'] = 'public, max-age=86400'
+    return resp
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus 抓取接口：请求数、各接口及各阶段耗时直方图、缓存命中"""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/ready')
+def ready():
+    """就绪检查：首次调用时加载索引，索引缺失或损坏返回503"""
+    try:
+        return jsonify(data.status())
+    except Exception as e:
+        return jsonify({'ready': False, 'error': str(e)}), 503
+
+@app.route('/export/<fmt>')
+def export_journey(fmt):
+    """
+    导出全局累计链路(kml/geojson/gpx)，分块流式输出；merge=1 时合并首尾相接的连续way，
+    同样支持 zoom/tolerance 简化
+    """
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f'不支持的导出格式: {fmt}，可选 {"/".join(sorted(EXPORT_FORMATS))}'}), 400
+    way_ids = [x['way_id'] for x in path_store.load(current_exploration_id()).items]
+    if not way_ids:
+        return jsonify({'error': '当前没有探索链路'}), 404
+    mimetype, ext = EXPORT_FORMATS[fmt]
+    chunks = export_path(data.graph, way_ids, fmt, merge=request.args.get('merge') == '1',
+                         tolerance=request_tolerance(), name=f'rail way {way_ids[0]}')
+    resp = Response(chunks, mimetype=mimetype)
+    resp.headers['Content-Disposition'] = f'attachment; filename=rail_{way_ids[0]}.{ext}'
+    return resp
+
+def geojson_response(etag, build, max_age=None):
+    """
+    带 ETag 的 GeoJSON 响应，客户端缓存仍有效时直接返回 304，不生成内容
+    :param build: 生成响应体的函数
+    """
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+    else:
+        resp = Response(build(), mimetype='application/geo+json')
+    resp.set_etag(etag)
+    resp.headers['Cache-Control'] = f'public, max-age={max_age}' if max_age else 'no-cache'
+    return resp
+
+@app.route('/geojson/way/<int:way_id>')
+def geojson_way(way_id):
+    """单条way(悬停高亮用)，内容只取决于索引版本和简化容差，可长期缓存"""
+    graph = data.graph
+    if graph.way_index(way_id) < 0:
+        return jsonify({'error': f'way {way_id} 不存在'}), 404
+    tolerance = request_tolerance()
+    etag = f'{graph.generation}-{way_id}-{tolerance:g}'
+    return geojson_response(etag, lambda: data.geometry.geojson(way_id, tolerance), max_age=86400)
+
+@app.route('/geojson/path/<int:way_id>')
+def geojson_path(way_id):
+    """
+    从way_id前进到下一个分叉经过的链路(不写入全局累计链路)，highlight 给出时附带高亮的way；
+    每条 Feature 的 properties.role 为 path 或 highlight
+    """
+    exploration = path_store.load(current_exploration_id())
+    result = find_next_choices(way_id, total_path=exploration.way_ids)
+    highlight = request.args.get('highlight', type=int)
+    tolerance = request_tolerance()
+    # 链路与全局累计链路有关，用内容摘要作 ETag
+    key = f'{data.graph.generation}|{result["path"]}|{highlight}|{tolerance:g}'
+    etag = hashlib.sha1(key.encode()).hexdigest()
+    def build():
+        geometry = data.geometry
+        features = [geometry.geojson(wid, tolerance, role='path') for wid in result['path']]
+        if highlight:
+            features.append(geometry.geojson(highlight, tolerance, role='highlight'))
+        return '{"type":"FeatureCollection","features":[' + ','.join(features) + ']}'
+    return geojson_response(etag, build)
 
 @app.route('/map/<int:way_id>')
 def get_map(way_id):
-    session_path = session.get('total_path', [])
-    int_path = [x['way_id'] for x in session_path if isinstance(x, dict) and 'way_id' in x]
-    result = find_next_choices(way_id, total_path=int_path)
-    highlight = request.args.get('highlight', type=int)
-    all_coords = []
-    for wid in result['path']:
-        nodes = way_to_nodes.get(wid, [])
-        coords = [node_coords[n] for n in nodes if n in node_coords]
-        all_coords.extend(coords)
-    if highlight:
-        nodes = way_to_nodes.get(highlight, [])
-        coords = [node_coords[n] for n in nodes if n in node_coords]
-        all_coords.extend(coords)
-    center = [35, 104]
-    if all_coords:
-        center = all_coords[0]
-    m = folium.Map(location=center, zoom_start=8)
-    # 蓝色链路
-    for wid in result['path']:
-        nodes = way_to_nodes.get(wid, [])
-        coords = [node_coords[n] for n in nodes if n in node_coords]
-        if len(coords) >= 2:
-            folium.PolyLine(coords, color='blue', tooltip=f"{wid}").add_to(m)
-    # 仅高亮悬停轨道
-    if highlight:
-        nodes = way_to_nodes.get(highlight, [])
-        coords = [node_coords[n] for n in nodes if n in node_coords]
-        if len(coords) >= 2:
-            folium.PolyLine(coords, color='red', tooltip=f'可选:{highlight}').add_to(m)
-    # 自动缩放
-    if all_coords:
-        m.fit_bounds(all_coords)
-    return m._repr_html_()
+    """
+    单独的地图页：页面本身是静态的(way_id、highlight 等参数由页面脚本从地址栏读取)，
+    链路和高亮图层通过 /geojson 接口加载，悬停切换高亮只需取一条way的 GeoJSON
+    """
+    resp = Response(render_template('map.html'))
+    resp.add_etag()
+    resp.headers['Cache-Control'] = 'no-cache'
+    return resp.make_conditional(request)
 
 if __name__ == '__main__':
     app.run(debug=True) 
\ No newline at end of file
@@ -0,0 +1,169 @@
+"""
+铁路网络的连通分量
+
+建索引时用并查集把共享node的way合并，保存:
+- way_component:    每条way所属分量编号，按分量大小降序编号(0 为最大的网络)
+- component_size:   每个分量的way数
+- component_length: 每个分量的轨道总长(米)，缺坐标的路段不计
+- component_bbox:   每个分量的外包框 [min_lat, min_lon, max_lat, max_lon]
+
+两条way是否相连、所在网络有多大都只需查表，不必遍历整个网络。
+
+命令行：
+    python3 components.py --top 20
+    python3 components.py --way 123456
+    python3 components.py --check 123456 654321
+"""
+import argparse
+import os
+
+import numpy as np
+
+from geo import haversine
+from spatial import build_spatial_arrays
+
+COMPONENT_ARRAYS = ['way_component', 'component_size', 'component_length', 'component_bbox']
+
+
+def union_find(n, u, v):
+    """
+    并查集：合并边 (u, v) 两端，返回每个元素的根
+    每轮把所有跨分量的边一起处理，较大的根挂到较小的根下，再做路径压缩(指针跳跃)直到每个元素直接指向根
+    """
+    parent = np.arange(n, dtype=np.int64)
+    while True:
+        pu, pv = parent[u], parent[v]
+        cross = pu != pv
+        if not cross.any():
+            return parent
+        u, v = u[cross], v[cross]
+        np.minimum.at(parent, np.maximum(pu[cross], pv[cross]), np.minimum(pu[cross], pv[cross]))
+        while True:
+            grand = parent[parent]
+            if np.array_equal(grand, parent):
+                break
+            parent = grand
+
+
+def build_component_arrays(arrays):
+    """由CSR图计算连通分量及各分量的统计"""
+    offsets = arrays['way_node_offsets']
+    idx = arrays['way_node_idx']
+    way_count = len(offsets) - 1
+    # 同一node上相邻登记的两条way相连，足以把共享该node的所有way并到一起
+    node_way_offsets = arrays['node_way_offsets']
+    node_way_idx = arrays['node_way_idx']
+    group_start = np.zeros(len(node_way_idx) + 1, dtype=bool)
+    group_start[node_way_offsets] = True
+    pair = np.nonzero(~group_start[1:-1])[0]
+    root = union_find(way_count, node_way_idx[pair].astype(np.int64), node_way_idx[pair + 1].astype(np.int64))
+
+    _, label, size = np.unique(root, return_inverse=True, return_counts=True)
+    # 按way数降序重新编号，way数相同时按原顺序
+    order = np.argsort(-size, kind='stable')
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    component = rank[label].astype(np.int32)
+
+    # 每条way的长度：相邻点的球面距离，跨way的点对和缺坐标的路段不计
+    lat = arrays['node_lat'][idx]
+    lon = arrays['node_lon'][idx]
+    seg = haversine(lat[:-1], lon[:-1], lat[1:], lon[1:]) if len(idx) > 1 else np.zeros(0)
+    seg_way = np.searchsorted(offsets, np.arange(len(seg)), side='right') - 1
+    inside = np.nonzero(offsets[seg_way + 1] - 1 > np.arange(len(seg)))[0]
+    seg = seg[inside]
+    ok = ~np.isnan(seg)
+    way_length = np.bincount(seg_way[inside][ok], weights=seg[ok], minlength=way_count)
+
+    count = len(order)
+    bbox = arrays.get('way_bbox')
+    if bbox is None:
+        bbox = build_spatial_arrays(arrays)['way_bbox']
+    component_bbox = np.full((count, 4), np.nan)
+    for col, reduce in ((0, np.fmin), (1, np.fmin), (2, np.fmax), (3, np.fmax)):
+        reduce.at(component_bbox[:, col], component, bbox[:, col])
+    return {
+        'way_component': component,
+        'component_size': size[order].astype(np.int64),
+        'component_length': np.bincount(component, weights=way_length, minlength=count),
+        'component_bbox': component_bbox,
+    }
+
+
+class Components:
+    """连通分量查询，索引中没有分量数组时抛出 KeyError"""
+
+    def __init__(self, graph):
+        missing = [name for name in COMPONENT_ARRAYS if name not in graph.arrays]
+        if missing:
+            raise KeyError(f'索引中没有连通分量数据({", ".join(missing)})，请运行 parse_osm.py --reindex')
+        self.graph = graph
+        self.way_component = graph.arrays['way_component']
+        self.size = graph.arrays['component_size']
+        self.length = graph.arrays['component_length']
+        self.bbox = graph.arrays['component_bbox']
+
+    @property
+    def count(self):
+        return len(self.size)
+
+    def component_of(self, way_id):
+        """way 所属分量编号，way 不存在返回 -1"""
+        wi = self.graph.way_index(way_id)
+        return int(self.way_component[wi]) if wi >= 0 else -1
+
+    def connected(self, way_a, way_b):
+        """两条way是否相连(同一分量)，任一不存在时为 False"""
+        a = self.component_of(way_a)
+        return a >= 0 and a == self.component_of(way_b)
+
+    def summary(self, component):
+        """分量统计 {'component', 'ways', 'length_km', 'bbox'}"""
+        bbox = self.bbox[component]
+        return {
+            'component': int(component),
+            'ways': int(self.size[component]),
+            'length_km': round(float(self.length[component]) / 1000, 3),
+            'bbox': None if np.isnan(bbox[0]) else [round(float(x), 6) for x in bbox],
+        }
+
+    def largest(self, limit=20, min_ways=1):
+        """按way数从大到小的分量统计"""
+        stop = int(np.searchsorted(-self.size, -min_ways, side='right'))
+        return [self.summary(c) for c in range(min(limit, stop))]
+
+
+def main():
+    from rail_store import RailGraph
+
+    parser = argparse.ArgumentParser(description='铁路网络连通分量统计')
+    parser.add_argument('--graph', default=os.path.join('data', 'graph'), help='索引目录')
+    parser.add_argument('--top', type=int, default=20, help='列出最大的若干个网络')
+    parser.add_argument('--way', type=int, help='查看该way所属的网络')
+    parser.add_argument('--check', type=int, nargs=2, metavar=('WAY_A', 'WAY_B'), help='检查两条way是否相连')
+    args = parser.parse_args()
+    components = Components(RailGraph.load(args.graph))
+
+    def show(s):
+        bbox = s['bbox'] or []
+        print(f"网络 #{s['component']}: {s['ways']} 条轨道，{s['length_km']:.1f} km，范围 {bbox}")
+
+    if args.check:
+        a, b = (components.component_of(w) for w in args.check)
+        for way_id, c in zip(args.check, (a, b)):
+            print(f'way {way_id}: ' + (f'网络 #{c}' if c >= 0 else '不存在'))
+        print('相连' if a >= 0 and a == b else '不相连')
+    elif args.way is not None:
+        c = components.component_of(args.way)
+        if c < 0:
+            print(f'way {args.way} 不存在')
+        else:
+            show(components.summary(c))
+    else:
+        print(f'共 {components.count} 个互不相连的网络')
+        for s in components.largest(args.top):
+            show(s)
+
+
+if __name__ == '__main__':
+    main()
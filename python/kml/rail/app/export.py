@@ -0,0 +1,173 @@
+"""
+导出探索链路的几何数据(KML/GeoJSON/GPX)，可导入世界迷雾等工具
+
+输出是逐段生成的文本块：坐标按way从索引读取、写出后即丢弃，几千条way的链路也不会在内存中拼出整个文件。
+merge=True 时首尾相接的连续way合并成一条线(必要时反转方向)，否则每条way一条线。
+
+命令行：
+    python3 export.py --ways 123,456 -f kml -o path.kml
+    python3 export.py --exploration <探索id> --path-store sqlite:data/paths.db -f gpx --merge
+"""
+import argparse
+import json
+import os
+import sys
+from xml.sax.saxutils import escape, quoteattr
+
+FORMATS = {
+    'kml': ('application/vnd.google-earth.kml+xml', 'kml'),
+    'geojson': ('application/geo+json', 'geojson'),
+    'gpx': ('application/gpx+xml', 'gpx'),
+}
+
+
+def plan_lines(graph, way_ids, merge=False):
+    """
+    把way序列分成若干条线，只用到每条way首尾node，不读坐标
+    :return: [[(way_id, reverse), ...], ...]，不存在的way被跳过
+    """
+    lines = []
+    line = None
+    head = tail = None  # 当前线首、末端的node下标
+    for wid in way_ids:
+        wid = int(wid)
+        wi = graph.way_index(wid)
+        if wi < 0:
+            continue
+        start, end = graph.way_node_offsets[wi], graph.way_node_offsets[wi + 1]
+        if start == end:
+            continue
+        first, last = int(graph.way_node_idx[start]), int(graph.way_node_idx[end - 1])
+        if merge and line is not None:
+            if len(line) == 1 and tail not in (first, last) and head in (first, last):
+                # 线上只有一条way时可以把它反转过来接上
+                line[0] = (line[0][0], True)
+                tail = head
+            if tail == first:
+                line.append((wid, False))
+                tail = last
+                continue
+            if tail == last:
+                line.append((wid, True))
+                tail = first
+                continue
+        line = [(wid, False)]
+        lines.append(line)
+        head, tail = first, last
+    return lines
+
+
+def iter_line_coords(graph, line, tolerance=0):
+    """逐条way给出一条线的坐标 [(lat, lon), ...]，相接处的重复点只保留一个"""
+    prev = None
+    for wid, reverse in line:
+        coords = graph.way_coords(wid, tolerance)
+        if reverse:
+            coords.reverse()
+        if prev is not None and coords and coords[0] == prev:
+            coords = coords[1:]
+        if coords:
+            prev = coords[-1]
+            yield coords
+
+
+def _line_name(graph, line):
+    return graph.way_tags(line[0][0], ('name',)).get('name') or f'way {line[0][0]}'
+
+
+def _kml(graph, lines, tolerance, name):
+    yield ('<?xml version="1.0" encoding="UTF-8"?>\n'
+           '<kml xmlns="http://www.opengis.net/kml/2.2"><Document>'
+           f'<name>{escape(name)}</name>\n')
+    for line in lines:
+        ways = ';'.join(f'way({wid})' for wid, _ in line)
+        yield (f'<Placemark><name>{escape(_line_name(graph, line))}</name>'
+               f'<ExtendedData><Data name="ways"><value>{ways}</value></Data></ExtendedData>'
+               '<LineString><coordinates>')
+        sep = ''
+        for coords in iter_line_coords(graph, line, tolerance):
+            yield sep + ' '.join(f'{lon},{lat}' for lat, lon in coords)
+            sep = ' '
+        yield '</coordinates></LineString></Placemark>\n'
+    yield '</Document></kml>\n'
+
+
+def _geojson(graph, lines, tolerance, name):
+    yield '{"type":"FeatureCollection","name":' + json.dumps(name, ensure_ascii=False) + ',"features":[\n'
+    for i, line in enumerate(lines):
+        properties = {'name': _line_name(graph, line), 'ways': [wid for wid, _ in line]}
+        yield ((',\n' if i else '') + '{"type":"Feature","properties":'
+               + json.dumps(properties, ensure_ascii=False) + ',"geometry":{"type":"LineString","coordinates":[')
+        sep = ''
+        for coords in iter_line_coords(graph, line, tolerance):
+            yield sep + ','.join(f'[{lon},{lat}]' for lat, lon in coords)
+            sep = ','
+        yield ']}}'
+    yield '\n]}\n'
+
+
+def _gpx(graph, lines, tolerance, name):
+    yield ('<?xml version="1.0" encoding="UTF-8"?>\n'
+           '<gpx version="1.1" creator="rail" xmlns="http://www.topografix.com/GPX/1/1">'
+           f'<metadata><name>{escape(name)}</name></metadata>\n')
+    for line in lines:
+        ways = ';'.join(f'way({wid})' for wid, _ in line)
+        yield f'<trk><name>{escape(_line_name(graph, line))}</name><desc>{ways}</desc><trkseg>'
+        for coords in iter_line_coords(graph, line, tolerance):
+            yield ''.join(f'<trkpt lat={quoteattr(str(lat))} lon={quoteattr(str(lon))}/>' for lat, lon in coords)
+        yield '</trkseg></trk>\n'
+    yield '</gpx>\n'
+
+
+_WRITERS = {'kml': _kml, 'geojson': _geojson, 'gpx': _gpx}
+
+
+def export_path(graph, way_ids, fmt='kml', merge=False, tolerance=0, name='rail'):
+    """
+    生成导出文件的文本块
+    :param way_ids: 链路上依次经过的way id
+    :param fmt: kml / geojson / gpx
+    :param merge: 是否把首尾相接的连续way合并成一条线
+    :param tolerance: 折线简化容差(米)，0为原始精度
+    """
+    if fmt not in _WRITERS:
+        raise ValueError(f'不支持的导出格式: {fmt}')
+    return _WRITERS[fmt](graph, plan_lines(graph, way_ids, merge), tolerance, name)
+
+
+def main():
+    from path_store import create_path_store
+    from rail_store import RailGraph
+
+    parser = argparse.ArgumentParser(description='导出铁路链路为 KML/GeoJSON/GPX')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--ways', help='逗号分隔的way id，- 表示从标准输入读取(空白或逗号分隔)')
+    source.add_argument('--exploration', help='探索id(配合 --path-store 读取服务端保存的全局累计链路)')
+    parser.add_argument('--path-store', default=os.environ.get('RAIL_PATH_STORE', 'memory'),
+                        help='链路存储，同 RAIL_PATH_STORE，如 sqlite:data/paths.db')
+    parser.add_argument('-f', '--format', choices=sorted(FORMATS), default='kml')
+    parser.add_argument('-o', '--output', help='输出文件，默认标准输出')
+    parser.add_argument('--merge', action='store_true', help='合并首尾相接的连续way')
+    parser.add_argument('--tolerance', type=float, default=0, help='折线简化容差(米)')
+    parser.add_argument('--graph', default=os.path.join('data', 'graph'), help='索引目录')
+    args = parser.parse_args()
+
+    if args.exploration:
+        way_ids = [x['way_id'] for x in create_path_store(args.path_store).load(args.exploration).items]
+    else:
+        text = sys.stdin.read() if args.ways == '-' else args.ways
+        way_ids = [int(x) for x in text.replace(',', ' ').split()]
+    if not way_ids:
+        parser.error('链路为空')
+    graph = RailGraph.load(args.graph)
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        for chunk in export_path(graph, way_ids, args.format, args.merge, args.tolerance):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,16 @@
+"""
+球面距离计算，routing/geometry/spatial/components 等共用同一个地球半径
+"""
+import math
+
+import numpy as np
+
+EARTH_R = 6371008.8  # 地球平均半径(米)
+DEG_M = EARTH_R * math.pi / 180  # 每度对应的米数(纬度方向)
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """球面距离(米)，支持 numpy 数组"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_R * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
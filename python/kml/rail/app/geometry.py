@@ -0,0 +1,157 @@
+"""
+way 几何数据的缓存
+
+/ways 每次都要输出整条全局累计链路的坐标，原来每条way都重新从索引取坐标、再由 jsonify 序列化。
+这里按 (way, 简化容差) 缓存坐标列表和预先序列化好的 JSON 片段(坐标、元数据、encoded polyline、GeoJSON)，
+响应直接拼接片段，链路变长后每条way的开销基本不变。
+"""
+import json
+import math
+import threading
+from collections import OrderedDict
+
+from geo import EARTH_R
+
+DEFAULT_CACHE_SIZE = 20000
+GEOJSON_PROPERTIES = ('name', 'ref', 'operator')
+
+
+def encode_polyline(coords, precision=5):
+    """Google encoded polyline 算法，coords 为 [(lat, lon), ...]"""
+    factor = 10 ** precision
+    out = []
+    prev_lat = prev_lon = 0
+    for lat, lon in coords:
+        lat, lon = round(lat * factor), round(lon * factor)
+        for d in (lat - prev_lat, lon - prev_lon):
+            d = ~(d << 1) if d < 0 else d << 1
+            while d >= 0x20:
+                out.append(chr((0x20 | (d & 0x1f)) + 63))
+                d >>= 5
+            out.append(chr(d + 63))
+        prev_lat, prev_lon = lat, lon
+    return ''.join(out)
+
+
+def polyline_length(coords):
+    """折线长度(米)，相邻点间按球面距离累加"""
+    total = 0.0
+    for (lat1, lon1), (lat2, lon2) in zip(coords, coords[1:]):
+        p1, p2 = math.radians(lat1), math.radians(lat2)
+        h = math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+        total += 2 * EARTH_R * math.asin(min(1.0, math.sqrt(h)))
+    return total
+
+
+def json_with_fragments(obj, fragments):
+    """
+    把预先序列化好的 JSON 数组片段拼进 obj 的序列化结果
+    :param fragments: {键: [JSON字符串, ...]}，每个键输出为由这些片段组成的数组
+    """
+    body = json.dumps(obj)
+    parts = [f'{json.dumps(key)}:[{",".join(items)}]' for key, items in fragments.items()]
+    if not parts:
+        return body
+    return body[:-1] + (',' if len(body) > 2 else '') + ','.join(parts) + '}'
+
+
+class _Entry:
+    __slots__ = ('coords', 'coords_json', 'meta', 'meta_json', 'polyline', 'length', 'lonlat_json')
+
+    def __init__(self, coords, meta):
+        self.coords = coords
+        self.coords_json = json.dumps(coords)
+        self.meta = meta
+        self.meta_json = json.dumps(meta)
+        self.polyline = None
+        self.length = None
+        self.lonlat_json = None
+
+
+class GeometryCache:
+    """way 坐标与其 JSON 片段的 LRU 缓存，线程安全"""
+
+    def __init__(self, graph, maxsize=DEFAULT_CACHE_SIZE):
+        self.graph = graph
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _entry(self, way_id, tolerance=0):
+        key = (way_id, tolerance)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+        entry = _Entry([list(c) for c in self.graph.way_coords(way_id, tolerance)], self.graph.way_meta(way_id))
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = entry
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return entry
+
+    def coords(self, way_id, tolerance=0):
+        """
+        way 的坐标列表 [[lat, lon], ...]，调用方不要修改
+        :param tolerance: 折线简化容差(米)，见 simplify.py
+        """
+        return self._entry(way_id, tolerance).coords
+
+    def meta(self, way_id):
+        """way 元数据(同 RailGraph.way_meta)，调用方不要修改"""
+        return self._entry(way_id).meta
+
+    def polyline(self, way_id, tolerance=0):
+        entry = self._entry(way_id, tolerance)
+        if entry.polyline is None:
+            entry.polyline = encode_polyline(entry.coords)
+        return entry.polyline
+
+    def length(self, way_id):
+        """way 的长度(米)，按原始坐标计算"""
+        entry = self._entry(way_id)
+        if entry.length is None:
+            entry.length = polyline_length(entry.coords)
+        return entry.length
+
+    def way_json(self, way_id, encoding='coords', tolerance=0, **extra):
+        """
+        单条way的JSON对象 {"id", "coords"|"polyline", "meta", 其他字段}
+        :param encoding: 'coords' 输出坐标数组，'polyline' 输出 encoded polyline 字符串
+        :param tolerance: 折线简化容差(米)
+        """
+        entry = self._entry(way_id, tolerance)
+        if encoding == 'polyline':
+            geometry = '"polyline":' + json.dumps(self.polyline(way_id, tolerance))
+        else:
+            geometry = '"coords":' + entry.coords_json
+        parts = [f'{{"id":{int(way_id)},{geometry},"meta":{entry.meta_json}']
+        for key, value in extra.items():
+            parts.append(f',{json.dumps(key)}:{json.dumps(value)}')
+        parts.append('}')
+        return ''.join(parts)
+
+    def geojson(self, way_id, tolerance=0, **extra):
+        """
+        单条way的 GeoJSON Feature(LineString，坐标为 [lon, lat])
+        :param extra: 附加到 properties 的字段
+        """
+        entry = self._entry(way_id, tolerance)
+        if entry.lonlat_json is None:
+            entry.lonlat_json = json.dumps([[lon, lat] for lat, lon in entry.coords])
+        properties = {'id': int(way_id)}
+        for key in GEOJSON_PROPERTIES:
+            if entry.meta.get(key):
+                properties[key] = entry.meta[key]
+        properties.update(extra)
+        return (f'{{"type":"Feature","id":{int(way_id)},'
+                f'"geometry":{{"type":"LineString","coordinates":{entry.lonlat_json}}},'
+                f'"properties":{json.dumps(properties)}}}')
+
+    def stats(self):
+        return {'size': len(self._entries), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,383 @@
+"""
+请求耗时统计，Prometheus 文本格式输出(app.py 的 /metrics)
+
+每个请求记录总耗时，以及请求处理中用 phase() 标出的各阶段耗时(找下一个分叉、读写链路存储、
+拼接坐标、推荐、JSON编码等)，同一阶段在一个请求中出现多次时累加：
+- rail_requests_total{endpoint,method,status}          请求数
+- rail_request_duration_seconds{endpoint}              请求总耗时直方图
+- rail_request_phase_seconds{endpoint,phase}           各阶段耗时直方图
+- rail_slow_requests_total{endpoint}                   超过慢请求阈值的请求数
+
+流式响应(/connected、/export)只计到生成 Response 为止，不含逐块输出的时间。
+不依赖 prometheus_client。多 worker 部署时指定 multiprocess_dir：每个进程每秒把自己的统计写成一个文件，
+/metrics 由处理抓取请求的进程合并目录中全部文件后输出，Prometheus 无论抓到哪个 worker 都得到全部 worker 的合计。
+已退出进程的文件在合并时并入一个归档文件(EXITED_FILE)后删除，worker 反复重启目录也不会一直变多。
+"""
+import atexit
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # 非 POSIX 系统，_pid_alive 总是返回 True，不会归档，也就不需要加锁
+    fcntl = None
+
+# 直方图分桶上限(秒)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_current = contextvars.ContextVar('rail_request_trace', default=None)
+_flusher_lock = threading.Lock()
+# multiprocess_dir 中已退出进程的统计归档和目录锁
+EXITED_FILE = 'exited.json'
+LOCK_FILE = '.lock'
+
+
+class RequestTrace:
+    """一个请求的各阶段耗时"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = {}
+
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+
+@contextmanager
+def phase(name):
+    """
+    统计代码块的耗时，记入当前请求的阶段 name；不在请求中(命令行、测试直接调用)时什么都不做
+        with phase('json'):
+            body = json.dumps(result)
+    """
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, time.perf_counter() - start)
+
+
+class _Histogram:
+    def __init__(self, size):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+def _merge_hist(table, key, counts, total, count):
+    hist = table.get(key)
+    if hist is None:
+        hist = table[key] = _Histogram(len(counts))
+    hist.counts = [a + b for a, b in zip(hist.counts, counts)]
+    hist.sum += total
+    hist.count += count
+
+
+def _add_snapshot(tables, snapshot, gauges=True):
+    """把一个统计文件的内容累加到 (requests, durations, phases, slow, collected)；gauges=False 时跳过 gauge"""
+    requests, durations, phases, slow, collected = tables
+    for endpoint, method, status, count in snapshot.get('requests', ()):
+        key = (endpoint, method, status)
+        requests[key] = requests.get(key, 0) + count
+    for endpoint, counts, total, count in snapshot.get('durations', ()):
+        _merge_hist(durations, endpoint, counts, total, count)
+    for endpoint, phase_name, counts, total, count in snapshot.get('phases', ()):
+        _merge_hist(phases, (endpoint, phase_name), counts, total, count)
+    for endpoint, count in snapshot.get('slow', ()):
+        slow[endpoint] = slow.get(endpoint, 0) + count
+    for metric, kind, help_text, value in snapshot.get('collected', ()):
+        if kind == 'gauge' and not gauges:
+            continue
+        if metric in collected:
+            collected[metric][3] += value
+        else:
+            collected[metric] = [metric, kind, help_text, value]
+
+
+def _dump_tables(tables):
+    """_add_snapshot 的逆过程，得到可写入统计文件的 dict"""
+    requests, durations, phases, slow, collected = tables
+    return {
+        'requests': [[*key, count] for key, count in requests.items()],
+        'durations': [[endpoint, list(h.counts), h.sum, h.count] for endpoint, h in durations.items()],
+        'phases': [[endpoint, name, list(h.counts), h.sum, h.count] for (endpoint, name), h in phases.items()],
+        'slow': [[endpoint, count] for endpoint, count in slow.items()],
+        'collected': [list(item) for item in collected.values()],
+    }
+
+
+def _write_json(path, data):
+    """先写临时文件再替换，读者不会读到写了一半的文件"""
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(path + '.tmp', path)
+
+
+def _pid_alive(pid):
+    """进程是否仍在运行；非 POSIX 系统上无法安全判断，一律视为在运行"""
+    if os.name != 'posix':
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _labels(**labels):
+    def escape(v):
+        return str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ','.join(f'{k}="{escape(v)}"' for k, v in labels.items())
+
+
+class RequestMetrics:
+    """请求计数与耗时直方图，线程安全"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, slow_ms=None, slow_log=None, multiprocess_dir=None,
+                 flush_interval=1.0):
+        """
+        :param slow_ms: 慢请求阈值(毫秒)，超过时把各阶段耗时写入日志 rail.slow，None 为不记录
+        :param slow_log: 慢请求日志文件，None 时使用 logging 的默认输出(stderr)
+        :param multiprocess_dir: 多进程共享的统计目录，None 时只输出本进程的统计
+        :param flush_interval: 有新请求时把本进程统计写入 multiprocess_dir 的间隔(秒)
+        """
+        self.buckets = tuple(sorted(buckets))
+        self.slow_ms = slow_ms
+        self.multiprocess_dir = multiprocess_dir
+        self.flush_interval = flush_interval
+        self._reset()
+        self._collectors = []
+        self._flusher_pid = None
+        self._snapshot_name = None
+        self.slow_logger = logging.getLogger('rail.slow')
+        if slow_log:
+            handler = logging.FileHandler(slow_log, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self.slow_logger.addHandler(handler)
+            self.slow_logger.setLevel(logging.INFO)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._requests = {}   # (endpoint, method, status) → 次数
+        self._durations = {}  # endpoint → _Histogram
+        self._phases = {}     # (endpoint, phase) → _Histogram
+        self._slow = {}       # endpoint → 次数
+        self._dirty = False
+
+    def add_collector(self, collect):
+        """
+        注册即时指标，导出时调用
+        :param collect: 返回 [(指标名, 类型 gauge/counter, 说明, 值), ...] 的函数
+        """
+        self._collectors.append(collect)
+
+    def start(self):
+        """请求开始，之后 phase() 的耗时记入该请求"""
+        if self.multiprocess_dir and self._flusher_pid != os.getpid():
+            self._start_flusher()
+        trace = RequestTrace()
+        _current.set(trace)
+        return trace
+
+    def _observe(self, table, key, seconds):
+        hist = table.get(key)
+        if hist is None:
+            hist = table[key] = _Histogram(len(self.buckets) + 1)
+        hist.counts[bisect_left(self.buckets, seconds)] += 1
+        hist.sum += seconds
+        hist.count += 1
+
+    def finish(self, endpoint, method, status, path=None):
+        """
+        请求结束，记录总耗时和各阶段耗时
+        :param endpoint: 路由规则(如 /ways/<int:way_id>)，同一接口的请求汇总到一起
+        :return: 总耗时(秒)，没有调用过 start() 时为 None
+        """
+        trace = _current.get()
+        if trace is None:
+            return None
+        _current.set(None)
+        seconds = time.perf_counter() - trace.start
+        slow = self.slow_ms is not None and seconds * 1000 >= self.slow_ms
+        with self._lock:
+            key = (endpoint, method, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            self._observe(self._durations, endpoint, seconds)
+            for name, t in trace.phases.items():
+                self._observe(self._phases, (endpoint, name), t)
+            if slow:
+                self._slow[endpoint] = self._slow.get(endpoint, 0) + 1
+            self._dirty = True
+        if slow:
+            self.slow_logger.warning(json.dumps({
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'method': method,
+                'path': path,
+                'endpoint': endpoint,
+                'status': status,
+                'ms': round(seconds * 1000, 2),
+                'phases_ms': {name: round(t * 1000, 2) for name, t in trace.phases.items()},
+            }, ensure_ascii=False))
+        return seconds
+
+    def _histogram_lines(self, name, labels, hist):
+        lines = []
+        cumulative = 0
+        for le, count in zip(self.buckets + ('+Inf',), hist.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{_labels(**labels, le=le)}}} {cumulative}')
+        lines.append(f'{name}_sum{{{_labels(**labels)}}} {hist.sum!r}')
+        lines.append(f'{name}_count{{{_labels(**labels)}}} {hist.count}')
+        return lines
+
+    def _start_flusher(self):
+        """
+        进程处理第一个请求时启动后台线程，定期把本进程的统计写入 multiprocess_dir。
+        fork 出的 worker 从空的统计开始，父进程的统计由父进程自己的文件提供
+        """
+        with _flusher_lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._reset()
+            # 文件名带上启动时间，pid 被新进程复用时不会覆盖已退出进程的统计
+            self._snapshot_name = f'{os.getpid()}-{time.time_ns()}.json'
+            self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_loop, name='rail-metrics-flush', daemon=True).start()
+        atexit.register(self.flush)
+
+    def _flush_loop(self):
+        pid = os.getpid()
+        while self._flusher_pid == pid:
+            time.sleep(self.flush_interval)
+            if self._dirty:
+                try:
+                    self.flush()
+                except OSError as e:
+                    logging.getLogger('rail.metrics').warning('写入统计文件失败: %s', e)
+
+    def _collect(self):
+        return [list(item) for collect in self._collectors for item in collect()]
+
+    def flush(self):
+        """把本进程的统计写入 multiprocess_dir(先写临时文件再替换)"""
+        if not self.multiprocess_dir or self._flusher_pid != os.getpid():
+            return
+        with self._lock:
+            snapshot = _dump_tables((self._requests, self._durations, self._phases, self._slow, {}))
+            self._dirty = False
+        snapshot.update(pid=self._flusher_pid, buckets=list(self.buckets), collected=self._collect())
+        os.makedirs(self.multiprocess_dir, exist_ok=True)
+        _write_json(os.path.join(self.multiprocess_dir, self._snapshot_name), snapshot)
+
+    def _read_snapshot(self, name):
+        """读取 multiprocess_dir 中的一个统计文件，不存在、损坏或分桶不一致时返回 None"""
+        try:
+            with open(os.path.join(self.multiprocess_dir, name), encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if tuple(snapshot.get('buckets', ())) != self.buckets:
+            return None
+        return snapshot
+
+    @contextmanager
+    def _dir_lock(self):
+        """multiprocess_dir 的排他锁，合并与归档已退出进程的文件时持有，避免同一文件被两个进程重复归档"""
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(self.multiprocess_dir, exist_ok=True)
+        with open(os.path.join(self.multiprocess_dir, LOCK_FILE), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _merged(self):
+        """
+        合并 multiprocess_dir 中各进程的统计。已退出进程的文件并入 EXITED_FILE 后删除，
+        目录中只保留运行中进程各自的文件和一个归档文件；计数和直方图只增不减，gauge 只取运行中的进程
+        :return: (requests, durations, phases, slow, collected)
+        """
+        tables = ({}, {}, {}, {}, {})
+        with self._dir_lock():
+            exited = self._read_snapshot(EXITED_FILE) or {}
+            archived = set(exited.get('merged', ()))
+            exited_tables = ({}, {}, {}, {}, {})
+            _add_snapshot(exited_tables, exited)
+            try:
+                names = sorted(os.listdir(self.multiprocess_dir))
+            except OSError:
+                names = []
+            dead = []
+            for name in names:
+                if not name.endswith('.json') or name == EXITED_FILE:
+                    continue
+                if name in archived:
+                    # 上次归档后没来得及删除
+                    dead.append(name)
+                    continue
+                snapshot = self._read_snapshot(name)
+                if snapshot is None:
+                    continue
+                if _pid_alive(snapshot['pid']):
+                    _add_snapshot(tables, snapshot)
+                else:
+                    _add_snapshot(exited_tables, snapshot, gauges=False)
+                    dead.append(name)
+            if dead:
+                # 先写归档(记下已并入的文件名)再删除，中途退出也不会重复计数
+                exited = _dump_tables(exited_tables)
+                exited.update(buckets=list(self.buckets), merged=dead)
+                _write_json(os.path.join(self.multiprocess_dir, EXITED_FILE), exited)
+                for name in dead:
+                    try:
+                        os.remove(os.path.join(self.multiprocess_dir, name))
+                    except FileNotFoundError:
+                        pass
+            _add_snapshot(tables, _dump_tables(exited_tables))
+        requests, durations, phases, slow, collected = tables
+        return requests, durations, phases, slow, list(collected.values())
+
+    def _render_tables(self, requests, durations, phases, slow):
+        lines = ['# HELP rail_requests_total 请求数', '# TYPE rail_requests_total counter']
+        for (endpoint, method, status), count in sorted(requests.items()):
+            lines.append(f'rail_requests_total{{{_labels(endpoint=endpoint, method=method, status=status)}}} {count}')
+        lines += ['# HELP rail_request_duration_seconds 请求总耗时',
+                  '# TYPE rail_request_duration_seconds histogram']
+        for endpoint, hist in sorted(durations.items()):
+            lines += self._histogram_lines('rail_request_duration_seconds', {'endpoint': endpoint}, hist)
+        lines += ['# HELP rail_request_phase_seconds 请求各阶段耗时', '# TYPE rail_request_phase_seconds histogram']
+        for (endpoint, name), hist in sorted(phases.items()):
+            lines += self._histogram_lines('rail_request_phase_seconds', {'endpoint': endpoint, 'phase': name}, hist)
+        lines += ['# HELP rail_slow_requests_total 超过慢请求阈值的请求数', '# TYPE rail_slow_requests_total counter']
+        for endpoint, count in sorted(slow.items()):
+            lines.append(f'rail_slow_requests_total{{{_labels(endpoint=endpoint)}}} {count}')
+        return lines
+
+    def render(self):
+        """Prometheus 文本格式(0.0.4)；指定了 multiprocess_dir 时为所有进程的合计"""
+        if self.multiprocess_dir:
+            self.flush()
+            requests, durations, phases, slow, collected = self._merged()
+            lines = self._render_tables(requests, durations, phases, slow)
+        else:
+            with self._lock:
+                lines = self._render_tables(self._requests, self._durations, self._phases, self._slow)
+            collected = self._collect()
+        for name, kind, help_text, value in collected:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}', f'{name} {value}']
+        return '\n'.join(lines) + '\n'
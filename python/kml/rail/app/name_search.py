@@ -0,0 +1,121 @@
+"""
+铁路way名称的 n-gram 倒排索引
+
+中文名称没有空格分词，按字符切成一元/二元组建倒排表，保存为可 mmap 的数组:
+- name_grams:        排序后的 n-gram(定长 unicode，最长2个字符)
+- name_gram_offsets: n-gram → way 下标的 CSR 偏移
+- name_gram_ways:    way 下标
+
+查询时取各二元组倒排表的交集得到候选，再逐条核对子串并打分排序。
+"""
+import numpy as np
+
+SEARCH_FIELDS = ('name', 'ref', 'operator')
+# 字段权重和匹配方式权重，分数 = 字段权重 * 匹配权重
+FIELD_WEIGHT = {'name': 3, 'ref': 2, 'operator': 1}
+MATCH_EXACT, MATCH_PREFIX, MATCH_CONTAINS = 3, 2, 1
+NAME_ARRAYS = ['name_grams', 'name_gram_offsets', 'name_gram_ways']
+
+
+def normalize(text):
+    """统一大小写并压缩空白"""
+    return ' '.join(str(text).casefold().split())
+
+
+def ngrams(text):
+    """一元组和二元组"""
+    grams = set(text)
+    grams.update(text[i:i + 2] for i in range(len(text) - 1))
+    return grams
+
+
+def build_name_arrays(way_tags):
+    """由与 way 对齐的标签 dict 序列(至少含 SEARCH_FIELDS)构建倒排索引数组"""
+    grams = []
+    ways = []
+    for wi, meta in enumerate(way_tags):
+        way_grams = set()
+        for field in SEARCH_FIELDS:
+            if meta.get(field):
+                way_grams |= ngrams(normalize(meta[field]))
+        grams.extend(way_grams)
+        ways.extend([wi] * len(way_grams))
+    grams = np.array(grams, dtype='<U2')
+    ways = np.array(ways, dtype=np.int32)
+    order = np.lexsort((ways, grams))
+    grams = grams[order]
+    unique, starts = np.unique(grams, return_index=True)
+    return {
+        'name_grams': unique,
+        'name_gram_offsets': np.append(starts, len(grams)).astype(np.int64),
+        'name_gram_ways': ways[order],
+    }
+
+
+class NameIndex:
+    """基于 RailGraph 中倒排索引数组的名称搜索"""
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.grams = graph.arrays['name_grams']
+        self.offsets = graph.arrays['name_gram_offsets']
+        self.ways = graph.arrays['name_gram_ways']
+
+    def _posting(self, gram):
+        i = int(np.searchsorted(self.grams, gram))
+        if i < len(self.grams) and self.grams[i] == gram:
+            return self.ways[self.offsets[i]:self.offsets[i + 1]]
+        return None
+
+    def _candidates(self, query):
+        grams = {query} if len(query) == 1 else {query[i:i + 2] for i in range(len(query) - 1)}
+        postings = []
+        for gram in grams:
+            posting = self._posting(gram)
+            if posting is None:
+                return np.empty(0, dtype=np.int32)
+            postings.append(posting)
+        postings.sort(key=len)
+        result = np.asarray(postings[0])
+        for posting in postings[1:]:
+            result = np.intersect1d(result, posting, assume_unique=True)
+            if not len(result):
+                break
+        return result
+
+    @staticmethod
+    def _score(meta, query):
+        best = 0
+        for field in SEARCH_FIELDS:
+            if not meta.get(field):
+                continue
+            text = normalize(meta[field])
+            if text == query:
+                match = MATCH_EXACT
+            elif text.startswith(query):
+                match = MATCH_PREFIX
+            elif query in text:
+                match = MATCH_CONTAINS
+            else:
+                continue
+            best = max(best, FIELD_WEIGHT[field] * match)
+        return best
+
+    def search(self, query, offset=0, limit=20):
+        """
+        按 name/ref/operator 搜索，完全匹配 > 前缀匹配 > 包含，name > ref > operator，同分时名称短的优先
+        :return: (匹配总数, [(way_id, 分数), ...])
+        """
+        query = normalize(query)
+        if not query:
+            return 0, []
+        tags = self.graph.tags
+        scored = []
+        for wi in self._candidates(query).tolist():
+            meta = tags.tags(wi, SEARCH_FIELDS)
+            score = self._score(meta, query)
+            if score:
+                scored.append((-score, len(meta.get('name') or ''), wi))
+        scored.sort()
+        page = scored[offset:offset + limit]
+        return len(scored), [(int(self.graph.way_ids[wi]), -s) for s, _, wi in page]
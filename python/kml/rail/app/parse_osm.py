@@ -1,96 +1,454 @@
+import argparse
+import hashlib
+import json
 import osmium
-import pickle
 from tqdm import tqdm
 import os
+import struct
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import components
+import name_search
+import rail_store
+import routing
+import simplify
+import spatial
+from tag_store import TagStore, TagTable
 
 PBF_PATH = '/Users/sowevo/Downloads/china-latest.osm.pbf'
 DATA_DIR = 'data'
-NODE_TO_WAYS_PATH = os.path.join(DATA_DIR, 'node_to_ways.pkl')
-WAY_TO_NODES_PATH = os.path.join(DATA_DIR, 'way_to_nodes.pkl')
-NODE_COORDS_PATH = os.path.join(DATA_DIR, 'node_coords.pkl')
-WAY_TO_META_PATH = os.path.join(DATA_DIR, 'way_to_meta.pkl')
-
-class RailWayHandler(osmium.SimpleHandler):
-    def __init__(self, pbar=None):
-        super().__init__()
-        self.node_to_ways = {}
-        self.way_to_nodes = {}
-        self.rail_node_ids = set()
-        self.way_to_meta = {}
-        self.way_count = 0
-        self.pbar = pbar
-    def way(self, w):
-        if 'railway' in w.tags and w.tags['railway'] in ['rail', 'subway', 'light_rail']:
-            node_ids = [n.ref for n in w.nodes]
-            self.way_to_nodes[w.id] = node_ids
-            for n in node_ids:
-                self.node_to_ways.setdefault(n, set()).add(w.id)
-                self.rail_node_ids.add(n)
-            meta = {
-                'id': w.id,
-                'name': w.tags.get('name'),
-                'ref': w.tags.get('ref'),
-                'operator': w.tags.get('operator'),
-                'tags': dict(w.tags),
-                'nodes': node_ids
-            }
-            self.way_to_meta[w.id] = meta
-            self.way_count += 1
-        if self.pbar:
-            self.pbar.update(1)
-
-class RailNodeHandler(osmium.SimpleHandler):
-    def __init__(self, rail_node_ids, pbar=None):
-        super().__init__()
-        self.rail_node_ids = rail_node_ids
-        self.node_coords = {}
-        self.node_count = 0
-        self.pbar = pbar
-    def node(self, n):
-        if n.id in self.rail_node_ids:
-            self.node_coords[n.id] = (n.location.lat, n.location.lon)
-            self.node_count += 1
-            if self.pbar:
-                self.pbar.update(1)
-
-def count_entities(pbf_path):
-    class Counter(osmium.SimpleHandler):
-        def __init__(self):
-            super().__init__()
-            self.way_count = 0
-            self.node_count = 0
-        def way(self, w):
-            self.way_count += 1
-        def node(self, n):
-            self.node_count += 1
-    counter = Counter()
-    counter.apply_file(pbf_path, locations=False)
-    return counter.way_count, counter.node_count
-
-def build_and_save_index(pbf_path):
+GRAPH_DIR = os.path.join(DATA_DIR, 'graph')
+RAIL_TYPES = ('rail', 'subway', 'light_rail')
+# 每次交给osmium解析的PBF数据量，进度条按这个粒度更新
+CHUNK_BYTES = 32 * 1024 * 1024
+# 并行模式下切得更细，让各worker负载均衡
+PARALLEL_CHUNK_BYTES = 8 * 1024 * 1024
+
+
+def _read_varint(buf, pos):
+    result = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7f) << shift
+        if not b & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _parse_blob_header(buf):
+    """解析 BlobHeader(protobuf)，返回 (type, datasize)"""
+    pos = 0
+    block_type = None
+    data_size = 0
+    while pos < len(buf):
+        key, pos = _read_varint(buf, pos)
+        field, wire = key >> 3, key & 7
+        if wire == 0:
+            value, pos = _read_varint(buf, pos)
+            if field == 3:
+                data_size = value
+        elif wire == 2:
+            length, pos = _read_varint(buf, pos)
+            if field == 1:
+                block_type = buf[pos:pos + length].decode()
+            pos += length
+        else:
+            raise ValueError(f'无法解析的BlobHeader字段: wire={wire}')
+    return block_type, data_size
+
+
+def iter_pbf_blocks(pbf_path):
+    """遍历PBF文件块，返回 (偏移, 长度, 类型)，只读块头，不解压数据"""
+    with open(pbf_path, 'rb') as f:
+        offset = 0
+        while True:
+            head = f.read(4)
+            if len(head) < 4:
+                break
+            header_len = struct.unpack('>I', head)[0]
+            block_type, data_size = _parse_blob_header(f.read(header_len))
+            f.seek(data_size, os.SEEK_CUR)
+            size = 4 + header_len + data_size
+            yield offset, size, block_type
+            offset += size
+
+
+def split_pbf(pbf_path, chunk_bytes=CHUNK_BYTES):
+    """
+    把PBF切成若干段连续的数据块
+    :return: (文件头块范围, [(起始, 结束), ...])
+    """
+    header = None
+    ranges = []
+    start = end = None
+    for offset, size, block_type in iter_pbf_blocks(pbf_path):
+        if block_type == 'OSMHeader':
+            header = (offset, offset + size)
+            continue
+        if start is None:
+            start = offset
+        end = offset + size
+        if end - start >= chunk_bytes:
+            ranges.append((start, end))
+            start = None
+    if start is not None:
+        ranges.append((start, end))
+    if header is None:
+        raise ValueError(f'{pbf_path} 不是有效的PBF文件')
+    return header, ranges
+
+
+def read_pbf_chunk(f, header, rng):
+    """读取一段数据块并在前面拼上文件头块，得到一个可独立解析的PBF缓冲区"""
+    f.seek(header[0])
+    buf = f.read(header[1] - header[0])
+    f.seek(rng[0])
+    return buf + f.read(rng[1] - rng[0])
+
+
+def rail_way_filter():
+    """railway in (rail, subway, light_rail) 的过滤在C++侧完成，其余way不会进入Python"""
+    return osmium.filter.TagFilter(*(('railway', t) for t in RAIL_TYPES))
+
+
+def is_rail_way(w):
+    return w.tags.get('railway') in RAIL_TYPES
+
+
+class RailWays:
+    """第一遍提取结果：way id、按顺序拼接的node引用、标签(TagTable)"""
+
+    def __init__(self):
+        self.way_ids = array('q')
+        self.lengths = array('q')
+        self.refs = array('q')
+        self.tags = TagTable()
+
+    def add(self, w):
+        self.append(w.id, [n.ref for n in w.nodes], ((t.k, t.v) for t in w.tags))
+
+    def append(self, way_id, node_ids, tags):
+        self.way_ids.append(way_id)
+        self.lengths.append(len(node_ids))
+        self.refs.extend(node_ids)
+        self.tags.append(tags)
+
+    def extend(self, other):
+        self.way_ids.extend(other.way_ids)
+        self.lengths.extend(other.lengths)
+        self.refs.extend(other.refs)
+        self.tags.extend(other.tags)
+
+    def offsets(self):
+        offsets = np.zeros(len(self.lengths) + 1, dtype=np.int64)
+        np.cumsum(np.frombuffer(self.lengths, dtype=np.int64), out=offsets[1:])
+        return offsets
+
+    def node_ids(self):
+        """所有被引用的node id(排序去重)，即稀疏坐标表的键"""
+        return np.unique(np.frombuffer(self.refs, dtype=np.int64))
+
+
+class RailNodeCoords:
+    """第二遍提取结果：只包含铁路node的稀疏坐标表"""
+
+    def __init__(self):
+        self.ids = array('q')
+        self.lat = array('d')
+        self.lon = array('d')
+
+    def add(self, n):
+        self.ids.append(n.id)
+        self.lat.append(n.location.lat)
+        self.lon.append(n.location.lon)
+
+    def extend(self, other):
+        self.ids.extend(other.ids)
+        self.lat.extend(other.lat)
+        self.lon.extend(other.lon)
+
+
+# 进程池中每个worker进程的状态，由 _init_worker 设置
+_worker_node_filter = None
+_worker_thread_pool = None
+
+
+def _init_worker(node_ids=None, single_thread=False):
+    global _worker_node_filter, _worker_thread_pool
+    if node_ids is not None:
+        _worker_node_filter = osmium.filter.IdFilter(node_ids.tolist()).enable_for(osmium.osm.NODE)
+    if single_thread:
+        # 并行模式下由进程池负责并行，每个worker内osmium只用一个解压线程
+        _worker_thread_pool = osmium.io.ThreadPool(1)
+
+
+def _extract_range(task):
+    """解析一段数据块，返回该段的 RailWays 或 RailNodeCoords"""
+    pbf_path, header, rng, kind = task
+    with open(pbf_path, 'rb') as f:
+        buf = read_pbf_chunk(f, header, rng)
+    if kind == 'way':
+        result, entities, pbf_filter = RailWays(), osmium.osm.WAY, rail_way_filter()
+    else:
+        result, entities, pbf_filter = RailNodeCoords(), osmium.osm.NODE, _worker_node_filter
+    processor = osmium.FileProcessor(osmium.io.FileBuffer(buf, 'pbf'), entities,
+                                     thread_pool=_worker_thread_pool)
+    for obj in processor.with_filter(pbf_filter):
+        result.add(obj)
+    return rng, result
+
+
+def _scan(pbf_path, kind, desc, workers=1, node_ids=None):
+    """
+    按数据块扫描PBF，进度按文件字节数显示，无需预先计数
+    :param workers: 大于1时用进程池并行解析各数据块，结果按数据块在文件中的顺序合并
+    """
+    chunk_bytes = CHUNK_BYTES if workers <= 1 else PARALLEL_CHUNK_BYTES
+    header, ranges = split_pbf(pbf_path, chunk_bytes)
+    tasks = [(pbf_path, header, rng, kind) for rng in ranges]
+    result = RailWays() if kind == 'way' else RailNodeCoords()
+    with tqdm(total=os.path.getsize(pbf_path), desc=desc, unit='B', unit_scale=True) as pbar:
+        pbar.update(header[1] - header[0])
+        if workers <= 1:
+            _init_worker(node_ids)
+            parts = map(_extract_range, tasks)
+            pool = None
+        else:
+            pool = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(node_ids, True))
+            parts = pool.map(_extract_range, tasks)
+        try:
+            for rng, part in parts:
+                result.extend(part)
+                pbar.update(rng[1] - rng[0])
+        finally:
+            if pool is not None:
+                pool.shutdown()
+    return result
+
+
+def extract_rail_ways(pbf_path, workers=1):
+    return _scan(pbf_path, 'way', 'Way处理', workers)
+
+
+def extract_rail_nodes(pbf_path, node_ids, workers=1):
+    return _scan(pbf_path, 'node', 'Node处理', workers, node_ids)
+
+
+def build_and_save_index(pbf_path, workers=1, graph_dir=GRAPH_DIR):
+    """
+    两遍扫描生成索引:
+    第一遍只读way，由C++侧按railway标签过滤；
+    第二遍只读node，由C++侧按铁路node id过滤，只为铁路node保存坐标
+    :param workers: 并行解析的进程数，1为单进程
+    :param graph_dir: 索引目录
+    """
     os.makedirs(DATA_DIR, exist_ok=True)
+    # 扫描前记录PBF指纹，扫描期间文件被替换时下次会重新构建
+    source = pbf_fingerprint(pbf_path)
     print('第一遍：收集way和相关node id...')
-    total_way_count, total_node_count = count_entities(pbf_path)
-    way_pbar = tqdm(total=total_way_count, desc='Way处理', unit='way')
-    way_handler = RailWayHandler(pbar=way_pbar)
-    way_handler.apply_file(pbf_path, locations=False)
-    way_pbar.close()
-    print(f'共找到铁路/地铁/轻轨way: {way_handler.way_count} 条，相关node: {len(way_handler.rail_node_ids)} 个')
+    ways = extract_rail_ways(pbf_path, workers)
+    node_ids = ways.node_ids()
+    print(f'共找到铁路/地铁/轻轨way: {len(ways.way_ids)} 条，相关node: {len(node_ids)} 个')
     print('第二遍：收集相关node的坐标...')
-    node_pbar = tqdm(total=len(way_handler.rail_node_ids), desc='Node处理', unit='node')
-    node_handler = RailNodeHandler(way_handler.rail_node_ids, pbar=node_pbar)
-    node_handler.apply_file(pbf_path, locations=True)
-    node_pbar.close()
-    print(f'共找到相关node坐标: {node_handler.node_count} 个')
-    with open(NODE_TO_WAYS_PATH, 'wb') as f:
-        pickle.dump(way_handler.node_to_ways, f)
-    with open(WAY_TO_NODES_PATH, 'wb') as f:
-        pickle.dump(way_handler.way_to_nodes, f)
-    with open(NODE_COORDS_PATH, 'wb') as f:
-        pickle.dump(node_handler.node_coords, f)
-    with open(WAY_TO_META_PATH, 'wb') as f:
-        pickle.dump(way_handler.way_to_meta, f)
-    print('索引已保存')
+    coords = extract_rail_nodes(pbf_path, node_ids, workers)
+    print(f'共找到相关node坐标: {len(coords.ids)} 个')
+    save_index(ways, coords, graph_dir, extra={'source': source})
+
+
+def file_sha256(path, chunk_bytes=CHUNK_BYTES):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_bytes), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def pbf_fingerprint(pbf_path):
+    """PBF 文件指纹，建索引时写入 manifest 的 source 字段"""
+    st = os.stat(pbf_path)
+    return {'path': os.path.abspath(pbf_path), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns,
+            'sha256': file_sha256(pbf_path)}
+
+
+def index_is_current(pbf_path, graph_dir=GRAPH_DIR):
+    """
+    索引是否由当前的PBF生成：大小和修改时间与 manifest 记录一致即认为未变，
+    只有修改时间变了(如重新下载了同样的文件)才计算内容哈希比较，内容相同时把新的修改时间
+    写回 manifest，之后不再重复计算哈希。
+    索引中没有来源记录时(旧版索引、由 pickle 转换)认为可用，不强制重建
+    """
+    try:
+        with open(os.path.join(graph_dir, rail_store.MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if manifest.get('version') != rail_store.STORE_VERSION:
+        return False
+    source = manifest.get('source')
+    if not source:
+        return True
+    st = os.stat(pbf_path)
+    if st.st_size != source.get('size'):
+        return False
+    if st.st_mtime_ns == source.get('mtime_ns'):
+        return True
+    if file_sha256(pbf_path) != source.get('sha256'):
+        return False
+    try:
+        rail_store.update_manifest(graph_dir, manifest.get('generation'), source=dict(source, mtime_ns=st.st_mtime_ns))
+    except OSError as e:
+        print(f'无法更新 manifest 中的PBF修改时间: {e}')
+    return True
+
+
+def ensure_index(pbf_path, graph_dir=GRAPH_DIR, workers=1, force=False):
+    """
+    需要时才由PBF重建索引：索引不存在、版本不符或PBF有变化
+    :param force: 无论是否变化都重建
+    :return: 是否重建了索引
+    """
+    if not os.path.exists(pbf_path):
+        if not force and os.path.exists(os.path.join(graph_dir, rail_store.MANIFEST_NAME)):
+            print(f'找不到 {pbf_path}，使用已有索引')
+            return False
+        raise FileNotFoundError(pbf_path)
+    if not force and index_is_current(pbf_path, graph_dir):
+        return False
+    print(f'由 {pbf_path} 重建索引...')
+    build_and_save_index(pbf_path, workers, graph_dir)
+    return True
+
+
+def read_changes(osc_path, node_changes, way_changes):
+    """
+    读取一个 .osc/.osc.gz 变更文件，后出现的版本覆盖先出现的
+    :param node_changes: node id → (lat, lon)，删除为 None
+    :param way_changes: way id → (node ids, tags)，删除或不再是铁路为 None
+    """
+    for obj in osmium.FileProcessor(osc_path, osmium.osm.NODE | osmium.osm.WAY):
+        if obj.is_node():
+            node_changes[obj.id] = None if obj.deleted else (obj.location.lat, obj.location.lon)
+        elif obj.is_way():
+            if obj.deleted or not is_rail_way(obj):
+                way_changes[obj.id] = None
+            else:
+                way_changes[obj.id] = ([n.ref for n in obj.nodes], {t.k: t.v for t in obj.tags})
+
+
+def apply_changes(osc_paths, graph_dir=GRAPH_DIR):
+    """
+    用OSM变更文件增量更新已有索引，无需重新解析整个PBF
+    新增/修改的铁路way替换旧版本，删除的或不再是铁路的way被移除；
+    node坐标按变更更新，不再被任何way引用的node会被丢弃
+    :param osc_paths: 按时间顺序排列的变更文件列表，为空时只按当前版本重新计算派生结构
+    """
+    node_changes = {}
+    way_changes = {}
+    for path in osc_paths:
+        read_changes(path, node_changes, way_changes)
+    graph = rail_store.RailGraph.load(graph_dir, strict=False)
+
+    # 保留未变更的way
+    changed_way_ids = np.fromiter(way_changes.keys(), dtype=np.int64, count=len(way_changes))
+    keep = np.nonzero(~np.isin(graph.way_ids, changed_way_ids))[0]
+    offsets, node_idx = rail_store.csr_reorder(np.asarray(graph.way_node_offsets), np.asarray(graph.way_node_idx), keep)
+    ways = RailWays()
+    ways.way_ids = array('q', graph.way_ids[keep].tobytes())
+    ways.lengths = array('q', np.diff(offsets).tobytes())
+    ways.refs = array('q', graph.node_ids[node_idx].tobytes())
+    ways.tags = TagTable.from_store(graph.tags, keep)
+    removed = len(graph.way_ids) - len(keep)
+    added = 0
+    for way_id, change in way_changes.items():
+        if change is not None:
+            ways.append(way_id, *change)
+            added += 1
+
+    # 未变更的坐标 + 变更中的坐标
+    valid = ~np.isnan(graph.node_lat)
+    changed_node_ids = np.fromiter(node_changes.keys(), dtype=np.int64, count=len(node_changes))
+    valid &= ~np.isin(graph.node_ids, changed_node_ids)
+    coords = RailNodeCoords()
+    coords.ids = array('q', graph.node_ids[valid].tobytes())
+    coords.lat = array('d', graph.node_lat[valid].tobytes())
+    coords.lon = array('d', graph.node_lon[valid].tobytes())
+    for node_id, coord in node_changes.items():
+        if coord is not None:
+            coords.ids.append(node_id)
+            coords.lat.append(coord[0])
+            coords.lon.append(coord[1])
+
+    known = np.frombuffer(coords.ids, dtype=np.int64)
+    missing = np.setdiff1d(ways.node_ids(), known)
+    print(f'way: 移除 {removed} 条，新增/更新 {added} 条；node坐标变更 {len(node_changes)} 个')
+    if len(missing):
+        # 新变成铁路的way可能引用了变更文件之外、原本不在索引中的node
+        print(f'警告: {len(missing)} 个node缺少坐标(不在索引和变更文件中)，需要完整重建才能补全')
+    # 增量更新后的索引仍对应原来的PBF，保留来源记录，避免 ensure_index 用旧PBF覆盖更新
+    source = graph.manifest.get('source')
+    save_index(ways, coords, graph_dir, extra={'source': source} if source else None)
+
+
+def save_index(ways, coords, graph_dir=GRAPH_DIR, extra=None):
+    """
+    以CSR格式保存索引，见 rail_store.py
+    :param extra: 写入 manifest 的附加信息
+    """
+    raw = (np.frombuffer(ways.way_ids, dtype=np.int64), ways.offsets(), np.frombuffer(ways.refs, dtype=np.int64),
+           np.frombuffer(coords.ids, dtype=np.int64), np.frombuffer(coords.lat), np.frombuffer(coords.lon))
+    save_arrays(raw, ways.tags, graph_dir, extra)
+
+
+def save_arrays(raw, tags, graph_dir=GRAPH_DIR, extra=None):
+    """
+    由原始数组构建CSR图和全部派生索引并保存
+    :param raw: build_graph_arrays 的参数
+    :param tags: 与 raw 中 way 顺序对齐的 TagTable
+    :param extra: 写入 manifest 的附加信息
+    """
+    arrays, order = rail_store.build_graph_arrays(*raw)
+    arrays.update(tags.to_arrays(order))
+    print('构建空间索引...')
+    arrays.update(spatial.build_spatial_arrays(arrays))
+    print('计算折线简化...')
+    arrays.update(simplify.build_lod_arrays(arrays))
+    print('构建路由图...')
+    arrays.update(routing.build_route_arrays(arrays))
+    print('计算连通分量...')
+    arrays.update(components.build_component_arrays(arrays))
+    print('构建名称索引...')
+    store = TagStore(arrays)
+    arrays.update(name_search.build_name_arrays(store.tags(wi, name_search.SEARCH_FIELDS)
+                                                for wi in range(len(arrays['way_ids']))))
+    rail_store.save_graph(graph_dir, arrays, extra)
+    print(f'索引已保存到 {graph_dir}')
+
 
 if __name__ == '__main__':
-    build_and_save_index(PBF_PATH) 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='从OSM PBF生成铁路索引')
+    parser.add_argument('pbf', nargs='?', default=PBF_PATH, help='OSM PBF文件路径')
+    parser.add_argument('--from-pickle', action='store_true',
+                        help='把旧版 data/*.pkl 索引转换为CSR格式，不解析PBF')
+    parser.add_argument('--changes', nargs='+', metavar='OSC',
+                        help='用 .osc/.osc.gz 变更文件增量更新已有索引，按时间顺序给出')
+    parser.add_argument('--reindex', action='store_true',
+                        help='由已有索引重新计算派生结构(升级索引版本)，不解析PBF')
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help='并行解析的进程数，0表示使用全部CPU核心')
+    parser.add_argument('--if-changed', action='store_true',
+                        help='PBF与建索引时相比没有变化时跳过(比较大小、修改时间和内容哈希)')
+    args = parser.parse_args()
+    if args.if_changed:
+        if not ensure_index(args.pbf, workers=args.workers or os.cpu_count()):
+            print('索引已是最新')
+    elif args.from_pickle:
+        save_arrays(*rail_store.read_pickles(DATA_DIR))
+    elif args.changes or args.reindex:
+        apply_changes(args.changes or [])
+    else:
+        build_and_save_index(args.pbf, args.workers or os.cpu_count())
@@ -0,0 +1,225 @@
+"""
+探索链路的服务端存储
+
+原来整条全局累计链路放在 Flask 的签名 cookie session 里，每次请求都要重新序列化、签名，
+长时间探索还会超出 cookie 大小限制。现在 session 中只保存探索id，链路放在服务端:
+- MemoryPathStore: 进程内 LRU，单进程部署用
+- SqlitePathStore: SQLite 持久化(前面仍有一层 LRU 缓存)，多个 worker 进程共享，
+  超过 max_age_days 没有追加过的探索定期删除
+
+每条链路同时维护有序列表和成员集合，追加、去重都是 O(1)。
+"""
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+DEFAULT_MAX_PATHS = 1000
+# SQLite 中探索的保留天数(从最后一次追加算起)，以及同一进程两次清理的最小间隔(秒)
+DEFAULT_MAX_AGE_DAYS = 30
+PRUNE_INTERVAL = 3600
+
+
+class ExplorationPath:
+    """一次探索的全局累计链路"""
+
+    def __init__(self, items=()):
+        self.items = []  # [{'way_id': int, 'type': 'manual'|'auto'}, ...]
+        self.way_ids = set()
+        for way_id, type_ in items:
+            self.add(way_id, type_)
+
+    def add(self, way_id, type_):
+        """追加一条way，已在链路中时忽略；返回是否新增"""
+        if way_id in self.way_ids:
+            return False
+        self.way_ids.add(way_id)
+        self.items.append({'way_id': way_id, 'type': type_})
+        return True
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, way_id):
+        return way_id in self.way_ids
+
+
+def new_exploration_id():
+    return uuid.uuid4().hex
+
+
+class MemoryPathStore:
+    """进程内 LRU 链路存储，超过 max_paths 时淘汰最久未使用的探索"""
+
+    def __init__(self, max_paths=DEFAULT_MAX_PATHS):
+        self.max_paths = max_paths
+        self._paths = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, exploration_id):
+        """取出链路，不存在(或已被淘汰)时返回空链路"""
+        with self._lock:
+            path = self._paths.get(exploration_id)
+            if path is None:
+                path = self._paths[exploration_id] = ExplorationPath()
+                self._evict()
+            else:
+                self._paths.move_to_end(exploration_id)
+            return path
+
+    def append(self, exploration_id, items):
+        """
+        向链路追加 way，已存在的忽略
+        :param items: [{'way_id', 'type'}, ...]
+        :return: 追加后的链路
+        """
+        path = self.load(exploration_id)
+        with self._lock:
+            for item in items:
+                path.add(item['way_id'], item['type'])
+        return path
+
+    def reset(self, exploration_id):
+        with self._lock:
+            self._paths.pop(exploration_id, None)
+
+    def peek(self, exploration_id):
+        """不创建、不调整LRU顺序地查看链路"""
+        return self._paths.get(exploration_id)
+
+    def put(self, exploration_id, path):
+        with self._lock:
+            self._paths[exploration_id] = path
+            self._paths.move_to_end(exploration_id)
+            self._evict()
+
+    def _evict(self):
+        while len(self._paths) > self.max_paths:
+            self._paths.popitem(last=False)
+
+
+class SqlitePathStore:
+    """SQLite 链路存储，每步只插入新增的行；多进程部署时各进程共享同一个数据库文件"""
+
+    def __init__(self, db_path, max_paths=DEFAULT_MAX_PATHS, max_age_days=DEFAULT_MAX_AGE_DAYS):
+        """
+        :param max_age_days: 超过这么多天没有追加过的探索在清理时删除，None 为不清理
+        """
+        self.db_path = db_path
+        self.max_age_days = max_age_days
+        self._cache = MemoryPathStore(max_paths)
+        self._local = threading.local()
+        self._last_prune = 0.0
+        # 建表用临时连接，不留给 fork 出的 worker 进程共用
+        conn = sqlite3.connect(db_path, timeout=10)
+        with conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS path_items ('
+                         'exploration_id TEXT NOT NULL, seq INTEGER NOT NULL, '
+                         'way_id INTEGER NOT NULL, type TEXT NOT NULL, '
+                         'PRIMARY KEY (exploration_id, seq))')
+            has_explorations = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' "
+                                            "AND name = 'explorations'").fetchone()
+            conn.execute('CREATE TABLE IF NOT EXISTS explorations ('
+                         'exploration_id TEXT PRIMARY KEY, updated REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS explorations_updated ON explorations (updated)')
+            if not has_explorations:
+                # 没有记录更新时间的旧数据库，已有的探索从现在开始计算保留时间
+                conn.execute('INSERT OR IGNORE INTO explorations SELECT DISTINCT exploration_id, ? FROM path_items',
+                             (time.time(),))
+        conn.close()
+
+    def _connect(self):
+        # sqlite3 连接不能跨线程使用，每个线程各开一个
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def _read(self, conn, exploration_id):
+        """数据库中当前的链路，缓存与数据库一致时直接返回缓存的对象"""
+        cached = self._cache.peek(exploration_id)
+        if cached is not None:
+            # 按主键取最大序号，其他进程没有改动过这条链路时直接用缓存
+            last = conn.execute('SELECT MAX(seq) FROM path_items WHERE exploration_id = ?',
+                                (exploration_id,)).fetchone()[0]
+            if (last if last is not None else -1) == len(cached) - 1:
+                return cached
+        rows = conn.execute('SELECT way_id, type FROM path_items WHERE exploration_id = ? ORDER BY seq',
+                            (exploration_id,)).fetchall()
+        return ExplorationPath(rows)
+
+    def load(self, exploration_id):
+        path = self._read(self._connect(), exploration_id)
+        self._cache.put(exploration_id, path)
+        return path
+
+    def append(self, exploration_id, items):
+        """
+        在写事务中重新读取链路再追加，多个进程同时追加同一条链路时依次执行、序号不会冲突；
+        提交成功后才更新缓存
+        """
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            path = self._read(conn, exploration_id)
+            added = []
+            seen = set()
+            for item in items:
+                if item['way_id'] not in path and item['way_id'] not in seen:
+                    seen.add(item['way_id'])
+                    added.append(item)
+            if added:
+                start = len(path)
+                conn.executemany(
+                    'INSERT INTO path_items (exploration_id, seq, way_id, type) VALUES (?, ?, ?, ?)',
+                    [(exploration_id, start + i, item['way_id'], item['type']) for i, item in enumerate(added)])
+                conn.execute('INSERT OR REPLACE INTO explorations (exploration_id, updated) VALUES (?, ?)',
+                             (exploration_id, time.time()))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        for item in added:
+            path.add(item['way_id'], item['type'])
+        self._cache.put(exploration_id, path)
+        self._maybe_prune()
+        return path
+
+    def reset(self, exploration_id):
+        self._cache.reset(exploration_id)
+        with self._connect() as conn:
+            conn.execute('DELETE FROM path_items WHERE exploration_id = ?', (exploration_id,))
+            conn.execute('DELETE FROM explorations WHERE exploration_id = ?', (exploration_id,))
+
+    def _maybe_prune(self):
+        now = time.time()
+        if self.max_age_days is None or now - self._last_prune < PRUNE_INTERVAL:
+            return
+        self._last_prune = now
+        self.prune(now - self.max_age_days * 86400)
+
+    def prune(self, before):
+        """
+        删除最后一次追加早于 before(时间戳)的探索
+        :return: 删除的探索数
+        """
+        with self._connect() as conn:
+            conn.execute('DELETE FROM path_items WHERE exploration_id IN '
+                         '(SELECT exploration_id FROM explorations WHERE updated < ?)', (before,))
+            return conn.execute('DELETE FROM explorations WHERE updated < ?', (before,)).rowcount
+
+
+def create_path_store(spec, max_age_days=DEFAULT_MAX_AGE_DAYS):
+    """
+    按配置创建链路存储
+    :param spec: 'memory'、'memory:最大探索数' 或 'sqlite:数据库路径'
+    :param max_age_days: SQLite 中探索的保留天数，None 为不清理；内存存储按LRU淘汰，忽略此参数
+    """
+    kind, _, arg = (spec or 'memory').partition(':')
+    if kind == 'memory':
+        return MemoryPathStore(int(arg) if arg else DEFAULT_MAX_PATHS)
+    if kind == 'sqlite':
+        return SqlitePathStore(arg or 'paths.sqlite3', max_age_days=max_age_days)
+    raise ValueError(f'未知的链路存储: {spec}')
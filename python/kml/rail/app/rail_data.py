@@ -0,0 +1,127 @@
+"""
+app.py 的数据访问层
+
+索引在第一次用到时才打开，import app 不再触发任何数据加载(测试、工具脚本导入很快)。
+数组都是 mmap 只读映射，多个 worker 进程共享操作系统页缓存中的同一份物理内存；
+用 gunicorn --preload 部署时可在 master 进程中调用 preload()，fork 出的 worker 直接继承。
+"""
+import gc
+import threading
+import time
+
+from components import Components
+from geometry import DEFAULT_CACHE_SIZE, GeometryCache
+from name_search import NameIndex
+from rail_store import RailGraph
+from routing import Router
+from spatial import SpatialIndex
+from tiles import TileRenderer
+
+
+class RailData:
+    """按需加载的铁路索引，线程安全"""
+
+    def __init__(self, graph_dir, geometry_cache_size=DEFAULT_CACHE_SIZE, tile_cache_dir=None):
+        self.graph_dir = graph_dir
+        self.geometry_cache_size = geometry_cache_size
+        self.tile_cache_dir = tile_cache_dir
+        self._lock = threading.Lock()
+        self._graph = None
+        self._geometry = None
+        self._tiles = None
+        self._router = None
+        self._components = None
+        self._spatial = None
+        self._names = None
+        self.load_seconds = None
+
+    @property
+    def graph(self):
+        if self._graph is None:
+            with self._lock:
+                if self._graph is None:
+                    start = time.perf_counter()
+                    self._graph = RailGraph.load(self.graph_dir)
+                    self.load_seconds = time.perf_counter() - start
+        return self._graph
+
+    @property
+    def spatial(self):
+        if self._spatial is None:
+            graph = self.graph
+            with self._lock:
+                if self._spatial is None:
+                    self._spatial = SpatialIndex(graph)
+        return self._spatial
+
+    @property
+    def names(self):
+        if self._names is None:
+            graph = self.graph
+            with self._lock:
+                if self._names is None:
+                    self._names = NameIndex(graph)
+        return self._names
+
+    @property
+    def geometry(self):
+        if self._geometry is None:
+            graph = self.graph
+            with self._lock:
+                if self._geometry is None:
+                    self._geometry = GeometryCache(graph, self.geometry_cache_size)
+        return self._geometry
+
+    @property
+    def tiles(self):
+        if self._tiles is None:
+            spatial = self.spatial
+            with self._lock:
+                if self._tiles is None:
+                    self._tiles = TileRenderer(spatial.graph, spatial, self.tile_cache_dir)
+        return self._tiles
+
+    @property
+    def router(self):
+        """索引中没有路由图时抛出 KeyError"""
+        if self._router is None:
+            graph = self.graph
+            with self._lock:
+                if self._router is None:
+                    self._router = Router(graph)
+        return self._router
+
+    @property
+    def components(self):
+        """索引中没有连通分量数据时抛出 KeyError"""
+        if self._components is None:
+            graph = self.graph
+            with self._lock:
+                if self._components is None:
+                    self._components = Components(graph)
+        return self._components
+
+    @property
+    def loaded(self):
+        return self._graph is not None
+
+    def preload(self):
+        """
+        一次性加载全部数据(含标签字符串表)，并把已有对象移出GC跟踪，
+        fork 后 worker 不会因为GC扫描而复制这些内存页
+        """
+        self.graph.tags.strings
+        self.spatial
+        self.names
+        gc.freeze()
+
+    def status(self):
+        """就绪状态，索引缺失或损坏时抛出异常"""
+        graph = self.graph
+        return {
+            'ready': True,
+            'way_count': graph.way_count,
+            'node_count': graph.node_count,
+            'version': graph.manifest.get('version'),
+            'load_ms': round(self.load_seconds * 1000, 1) if self.load_seconds is not None else None,
+        }
@@ -0,0 +1,539 @@
+"""
+铁路索引的紧凑存储格式
+
+用排好序的 int64 id 数组 + CSR(offset/index) 数组代替原来的四个 pickle 字典:
+- way_ids / node_ids:          排好序的 way / node id
+- way_node_offsets/way_node_idx: way → nodes (node 在 node_ids 中的下标)
+- node_way_offsets/node_way_idx: node → ways (way 在 way_ids 中的下标)
+- node_lat / node_lon:         node 坐标(float64)，缺失坐标为 NaN
+- tag_strings/way_tag_*:       way 标签的列式存储(去重字符串表 + 编号)，见 tag_store.py
+
+由上面的核心数组预先计算的派生结构:
+- way_adj_offsets/way_adj:     way 邻接表(共享node的其他way)
+- chain_offsets/chain_ways:    度为2的way连成的无分支链，按行进顺序排列
+- way_chain/way_chain_pos:     每条way所在的链及其在链中的位置(不在链中为 -1)
+
+所有数组以 .npy 保存在以本次保存的 generation 命名的子目录中，manifest.json 指向该子目录；
+读取时用 mmap 只读映射，多个进程共享同一份物理内存页。
+"""
+import json
+import os
+import pickle
+import shutil
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from tag_store import TAG_ARRAYS, TagStore, TagTable
+
+STORE_VERSION = 2
+MANIFEST_NAME = 'manifest.json'
+WAY_META_NAME = 'way_meta.pkl'
+# 被新版本替换的数组子目录保留的时间(秒)，之后的保存时删除
+STALE_ARRAY_SECONDS = 60
+CORE_ARRAYS = [
+    'way_ids', 'way_node_offsets', 'way_node_idx',
+    'node_ids', 'node_way_offsets', 'node_way_idx',
+    'node_lat', 'node_lon',
+]
+JUNCTION_ARRAYS = [
+    'way_adj_offsets', 'way_adj',
+    'chain_offsets', 'chain_ways', 'way_chain', 'way_chain_pos',
+]
+
+
+def csr_reorder(offsets, values, order):
+    """按 order 重排 CSR 的行，返回新的 offsets/values"""
+    lengths = np.diff(offsets)[order]
+    new_offsets = np.zeros(len(order) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=new_offsets[1:])
+    starts = offsets[:-1][order]
+    gather = np.repeat(starts - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+    return new_offsets, values[gather]
+
+
+def build_graph_arrays(way_ids, way_node_offsets, way_node_refs, coord_ids, coord_lat, coord_lon):
+    """
+    由原始数组构建完整的CSR图
+    :param way_ids: way id 数组(可无序)
+    :param way_node_offsets: 每条way在 way_node_refs 中的起止位置(长度为 way数+1)
+    :param way_node_refs: 按way顺序拼接的 node id
+    :param coord_ids: 有坐标的 node id
+    :param coord_lat: 对应纬度
+    :param coord_lon: 对应经度
+    :return: (数组字典, way排序下标)，排序下标用于对齐元数据
+    """
+    way_ids = np.asarray(way_ids, dtype=np.int64)
+    way_node_offsets = np.asarray(way_node_offsets, dtype=np.int64)
+    way_node_refs = np.asarray(way_node_refs, dtype=np.int64)
+    order = np.argsort(way_ids, kind='stable')
+    way_node_offsets, way_node_refs = csr_reorder(way_node_offsets, way_node_refs, order)
+    way_ids = way_ids[order]
+
+    node_ids = np.unique(way_node_refs)
+    way_node_idx = np.searchsorted(node_ids, way_node_refs).astype(np.int32)
+
+    # node → ways，同一条way多次经过同一node(环线)时只记一次
+    way_of_ref = np.repeat(np.arange(len(way_ids), dtype=np.int32), np.diff(way_node_offsets))
+    pair_order = np.lexsort((way_of_ref, way_node_idx))
+    pair_node = way_node_idx[pair_order]
+    pair_way = way_of_ref[pair_order]
+    keep = np.ones(len(pair_node), dtype=bool)
+    keep[1:] = (pair_node[1:] != pair_node[:-1]) | (pair_way[1:] != pair_way[:-1])
+    pair_node = pair_node[keep]
+    node_way_idx = pair_way[keep]
+    node_way_offsets = np.zeros(len(node_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(pair_node, minlength=len(node_ids)), out=node_way_offsets[1:])
+
+    node_lat = np.full(len(node_ids), np.nan)
+    node_lon = np.full(len(node_ids), np.nan)
+    coord_ids = np.asarray(coord_ids, dtype=np.int64)
+    if len(coord_ids) and len(node_ids):
+        pos = np.searchsorted(node_ids, coord_ids)
+        pos[pos >= len(node_ids)] = 0
+        found = node_ids[pos] == coord_ids
+        node_lat[pos[found]] = np.asarray(coord_lat, dtype=np.float64)[found]
+        node_lon[pos[found]] = np.asarray(coord_lon, dtype=np.float64)[found]
+
+    arrays = {
+        'way_ids': way_ids,
+        'way_node_offsets': way_node_offsets,
+        'way_node_idx': way_node_idx,
+        'node_ids': node_ids,
+        'node_way_offsets': node_way_offsets,
+        'node_way_idx': node_way_idx,
+        'node_lat': node_lat,
+        'node_lon': node_lon,
+    }
+    arrays.update(build_junction_arrays(arrays))
+    return arrays, order
+
+
+def build_way_adjacency(way_count, node_way_offsets, node_way_idx):
+    """由 node → ways 计算 way 邻接表(CSR)，不含自身"""
+    counts = np.diff(node_way_offsets)
+    entry_count = np.repeat(counts, counts)
+    entry_start = np.repeat(node_way_offsets[:-1], counts)
+    # 每个条目与同一node下的所有条目两两配对
+    src = np.repeat(node_way_idx, entry_count).astype(np.int64)
+    first = np.repeat(np.cumsum(entry_count) - entry_count, entry_count)
+    partner = np.repeat(entry_start, entry_count) + (np.arange(len(src)) - first)
+    dst = node_way_idx[partner].astype(np.int64)
+    keep = src != dst
+    keys = np.unique(src[keep] * way_count + dst[keep])
+    src = keys // way_count
+    offsets = np.zeros(way_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=way_count), out=offsets[1:])
+    return offsets, (keys % way_count).astype(np.int32)
+
+
+def build_chains(adj_offsets, adj):
+    """
+    把度为2的way串成无分支链。
+    度为2的way只有两个邻居，从一侧进入后下一步必然走向另一侧，
+    所以整条链可以一次走完，不必逐条way计算邻居
+    """
+    way_count = len(adj_offsets) - 1
+    deg = np.diff(adj_offsets)
+    way_chain = np.full(way_count, -1, dtype=np.int32)
+    way_chain_pos = np.full(way_count, -1, dtype=np.int32)
+    chain_offsets = [0]
+    chain_ways = []
+
+    def other(cur, prev):
+        a, b = adj[adj_offsets[cur]:adj_offsets[cur + 1]]
+        return int(b) if a == prev else int(a)
+
+    def walk(start, prev):
+        """沿度为2的way前进，返回 (经过的way, 是否绕回起点成环)"""
+        seq = [start]
+        cur = start
+        while True:
+            nxt = other(cur, prev)
+            if nxt == start:
+                return seq, True
+            if deg[nxt] != 2:
+                return seq, False
+            seq.append(nxt)
+            prev, cur = cur, nxt
+
+    for w in np.nonzero(deg == 2)[0].tolist():
+        if way_chain[w] >= 0:
+            continue
+        a, b = adj[adj_offsets[w]:adj_offsets[w + 1]].tolist()
+        forward, closed = walk(w, b)
+        run = forward if closed else walk(w, a)[0][:0:-1] + forward
+        chain_id = len(chain_offsets) - 1
+        way_chain[run] = chain_id
+        way_chain_pos[run] = np.arange(len(run), dtype=np.int32)
+        chain_ways.extend(run)
+        chain_offsets.append(len(chain_ways))
+    return (np.asarray(chain_offsets, dtype=np.int64), np.asarray(chain_ways, dtype=np.int32),
+            way_chain, way_chain_pos)
+
+
+def build_junction_arrays(arrays):
+    adj_offsets, adj = build_way_adjacency(len(arrays['way_ids']), arrays['node_way_offsets'],
+                                           arrays['node_way_idx'])
+    chain_offsets, chain_ways, way_chain, way_chain_pos = build_chains(adj_offsets, adj)
+    return {
+        'way_adj_offsets': adj_offsets,
+        'way_adj': adj,
+        'chain_offsets': chain_offsets,
+        'chain_ways': chain_ways,
+        'way_chain': way_chain,
+        'way_chain_pos': way_chain_pos,
+    }
+
+
+def arrays_from_dicts(way_to_nodes, node_coords):
+    """把旧格式的 way_to_nodes / node_coords 字典转为 build_graph_arrays 的输入"""
+    way_ids = np.fromiter(way_to_nodes.keys(), dtype=np.int64, count=len(way_to_nodes))
+    lengths = np.fromiter((len(v) for v in way_to_nodes.values()), dtype=np.int64, count=len(way_to_nodes))
+    offsets = np.zeros(len(way_ids) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    refs = np.fromiter((n for v in way_to_nodes.values() for n in v), dtype=np.int64, count=int(offsets[-1]))
+    coord_ids = np.fromiter(node_coords.keys(), dtype=np.int64, count=len(node_coords))
+    coord_lat = np.fromiter((c[0] for c in node_coords.values()), dtype=np.float64, count=len(node_coords))
+    coord_lon = np.fromiter((c[1] for c in node_coords.values()), dtype=np.float64, count=len(node_coords))
+    return way_ids, offsets, refs, coord_ids, coord_lat, coord_lon
+
+
+@contextmanager
+def _replace_file(path):
+    """
+    先写临时文件再原子替换。
+    其他进程随时可能读取该文件，直接覆盖写会让它们读到半截数据
+    """
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        yield f
+    os.replace(tmp, path)
+
+
+def _read_manifest(graph_dir):
+    try:
+        with open(os.path.join(graph_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _remove_stale_arrays(graph_dir, old_manifest):
+    """
+    删除之前保存的数组：被新版本替换超过 STALE_ARRAY_SECONDS 的 generation 子目录，
+    以及旧格式直接放在索引目录下的 .npy。
+    刚替换下来的子目录先保留，读到上一个 manifest、还在逐个打开数组的进程不会找不到文件
+    """
+    generations = sorted((name for name in os.listdir(graph_dir)
+                          if name.isdigit() and os.path.isdir(os.path.join(graph_dir, name))), key=int)
+    now = time.time_ns()
+    # generation 是子目录创建时间，下一个子目录的创建时间即为它被替换的时间
+    for name, successor in zip(generations, generations[1:]):
+        if now - int(successor) > STALE_ARRAY_SECONDS * 1e9:
+            # 已映射旧数组的进程不受影响(Windows 下删不掉映射中的文件，留到下次保存)
+            shutil.rmtree(os.path.join(graph_dir, name), ignore_errors=True)
+    if old_manifest and 'array_dir' not in old_manifest:
+        for name in old_manifest.get('arrays', CORE_ARRAYS):
+            try:
+                os.remove(os.path.join(graph_dir, name + '.npy'))
+            except OSError:
+                pass
+
+
+def save_graph(graph_dir, arrays, extra=None):
+    """
+    保存CSR图
+    数组写入新的 generation 子目录，最后原子替换 manifest 指向它，同时加载索引的进程
+    要么读到完整的旧索引，要么读到完整的新索引，不会混用两次保存的数组
+    :param graph_dir: 保存目录
+    :param arrays: build_graph_arrays 返回的数组字典(含标签数组)
+    :param extra: 写入 manifest 的附加信息
+    """
+    os.makedirs(graph_dir, exist_ok=True)
+    old_manifest = _read_manifest(graph_dir)
+    while True:
+        generation = str(time.time_ns())
+        try:
+            os.mkdir(os.path.join(graph_dir, generation))
+            break
+        except FileExistsError:
+            continue
+    for name in arrays:
+        np.save(os.path.join(graph_dir, generation, name + '.npy'), np.ascontiguousarray(arrays[name]))
+    manifest = {
+        'version': STORE_VERSION,
+        'generation': generation,
+        'array_dir': generation,
+        'way_count': int(len(arrays['way_ids'])),
+        'node_count': int(len(arrays['node_ids'])),
+        'arrays': list(arrays),
+    }
+    if extra:
+        manifest.update(extra)
+    with _replace_file(os.path.join(graph_dir, MANIFEST_NAME)) as f:
+        f.write(json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8'))
+    _remove_stale_arrays(graph_dir, old_manifest)
+    # 旧版索引的元数据 pickle 已由标签数组代替
+    if os.path.exists(os.path.join(graph_dir, WAY_META_NAME)):
+        os.remove(os.path.join(graph_dir, WAY_META_NAME))
+
+
+def update_manifest(graph_dir, generation, **fields):
+    """
+    修改 manifest 中的附加信息，数组和 generation 不变
+    :param generation: 读取 manifest 时的 generation，索引已被重新保存时不修改
+    :return: 是否已修改
+    """
+    manifest = _read_manifest(graph_dir)
+    if manifest is None or manifest.get('generation') != generation:
+        return False
+    manifest.update(fields)
+    with _replace_file(os.path.join(graph_dir, MANIFEST_NAME)) as f:
+        f.write(json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8'))
+    return True
+
+
+def read_pickles(data_dir):
+    """
+    读取旧版 parse_osm.py 生成的 pickle 索引，转为 build_graph_arrays 的输入，无需重新解析PBF
+    :return: (build_graph_arrays 的参数, 与 way 顺序对齐的 TagTable)
+    """
+    with open(os.path.join(data_dir, 'way_to_nodes.pkl'), 'rb') as f:
+        way_to_nodes = pickle.load(f)
+    with open(os.path.join(data_dir, 'node_coords.pkl'), 'rb') as f:
+        node_coords = pickle.load(f)
+    with open(os.path.join(data_dir, 'way_to_meta.pkl'), 'rb') as f:
+        way_to_meta = pickle.load(f)
+    tags = TagTable.from_metas(way_to_meta.get(wid, {}) for wid in way_to_nodes)
+    return arrays_from_dicts(way_to_nodes, node_coords), tags
+
+
+class RailGraph:
+    """只读的CSR铁路图，数组通过 mmap 映射"""
+
+    def __init__(self, arrays, graph_dir=None, manifest=None, generation=None):
+        self.graph_dir = graph_dir
+        self.manifest = manifest or {}
+        # 索引版本标识，用于瓦片缓存目录、HTTP ETag 等；必须与映射的数组属于同一次保存
+        self.generation = generation or self.manifest.get('generation') or 'current'
+        self.arrays = arrays
+        self.way_ids = arrays['way_ids']
+        self.way_node_offsets = arrays['way_node_offsets']
+        self.way_node_idx = arrays['way_node_idx']
+        self.node_ids = arrays['node_ids']
+        self.node_way_offsets = arrays['node_way_offsets']
+        self.node_way_idx = arrays['node_way_idx']
+        self.node_lat = arrays['node_lat']
+        self.node_lon = arrays['node_lon']
+        self.way_adj_offsets = arrays.get('way_adj_offsets')
+        self.way_adj = arrays.get('way_adj')
+        self.chain_offsets = arrays.get('chain_offsets')
+        self.chain_ways = arrays.get('chain_ways')
+        self.way_chain = arrays.get('way_chain')
+        self.way_chain_pos = arrays.get('way_chain_pos')
+        self.way_node_tol = arrays.get('way_node_tol')  # 折线简化容差，见 simplify.py
+        self._tags = None
+
+    @classmethod
+    def load(cls, graph_dir, mmap=True, strict=True):
+        """
+        :param strict: 为 False 时不检查版本，只要求核心数组存在(用于 parse_osm.py --reindex 升级旧索引)
+        """
+        for attempt in range(3):
+            with open(os.path.join(graph_dir, MANIFEST_NAME)) as f:
+                manifest = json.load(f)
+                # 旧版 manifest 没有 generation 字段，用读取时这份文件的修改时间
+                generation = manifest.get('generation') or str(os.fstat(f.fileno()).st_mtime_ns)
+            if strict and manifest.get('version') != STORE_VERSION:
+                raise ValueError(f'索引版本不匹配: {manifest.get("version")}，请运行 parse_osm.py --reindex')
+            mode = 'r' if mmap else None
+            array_dir = os.path.join(graph_dir, manifest.get('array_dir', ''))
+            try:
+                arrays = {name: np.load(os.path.join(array_dir, name + '.npy'), mmap_mode=mode)
+                          for name in manifest.get('arrays', CORE_ARRAYS)}
+                break
+            except FileNotFoundError:
+                # 读取 manifest 之后索引被重新保存，旧目录已删除，重新读取新的 manifest
+                if attempt == 2:
+                    raise
+        return cls(arrays, graph_dir, manifest, generation)
+
+    @property
+    def way_count(self):
+        return len(self.way_ids)
+
+    @property
+    def node_count(self):
+        return len(self.node_ids)
+
+    # ---------- id ↔ 下标 ----------
+    def way_index(self, way_id):
+        """way id 转下标，不存在返回 -1"""
+        i = int(np.searchsorted(self.way_ids, way_id))
+        if i < len(self.way_ids) and self.way_ids[i] == way_id:
+            return i
+        return -1
+
+    def node_index(self, node_id):
+        """node id 转下标，不存在返回 -1"""
+        i = int(np.searchsorted(self.node_ids, node_id))
+        if i < len(self.node_ids) and self.node_ids[i] == node_id:
+            return i
+        return -1
+
+    def has_way(self, way_id):
+        return self.way_index(way_id) >= 0
+
+    def iter_way_ids(self):
+        for wid in self.way_ids:
+            yield int(wid)
+
+    # ---------- 下标级访问 ----------
+    def _way_node_slice(self, wi):
+        return self.way_node_idx[self.way_node_offsets[wi]:self.way_node_offsets[wi + 1]]
+
+    def _node_way_slice(self, ni):
+        return self.node_way_idx[self.node_way_offsets[ni]:self.node_way_offsets[ni + 1]]
+
+    # ---------- id 级访问 ----------
+    def way_nodes(self, way_id):
+        """way 的 node id 列表"""
+        wi = self.way_index(way_id)
+        if wi < 0:
+            return []
+        return self.node_ids[self._way_node_slice(wi)].tolist()
+
+    def node_ways(self, node_id):
+        """经过该 node 的 way id 集合"""
+        ni = self.node_index(node_id)
+        if ni < 0:
+            return set()
+        return set(self.way_ids[self._node_way_slice(ni)].tolist())
+
+    def node_coord(self, node_id):
+        """node 坐标 (lat, lon)，无坐标返回 None"""
+        ni = self.node_index(node_id)
+        if ni < 0 or np.isnan(self.node_lat[ni]):
+            return None
+        return float(self.node_lat[ni]), float(self.node_lon[ni])
+
+    def way_coords(self, way_id, tolerance=0):
+        """
+        way 的坐标列表 [(lat, lon), ...]，跳过缺失坐标的 node
+        :param tolerance: 折线简化容差(米)，0为原始精度；索引中没有简化数据时忽略
+        """
+        wi = self.way_index(way_id)
+        if wi < 0:
+            return []
+        idx = self._way_node_slice(wi)
+        lat = self.node_lat[idx]
+        lon = self.node_lon[idx]
+        if tolerance > 0 and self.way_node_tol is not None:
+            start, end = self.way_node_offsets[wi], self.way_node_offsets[wi + 1]
+            mask = self.way_node_tol[start:end] >= tolerance
+        else:
+            mask = ~np.isnan(lat)
+        return list(zip(lat[mask].tolist(), lon[mask].tolist()))
+
+    def _neighbors(self, wi):
+        return self.way_adj[self.way_adj_offsets[wi]:self.way_adj_offsets[wi + 1]].tolist()
+
+    def neighbor_ways(self, way_id):
+        """与该 way 共享 node 的其他 way id 集合"""
+        wi = self.way_index(way_id)
+        if wi < 0:
+            return set()
+        return set(self.way_ids[self.way_adj[self.way_adj_offsets[wi]:self.way_adj_offsets[wi + 1]]].tolist())
+
+    def _chain_ahead(self, wi, prev):
+        """
+        wi 在无分支链上且从 prev 进入时，之后必然依次经过的way下标；否则返回空列表
+        """
+        c = self.way_chain[wi]
+        if c < 0 or prev is None:
+            return []
+        run = self.chain_ways[self.chain_offsets[c]:self.chain_offsets[c + 1]]
+        n = len(run)
+        pos = int(self.way_chain_pos[wi])
+        if pos > 0 and run[pos - 1] == prev:
+            return run[pos + 1:].tolist()
+        if pos < n - 1 and run[pos + 1] == prev:
+            return run[pos - 1::-1].tolist() if pos > 0 else []
+        # 从链外(或环的首尾衔接处)进入链端
+        if pos == 0:
+            return run[1:].tolist()
+        if pos == n - 1:
+            return run[-2::-1].tolist()
+        return []
+
+    def advance_until_branch(self, start_way_id, max_depth=20, exclude=()):
+        """
+        从 start_way_id 出发沿唯一相连轨道前进，直到出现多个可选way或无新way。
+        无分支链上整段一次走完，只在链端查邻接表
+        :param exclude: 不允许再进入的way id(全局累计链路)；传入set时直接按id判断，不随链路长度变慢
+        :return: (经过的way id列表, 可选way id列表, 当前way id)
+        """
+        start = self.way_index(start_way_id)
+        if start < 0:
+            return [start_way_id], [], start_way_id
+        if not isinstance(exclude, (set, frozenset)):
+            exclude = set(exclude)
+        way_ids = self.way_ids
+        visited = set()
+        path = []
+        cur = start
+        while len(path) < max_depth:
+            visited.add(cur)
+            path.append(cur)
+            for nxt in self._chain_ahead(cur, path[-2] if len(path) > 1 else None):
+                if nxt in visited or int(way_ids[nxt]) in exclude:
+                    return self._ids(path), [], int(way_ids[path[-1]])
+                if len(path) >= max_depth:
+                    return self._ids(path), [int(way_ids[nxt])], int(way_ids[nxt])
+                visited.add(nxt)
+                path.append(nxt)
+            choices = [w for w in self._neighbors(path[-1]) if w not in visited and int(way_ids[w]) not in exclude]
+            if len(choices) != 1:
+                return self._ids(path), self._ids(choices), int(self.way_ids[path[-1]])
+            cur = choices[0]
+        return self._ids(path), [int(way_ids[cur])], int(way_ids[cur])
+
+    def _ids(self, indices):
+        return self.way_ids[indices].tolist() if indices else []
+
+    @property
+    def tags(self):
+        """way 标签(TagStore)，旧版索引没有标签数组时由 way_meta.pkl 转换"""
+        if self._tags is None:
+            if all(name in self.arrays for name in TAG_ARRAYS):
+                self._tags = TagStore(self.arrays)
+            else:
+                with open(os.path.join(self.graph_dir, WAY_META_NAME), 'rb') as f:
+                    self._tags = TagStore(TagTable.from_metas(pickle.load(f)).to_arrays())
+        return self._tags
+
+    def way_meta_list(self):
+        """与 way_ids 对齐的全部元数据(不含nodes)，会解码所有way的标签，只在需要整体处理时使用"""
+        tags = self.tags
+        return [tags.meta(wi, way_id) for wi, way_id in enumerate(self.way_ids.tolist())]
+
+    def way_meta(self, way_id):
+        """way 元数据 {'id','name','ref','operator','tags','nodes'}，不存在返回 {}"""
+        wi = self.way_index(way_id)
+        if wi < 0:
+            return {}
+        meta = self.tags.meta(wi, int(way_id))
+        meta['nodes'] = self.node_ids[self._way_node_slice(wi)].tolist()
+        return meta
+
+    def way_tags(self, way_id, keys=None):
+        """
+        way 的标签 dict，不存在返回 {}
+        :param keys: 只取这些键，None 为全部
+        """
+        wi = self.way_index(way_id)
+        if wi < 0:
+            return {}
+        return self.tags.tags(wi, keys)
@@ -0,0 +1,314 @@
+"""
+轨道间的点到点路径规划
+
+建索引时把 node 级的图收缩成"关键点"图：关键点是岔路口、尽头等度数不为2的node，
+两个关键点之间沿轨道的一段(可能跨多条way)收缩为一条边，记录长度和依次经过的way:
+- route_key_nodes:                      关键点的 node 下标(升序)
+- route_adj_offsets/route_adj_edge:     关键点 → 相连的边
+- route_edge_u/route_edge_v/route_edge_len: 边的两端关键点和长度(米)
+- route_edge_offsets/route_edge_ways:   边 → 从 u 到 v 依次经过的way(每条way的一段为一个槽位)
+- route_edge_cum:                       每个槽位末端距边起点的累计长度
+- route_way_offsets/route_way_slots:    way → 它所在的槽位
+
+查询时在关键点图上跑 A*，启发函数为到目标way的球面距离下界。
+"""
+import heapq
+import math
+
+import numpy as np
+
+from geo import EARTH_R, haversine
+
+ROUTE_ARRAYS = [
+    'route_key_nodes', 'route_adj_offsets', 'route_adj_edge',
+    'route_edge_u', 'route_edge_v', 'route_edge_len',
+    'route_edge_offsets', 'route_edge_ways', 'route_edge_cum',
+    'route_way_offsets', 'route_way_slots',
+]
+
+
+def _build_pieces(arrays):
+    """
+    把每条way在断点处切成小段
+    :return: (各段起点node, 终点node, way下标, 长度), node度数
+    """
+    offsets = arrays['way_node_offsets']
+    idx = arrays['way_node_idx']
+    lat = arrays['node_lat']
+    lon = arrays['node_lon']
+    node_count = len(lat)
+    total = len(idx)
+    owner = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    same = owner[1:] == owner[:-1] if total else np.empty(0, dtype=bool)
+    a, b = idx[:-1][same], idx[1:][same]
+    # node 度数按去重后的无向相邻关系计算
+    lo, hi = np.minimum(a, b), np.maximum(a, b)
+    pairs = np.unique(lo[lo != hi].astype(np.int64) * node_count + hi[lo != hi])
+    degree = (np.bincount(pairs // node_count, minlength=node_count)
+              + np.bincount(pairs % node_count, minlength=node_count))
+
+    seg = np.zeros(total)
+    missing = np.zeros(total, dtype=np.int64)
+    if total > 1:
+        d = haversine(lat[idx[:-1]], lon[idx[:-1]], lat[idx[1:]], lon[idx[1:]])
+        seg[1:] = np.where(same, np.nan_to_num(d), 0)
+        missing[1:] = same & np.isnan(d)
+    cum = np.cumsum(seg)
+    missing = np.cumsum(missing)
+
+    # 断点：度数不为2的node、任何一条way的端点(在其他way中间出现时也要断开)、way原路折返的node
+    nonempty = np.diff(offsets) > 0
+    node_break = np.zeros(node_count, dtype=bool)
+    node_break[idx[offsets[:-1][nonempty]]] = True
+    node_break[idx[offsets[1:][nonempty] - 1]] = True
+    if total > 2:
+        turn = np.nonzero((idx[:-2] == idx[2:]) & (owner[:-2] == owner[2:]))[0] + 1
+        node_break[idx[turn]] = True
+    is_break = (degree[idx] != 2) | node_break[idx]
+    is_break[offsets[:-1][nonempty]] = True
+    is_break[offsets[1:][nonempty] - 1] = True
+    bp = np.nonzero(is_break)[0]
+    # 含缺坐标node的段长度未知，不参与路径规划(通常是数据范围之外的部分)
+    ok = (owner[bp[:-1]] == owner[bp[1:]]) & (missing[bp[1:]] == missing[bp[:-1]])
+    start, end = bp[:-1][ok], bp[1:][ok]
+    return idx[start], idx[end], owner[start], cum[end] - cum[start], degree
+
+
+def build_route_arrays(arrays):
+    """由CSR图构建收缩后的路由图"""
+    piece_u, piece_v, piece_way, piece_len, degree = _build_pieces(arrays)
+    piece_u, piece_v = piece_u.tolist(), piece_v.tolist()
+    piece_way, piece_len = piece_way.tolist(), piece_len.tolist()
+    # node → [(段, 端)]，端 0 为段起点，1 为段终点
+    incident = {}
+    for p, (u, v) in enumerate(zip(piece_u, piece_v)):
+        incident.setdefault(u, []).append((p, 0))
+        incident.setdefault(v, []).append((p, 1))
+    is_key = {n for n, inc in incident.items() if len(inc) != 2}
+
+    used = [False] * len(piece_u)
+    edges = []  # (u node, v node, [way...], [累计长度...])
+
+    def walk(start, p, end):
+        # 从 start 出发经段 p(从 end 端进入)，一直走到下一个关键点
+        ways, cum = [], []
+        length = 0.0
+        node = start
+        while True:
+            used[p] = True
+            length += piece_len[p]
+            ways.append(piece_way[p])
+            cum.append(length)
+            node = piece_v[p] if end == 0 else piece_u[p]
+            if node in is_key:
+                return node, ways, cum
+            arrived = (p, 1 - end)
+            nxt = [x for x in incident[node] if x != arrived]
+            p, end = nxt[0]
+
+    for key in sorted(is_key):
+        for p, end in incident[key]:
+            if not used[p]:
+                v, ways, cum = walk(key, p, end)
+                edges.append((key, v, ways, cum))
+    # 没有关键点的环线：任取一个端点作为关键点
+    for p in range(len(piece_u)):
+        if not used[p]:
+            is_key.add(piece_u[p])
+            v, ways, cum = walk(piece_u[p], p, 0)
+            edges.append((piece_u[p], v, ways, cum))
+
+    key_nodes = np.array(sorted(is_key), dtype=np.int64)
+    edge_u = np.searchsorted(key_nodes, [e[0] for e in edges]).astype(np.int32)
+    edge_v = np.searchsorted(key_nodes, [e[1] for e in edges]).astype(np.int32)
+    edge_len = np.array([e[3][-1] for e in edges], dtype=np.float64)
+    edge_offsets = np.zeros(len(edges) + 1, dtype=np.int64)
+    np.cumsum([len(e[2]) for e in edges], out=edge_offsets[1:])
+    edge_ways = np.array([w for e in edges for w in e[2]], dtype=np.int32)
+    edge_cum = np.array([c for e in edges for c in e[3]], dtype=np.float64)
+
+    # 关键点邻接表(边的两个方向)
+    ends = np.concatenate([edge_u, edge_v])
+    edge_ids = np.concatenate([np.arange(len(edges)), np.arange(len(edges))]).astype(np.int32)
+    order = np.argsort(ends, kind='stable')
+    adj_offsets = np.zeros(len(key_nodes) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(ends, minlength=len(key_nodes)), out=adj_offsets[1:])
+
+    way_count = len(arrays['way_node_offsets']) - 1
+    slot_order = np.argsort(edge_ways, kind='stable').astype(np.int64)
+    way_offsets = np.zeros(way_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(edge_ways, minlength=way_count), out=way_offsets[1:])
+    return {
+        'route_key_nodes': key_nodes.astype(np.int32),
+        'route_adj_offsets': adj_offsets,
+        'route_adj_edge': edge_ids[order],
+        'route_edge_u': edge_u,
+        'route_edge_v': edge_v,
+        'route_edge_len': edge_len,
+        'route_edge_offsets': edge_offsets,
+        'route_edge_ways': edge_ways,
+        'route_edge_cum': edge_cum,
+        'route_way_offsets': way_offsets,
+        'route_way_slots': slot_order,
+    }
+
+
+class Router:
+    """基于 RailGraph 中收缩路由图的 A* 路径规划"""
+
+    def __init__(self, graph):
+        if 'route_key_nodes' not in graph.arrays:
+            raise KeyError('索引中没有路由数据，请运行 parse_osm.py --reindex')
+        self.graph = graph
+        a = graph.arrays
+        self.adj_offsets = a['route_adj_offsets']
+        self.adj_edge = a['route_adj_edge']
+        self.edge_u = a['route_edge_u']
+        self.edge_v = a['route_edge_v']
+        self.edge_len = a['route_edge_len']
+        self.edge_offsets = a['route_edge_offsets']
+        self.edge_ways = a['route_edge_ways']
+        self.edge_cum = a['route_edge_cum']
+        self.way_offsets = a['route_way_offsets']
+        self.way_slots = a['route_way_slots']
+        key_nodes = a['route_key_nodes']
+        # A* 内层循环逐个访问元素，转成列表比逐个取 numpy 标量快得多
+        self._adj_offsets = self.adj_offsets.tolist()
+        self._adj_edge = self.adj_edge.tolist()
+        self._edge_u = self.edge_u.tolist()
+        self._edge_v = self.edge_v.tolist()
+        self._edge_len = self.edge_len.tolist()
+        self._key_lat = np.radians(graph.node_lat[key_nodes]).tolist()
+        self._key_lon = np.radians(graph.node_lon[key_nodes]).tolist()
+
+    def _slots(self, wi):
+        return self.way_slots[self.way_offsets[wi]:self.way_offsets[wi + 1]].tolist()
+
+    def _slot_info(self, slot):
+        """槽位 → (边, 槽位起点累计长度, 槽位终点累计长度)"""
+        e = int(np.searchsorted(self.edge_offsets, slot, side='right')) - 1
+        c1 = float(self.edge_cum[slot])
+        c0 = float(self.edge_cum[slot - 1]) if slot > self.edge_offsets[e] else 0.0
+        return e, c0, c1
+
+    def _target_bound(self, wi):
+        """目标way外包框中心和覆盖半径，用于启发函数"""
+        coords = np.array(self.graph.way_coords(int(self.graph.way_ids[wi])))
+        if not len(coords):
+            return None
+        lat0, lon0 = (coords.min(axis=0) + coords.max(axis=0)) / 2
+        radius = float(haversine(lat0, lon0, coords[:, 0], coords[:, 1]).max())
+        return float(lat0), float(lon0), radius
+
+    def route(self, from_way_id, to_way_id):
+        """
+        两条way之间沿轨道的最短路径
+        :return: (way id 列表(含首尾), 距离米)；不连通时返回 None
+        """
+        g = self.graph
+        fw, tw = g.way_index(from_way_id), g.way_index(to_way_id)
+        if fw < 0 or tw < 0:
+            raise KeyError(from_way_id if fw < 0 else to_way_id)
+        if fw == tw:
+            return [int(from_way_id)], 0.0
+        src, dst = self._slots(fw), self._slots(tw)
+        if not src or not dst:
+            return None
+
+        best, best_end = math.inf, None
+        # 目标way所在的边：从边的哪一端进入、还要走多远
+        exits = {}
+        for t in dst:
+            e, c0, c1 = self._slot_info(t)
+            exits.setdefault(int(self.edge_u[e]), []).append((c0, t, 'u'))
+            exits.setdefault(int(self.edge_v[e]), []).append((float(self.edge_len[e]) - c1, t, 'v'))
+        for s in src:
+            es, s0, s1 = self._slot_info(s)
+            for t in dst:
+                et, t0, t1 = self._slot_info(t)
+                if es == et:
+                    cost = t0 - s1 if s < t else s0 - t1
+                    if cost < best:
+                        best, best_end = cost, ('direct', s, t)
+
+        bound = self._target_bound(tw)
+        key_lat, key_lon = self._key_lat, self._key_lon
+        if bound is None:
+            def h(k):
+                return 0.0
+        else:
+            lat0, lon0, radius = math.radians(bound[0]), math.radians(bound[1]), bound[2]
+            cos0 = math.cos(lat0)
+            def h(k):
+                # 到目标way外包圆的球面距离，是剩余路程的下界；缺坐标的关键点返回0
+                a = math.sin((key_lat[k] - lat0) / 2) ** 2 + cos0 * math.cos(key_lat[k]) * math.sin((key_lon[k] - lon0) / 2) ** 2
+                d = 2 * EARTH_R * math.asin(math.sqrt(min(a, 1.0))) - radius
+                return d if d > 0 else 0.0
+
+        dist, prev, heap = {}, {}, []
+        for s in src:
+            e, c0, c1 = self._slot_info(s)
+            for k, cost, side in ((int(self.edge_u[e]), c0, 'u'), (int(self.edge_v[e]), float(self.edge_len[e]) - c1, 'v')):
+                if cost < dist.get(k, math.inf):
+                    dist[k] = cost
+                    prev[k] = ('src', s, side)
+                    heapq.heappush(heap, (cost + h(k), cost, k))
+        adj_offsets, adj_edge = self._adj_offsets, self._adj_edge
+        edge_u, edge_v, edge_len = self._edge_u, self._edge_v, self._edge_len
+        closed = set()
+        while heap:
+            f, gk, k = heapq.heappop(heap)
+            if f >= best:
+                break
+            if k in closed or gk > dist[k]:
+                continue
+            closed.add(k)
+            for cost, t, side in exits.get(k, ()):
+                if gk + cost < best:
+                    best, best_end = gk + cost, ('key', k, t, side)
+            for j in range(adj_offsets[k], adj_offsets[k + 1]):
+                e = adj_edge[j]
+                nb = edge_v[e] if edge_u[e] == k else edge_u[e]
+                ng = gk + edge_len[e]
+                if ng < dist.get(nb, math.inf):
+                    dist[nb] = ng
+                    prev[nb] = (k, e)
+                    heapq.heappush(heap, (ng + h(nb), ng, nb))
+        if best_end is None:
+            return None
+        return self._ways(best_end, prev), best
+
+    def _edge_slots(self, e, from_key):
+        start, end = int(self.edge_offsets[e]), int(self.edge_offsets[e + 1])
+        if self.edge_u[e] == from_key:
+            return list(range(start, end))
+        return list(range(end - 1, start - 1, -1))
+
+    def _ways(self, best_end, prev):
+        """由终点回溯出依次经过的way id"""
+        if best_end[0] == 'direct':
+            _, s, t = best_end
+            slots = list(range(s, t + 1)) if s < t else list(range(s, t - 1, -1))
+        else:
+            _, k, t, side = best_end
+            e, _, _ = self._slot_info(t)
+            start, end = int(self.edge_offsets[e]), int(self.edge_offsets[e + 1])
+            slots = list(range(start, t + 1)) if side == 'u' else list(range(end - 1, t - 1, -1))
+            while True:
+                p = prev[k]
+                if p[0] == 'src':
+                    _, s, side = p
+                    e, _, _ = self._slot_info(s)
+                    start, end = int(self.edge_offsets[e]), int(self.edge_offsets[e + 1])
+                    # 从起点way走到边端点的部分
+                    part = list(range(s, start - 1, -1)) if side == 'u' else list(range(s, end))
+                    slots = part + slots
+                    break
+                k_prev, e = p
+                slots = self._edge_slots(e, k_prev) + slots
+                k = k_prev
+        ways = []
+        for w in self.edge_ways[slots].tolist():
+            if not ways or ways[-1] != w:
+                ways.append(w)
+        return self.graph.way_ids[ways].tolist()
@@ -0,0 +1,122 @@
+"""
+way 折线的多级简化(level of detail)
+
+建索引时对每条way跑一遍 Douglas-Peucker，记录每个点"在多大容差下仍被保留":
+- way_node_tol: 与 way_node_idx 对齐的 float32，单位米；首尾点为 inf，缺坐标的点为 -1
+
+按容差 t 简化时只保留 way_node_tol >= t 的点，得到的就是容差为 t 的 Douglas-Peucker 结果，
+所以一个数组就能提供任意级别的简化，不必为每一级单独存一份坐标。
+"""
+import math
+
+import numpy as np
+
+from geo import DEG_M
+
+LOD_ARRAYS = ['way_node_tol']
+# 偏差小于此值(米)的点一次性处理，避免长直线上逐点拆分
+MIN_TOL = 0.5
+# 地图缩放级别 → 容差：Web 墨卡托下每像素对应的米数(赤道处) * LOD_PIXELS
+METERS_PER_PIXEL_Z0 = 156543.03
+LOD_PIXELS = 1.0
+MAX_ZOOM = 18
+
+
+def tolerance_for_zoom(zoom):
+    """缩放级别对应的简化容差(米)，达到 MAX_ZOOM 时不简化"""
+    zoom = int(zoom)
+    if zoom >= MAX_ZOOM:
+        return 0.0
+    return METERS_PER_PIXEL_Z0 / 2 ** max(zoom, 0) * LOD_PIXELS
+
+
+def snap_tolerance(tolerance):
+    """
+    任意容差(米)取整到不超过它的缩放级别容差(tolerance_for_zoom 的取值之一)，比最细一级还小时为 0。
+    坐标缓存按容差分别保存，取整后不同的请求值最多对应 MAX_ZOOM 种容差
+    """
+    if not tolerance > 0:
+        return 0.0
+    zoom = max(math.ceil(math.log2(METERS_PER_PIXEL_Z0 * LOD_PIXELS / tolerance)), 0)
+    while zoom < MAX_ZOOM and tolerance_for_zoom(zoom) > tolerance:
+        zoom += 1
+    return tolerance_for_zoom(zoom)
+
+
+def build_lod_arrays(arrays):
+    """
+    由CSR图计算每个点的保留容差。
+    所有way一起按层推进：每轮为每个待拆分区段找出偏差最大的点，作为新端点把区段一分为二
+    """
+    offsets = arrays['way_node_offsets']
+    idx = arrays['way_node_idx']
+    lat_all = arrays['node_lat'][idx]
+    lon_all = arrays['node_lon'][idx]
+    tol_all = np.full(len(idx), -1.0, dtype=np.float64)
+
+    valid = ~np.isnan(lat_all)
+    pos = np.nonzero(valid)[0]  # 有坐标的点在 way_node_idx 中的位置
+    if not len(pos):
+        return {'way_node_tol': tol_all.astype(np.float32)}
+    owner = np.searchsorted(offsets, pos, side='right') - 1
+    lat = lat_all[pos]
+    lon = lon_all[pos]
+    n = len(pos)
+    # 每条way内的局部等距投影
+    first = np.ones(n, dtype=bool)
+    first[1:] = owner[1:] != owner[:-1]
+    last = np.ones(n, dtype=bool)
+    last[:-1] = owner[1:] != owner[:-1]
+    way_start = np.nonzero(first)[0]
+    way_end = np.nonzero(last)[0]
+    kx = DEG_M * np.cos(np.radians(np.repeat(lat[way_start], way_end - way_start + 1)))
+    x = lon * kx
+    y = lat * DEG_M
+
+    tol = np.zeros(n)
+    tol[first | last] = np.inf
+    # 每个点当前所在区段的左右端点及区段的容差上限
+    left = np.repeat(way_start, way_end - way_start + 1)
+    right = np.repeat(way_end, way_end - way_start + 1)
+    seg_tol = np.full(n, np.inf)
+    active = np.nonzero(~(first | last))[0]
+    while len(active):
+        l, r = left[active], right[active]
+        ax, ay = x[l], y[l]
+        dx, dy = x[r] - ax, y[r] - ay
+        px, py = x[active] - ax, y[active] - ay
+        seg_len = np.hypot(dx, dy)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            d = np.where(seg_len > 0, np.abs(px * dy - py * dx) / seg_len, np.hypot(px, py))
+        # active 中同一区段的点是连续的
+        run_start = np.ones(len(active), dtype=bool)
+        run_start[1:] = l[1:] != l[:-1]
+        starts = np.nonzero(run_start)[0]
+        run = np.cumsum(run_start) - 1
+        run_max = np.maximum.reduceat(d, starts)
+        cand = np.where(d == run_max[run], np.arange(len(active)), len(active))
+        split = np.minimum.reduceat(cand, starts)
+        # 偏差都很小的区段整段结束
+        small = run_max <= MIN_TOL
+        done = small[run]
+        tol[active[done]] = np.minimum(d[done], seg_tol[active[done]])
+        split = split[~small]
+        k = active[split]
+        tol[k] = np.minimum(d[split], seg_tol[k])
+        # 拆分：区段内 k 左侧的点右端点改为 k，右侧的点左端点改为 k
+        run_k = np.full(len(starts), -1)
+        run_k[~small] = k
+        k_of = run_k[run]
+        keep = ~done
+        keep[split] = False
+        rest = active[keep]
+        if len(rest):
+            kr = k_of[keep]
+            before = rest < kr
+            right[rest[before]] = kr[before]
+            left[rest[~before]] = kr[~before]
+            seg_tol[rest] = tol[kr]
+        active = rest
+    tol_all[pos] = tol
+    return {'way_node_tol': tol_all.astype(np.float32)}
+
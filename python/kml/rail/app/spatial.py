@@ -0,0 +1,215 @@
+"""
+铁路way的空间索引
+
+建索引时把每条way的外包框登记到均匀网格(默认0.05°)中，保存为CSR数组:
+- way_bbox:              每条way的外包框 [min_lat, min_lon, max_lat, max_lon]
+- grid_cells:            有way经过的网格编号(排序)，编号 = 行 * 列数 + 列
+- grid_offsets/grid_ways: 网格 → way 下标
+- grid_meta:             [起点纬度, 起点经度, 网格边长(度), 列数]
+
+最近way查询从点所在网格向外逐圈扩展，已找到的第k近距离小于未搜索区域的最小可能距离时停止，
+只搜索有数据的网格范围。
+"""
+import math
+
+import numpy as np
+
+from geo import DEG_M
+
+CELL_DEG = 0.05
+SPATIAL_ARRAYS = ['way_bbox', 'grid_cells', 'grid_offsets', 'grid_ways', 'grid_meta']
+
+
+def build_spatial_arrays(arrays, cell_deg=CELL_DEG):
+    """由CSR图计算空间索引数组"""
+    offsets = arrays['way_node_offsets']
+    lat = arrays['node_lat'][arrays['way_node_idx']]
+    lon = arrays['node_lon'][arrays['way_node_idx']]
+    way_count = len(offsets) - 1
+    bbox = np.full((way_count, 4), np.nan)
+    nonempty = np.diff(offsets) > 0
+    if len(lat):
+        starts = offsets[:-1][nonempty]
+        bbox[nonempty, 0] = np.fmin.reduceat(lat, starts)
+        bbox[nonempty, 1] = np.fmin.reduceat(lon, starts)
+        bbox[nonempty, 2] = np.fmax.reduceat(lat, starts)
+        bbox[nonempty, 3] = np.fmax.reduceat(lon, starts)
+
+    ways = np.nonzero(~np.isnan(bbox[:, 0]))[0]
+    if len(ways):
+        origin_lat = math.floor(np.nanmin(bbox[:, 0]) / cell_deg) * cell_deg
+        origin_lon = math.floor(np.nanmin(bbox[:, 1]) / cell_deg) * cell_deg
+    else:
+        origin_lat = origin_lon = 0.0
+    r0 = np.floor((bbox[ways, 0] - origin_lat) / cell_deg).astype(np.int64)
+    c0 = np.floor((bbox[ways, 1] - origin_lon) / cell_deg).astype(np.int64)
+    r1 = np.floor((bbox[ways, 2] - origin_lat) / cell_deg).astype(np.int64)
+    c1 = np.floor((bbox[ways, 3] - origin_lon) / cell_deg).astype(np.int64)
+    ncols = int(c1.max()) + 1 if len(ways) else 1
+
+    # 每条way登记到外包框覆盖的全部网格
+    nc = c1 - c0 + 1
+    count = (r1 - r0 + 1) * nc
+    k = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+    rows = np.repeat(r0, count) + k // np.repeat(nc, count)
+    cols = np.repeat(c0, count) + k % np.repeat(nc, count)
+    keys = rows * ncols + cols
+    way_rep = np.repeat(ways, count)
+    order = np.lexsort((way_rep, keys))
+    keys = keys[order]
+    cells, starts = np.unique(keys, return_index=True)
+    grid_offsets = np.append(starts, len(keys)).astype(np.int64)
+    return {
+        'way_bbox': bbox,
+        'grid_cells': cells,
+        'grid_offsets': grid_offsets,
+        'grid_ways': way_rep[order].astype(np.int32),
+        'grid_meta': np.array([origin_lat, origin_lon, cell_deg, ncols], dtype=np.float64),
+    }
+
+
+class SpatialIndex:
+    """基于 RailGraph 中空间索引数组的查询"""
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.bbox = graph.arrays['way_bbox']
+        self.cells = graph.arrays['grid_cells']
+        self.offsets = graph.arrays['grid_offsets']
+        self.ways = graph.arrays['grid_ways']
+        origin_lat, origin_lon, cell, ncols = graph.arrays['grid_meta'].tolist()
+        self.origin_lat = origin_lat
+        self.origin_lon = origin_lon
+        self.cell = cell
+        self.ncols = int(ncols)
+        # 有数据的网格所在的行列范围，最近way查询不搜索范围以外的网格
+        rows, cols = np.divmod(self.cells, self.ncols)
+        self.extent = (int(rows.min()), int(rows.max()), int(cols.min()), int(cols.max())) if len(self.cells) else None
+
+    def _cell_of(self, lat, lon):
+        return (math.floor((lat - self.origin_lat) / self.cell),
+                math.floor((lon - self.origin_lon) / self.cell))
+
+    def _ways_in_cells(self, rows, cols):
+        """给定网格行列，返回登记在其中的way下标(可能重复)"""
+        ok = (cols >= 0) & (cols < self.ncols) & (rows >= 0)
+        keys = rows[ok] * self.ncols + cols[ok]
+        pos = np.searchsorted(self.cells, keys)
+        pos[pos >= len(self.cells)] = 0
+        pos = pos[self.cells[pos] == keys] if len(self.cells) else pos[:0]
+        if not len(pos):
+            return np.empty(0, dtype=np.int32)
+        return np.concatenate([self.ways[self.offsets[p]:self.offsets[p + 1]] for p in pos.tolist()])
+
+    def bbox_ways(self, min_lat, min_lon, max_lat, max_lon, limit=None):
+        """外包框与查询范围相交的way id(按id排序)"""
+        hit = self.bbox_way_indices(min_lat, min_lon, max_lat, max_lon)
+        if limit is not None:
+            hit = hit[:limit]
+        return self.graph.way_ids[hit].tolist()
+
+    def bbox_way_indices(self, min_lat, min_lon, max_lat, max_lon):
+        """外包框与查询范围相交的way下标(升序)"""
+        r0, c0 = self._cell_of(min_lat, min_lon)
+        r1, c1 = self._cell_of(max_lat, max_lon)
+        r0, c0 = max(r0, 0), max(c0, 0)
+        c1 = min(c1, self.ncols - 1)
+        if r1 < r0 or c1 < c0:
+            return np.empty(0, dtype=np.int32)
+        if (r1 - r0 + 1) * (c1 - c0 + 1) > len(self.cells):
+            # 范围很大时直接筛选有数据的网格
+            rows, cols = np.divmod(self.cells, self.ncols)
+            hit = np.nonzero((rows >= r0) & (rows <= r1) & (cols >= c0) & (cols <= c1))[0]
+            parts = [self.ways[self.offsets[p]:self.offsets[p + 1]] for p in hit.tolist()]
+            candidates = np.concatenate(parts) if parts else np.empty(0, dtype=np.int32)
+        else:
+            rows, cols = np.meshgrid(np.arange(r0, r1 + 1), np.arange(c0, c1 + 1), indexing='ij')
+            candidates = self._ways_in_cells(rows.ravel(), cols.ravel())
+        candidates = np.unique(candidates)
+        b = self.bbox[candidates]
+        return candidates[(b[:, 0] <= max_lat) & (b[:, 2] >= min_lat) & (b[:, 1] <= max_lon) & (b[:, 3] >= min_lon)]
+
+    def _distances(self, candidates, lat, lon):
+        """点到各候选way折线的距离(米，局部等距投影)"""
+        g = self.graph
+        starts = g.way_node_offsets[candidates]
+        lengths = g.way_node_offsets[candidates + 1] - starts
+        owner = np.repeat(np.arange(len(candidates)), lengths)
+        first = np.repeat(np.cumsum(lengths) - lengths, lengths)
+        idx = g.way_node_idx[np.repeat(starts, lengths) + (np.arange(len(owner)) - first)]
+        kx = DEG_M * math.cos(math.radians(lat))
+        x = (g.node_lon[idx] - lon) * kx
+        y = (g.node_lat[idx] - lat) * DEG_M
+        best = np.full(len(candidates), np.inf)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            d = np.hypot(x, y)
+            ok = ~np.isnan(d)
+            np.minimum.at(best, owner[ok], d[ok])
+            same = owner[1:] == owner[:-1]
+            ax, ay, bx, by = x[:-1], y[:-1], x[1:], y[1:]
+            dx, dy = bx - ax, by - ay
+            t = np.clip(-(ax * dx + ay * dy) / (dx * dx + dy * dy), 0, 1)
+            d = np.hypot(ax + t * dx, ay + t * dy)
+            ok = same & ~np.isnan(d)
+            np.minimum.at(best, owner[:-1][ok], d[ok])
+        return best
+
+    @staticmethod
+    def _ring(pr, pc, r, r0, r1, c0, c1):
+        """以(pr, pc)为中心的第r圈网格中落在行[r0, r1]、列[c0, c1]内的部分"""
+        cols = np.arange(max(pc - r, c0), min(pc + r, c1) + 1)
+        side = np.arange(max(pr - r + 1, r0), min(pr + r - 1, r1) + 1)
+        rows_parts, cols_parts = [], []
+        for row in {pr - r, pr + r}:
+            if r0 <= row <= r1:
+                rows_parts.append(np.full(len(cols), row))
+                cols_parts.append(cols)
+        for col in {pc - r, pc + r} if r else ():
+            if c0 <= col <= c1:
+                rows_parts.append(side)
+                cols_parts.append(np.full(len(side), col))
+        if not rows_parts:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(rows_parts), np.concatenate(cols_parts)
+
+    def nearest(self, lat, lon, k=1, max_radius_m=50000):
+        """
+        距离点最近的k条way
+        搜索的圈数不超过有数据的网格范围：纬度方向超出 max_radius_m 的行不搜索，
+        圈完全落在有数据的网格以外时停止，高纬度时每圈对应的距离很小也不会无限扩展
+        :return: [(way_id, 距离米), ...]，按距离升序
+        """
+        if self.extent is None:
+            return []
+        pr, pc = self._cell_of(lat, lon)
+        row_span = math.ceil(max_radius_m / (self.cell * DEG_M))
+        r0, r1, c0, c1 = self.extent
+        r0, r1 = max(r0, pr - row_span), min(r1, pr + row_span)
+        if r0 > r1:
+            return []
+        ring_m = self.cell * DEG_M * max(math.cos(math.radians(lat)), 1e-6)
+        # 第first圈之前的圈与搜索范围不相交，第last圈之后的圈完全在搜索范围以外
+        first = max(r0 - pr, pr - r1, c0 - pc, pc - c1, 0)
+        last = min(max(pr - r0, r1 - pr, pc - c0, c1 - pc), max(1, math.ceil(max_radius_m / ring_m)))
+        seen = np.zeros(len(self.bbox), dtype=bool)
+        found_ways = []
+        found_dist = []
+        for r in range(first, last + 1):
+            rows, cols = self._ring(pr, pc, r, r0, r1, c0, c1)
+            candidates = np.unique(self._ways_in_cells(rows, cols))
+            candidates = candidates[~seen[candidates]]
+            if len(candidates):
+                seen[candidates] = True
+                found_ways.append(candidates)
+                found_dist.append(self._distances(candidates, lat, lon))
+            if found_ways:
+                dist = np.concatenate(found_dist)
+                if len(dist) >= k and np.partition(dist, k - 1)[k - 1] <= r * ring_m:
+                    break
+        if not found_ways:
+            return []
+        ways = np.concatenate(found_ways)
+        dist = np.concatenate(found_dist)
+        order = np.argsort(dist, kind='stable')[:k]
+        order = order[dist[order] <= max_radius_m]
+        return list(zip(self.graph.way_ids[ways[order]].tolist(), dist[order].tolist()))
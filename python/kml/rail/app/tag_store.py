@@ -0,0 +1,150 @@
+"""
+way 标签的列式存储
+
+原来每条way的元数据是一个完整的 dict(含 tags 字典)，整体 pickle 保存、首次使用时全部反序列化；
+railway=rail、gauge=1435、electrified=contact_line 这类键和值在几十万条way里重复出现。
+这里把标签的键和值去重成一张字符串表，每条way的标签只存编号:
+- tag_strings:                   去重后的字符串表，UTF-8 编码、以 \\0 分隔(uint8)
+- way_tag_offsets:               每条way的标签在下面两个数组中的起止位置(CSR)
+- way_tag_keys / way_tag_values: 标签键、值在字符串表中的编号(int32)
+
+数组同样 mmap 映射，常驻内存的只有解码后的字符串表；需要时才把某条way的标签解码成 dict。
+"""
+from array import array
+
+import numpy as np
+
+TAG_ARRAYS = ['tag_strings', 'way_tag_offsets', 'way_tag_keys', 'way_tag_values']
+# 元数据中由标签派生的字段
+META_FIELDS = ('name', 'ref', 'operator')
+
+
+class TagTable:
+    """建索引时逐条way收集标签，字符串去重编号"""
+
+    def __init__(self):
+        self.strings = []
+        self._ids = {}
+        self.keys = array('i')
+        self.values = array('i')
+        self.counts = array('q')
+
+    def __len__(self):
+        return len(self.counts)
+
+    def intern(self, text):
+        i = self._ids.get(text)
+        if i is None:
+            i = self._ids[text] = len(self.strings)
+            self.strings.append(text.replace('\0', ''))  # \0 是字符串表的分隔符
+        return i
+
+    def append(self, tags):
+        """
+        追加一条way的标签
+        :param tags: dict 或 (键, 值) 序列
+        """
+        n = len(self.keys)
+        for key, value in (tags.items() if hasattr(tags, 'items') else tags):
+            self.keys.append(self.intern(key))
+            self.values.append(self.intern(value))
+        self.counts.append(len(self.keys) - n)
+
+    def extend(self, other):
+        """追加另一张表的全部way(并行解析时合并各数据块的结果)"""
+        remap = np.array([self.intern(s) for s in other.strings], dtype=np.int32)
+        if len(other.keys):
+            self.keys.extend(array('i', remap[np.frombuffer(other.keys, dtype=np.int32)].tobytes()))
+            self.values.extend(array('i', remap[np.frombuffer(other.values, dtype=np.int32)].tobytes()))
+        self.counts.extend(other.counts)
+
+    @classmethod
+    def from_metas(cls, metas):
+        """由旧版元数据字典列表({'tags': {...}, ...})转换"""
+        table = cls()
+        for meta in metas:
+            table.append(meta.get('tags') or {})
+        return table
+
+    @classmethod
+    def from_store(cls, store, rows):
+        """取 TagStore 中的部分way(按 rows 顺序)，字符串表原样沿用"""
+        from rail_store import csr_reorder  # rail_store 依赖本模块，在这里导入避免循环
+        table = cls()
+        table.strings = list(store.strings)
+        table._ids = {s: i for i, s in enumerate(table.strings)}
+        rows = np.asarray(rows, dtype=np.int64)
+        offsets = np.asarray(store.offsets)
+        new_offsets, keys = csr_reorder(offsets, np.asarray(store.keys), rows)
+        _, values = csr_reorder(offsets, np.asarray(store.values), rows)
+        table.keys = array('i', keys.astype(np.int32).tobytes())
+        table.values = array('i', values.astype(np.int32).tobytes())
+        table.counts = array('q', np.diff(new_offsets).tobytes())
+        return table
+
+    def to_arrays(self, order=None):
+        """
+        转为 TAG_ARRAYS 数组
+        :param order: way 的新顺序(build_graph_arrays 返回的排序下标)，None 为原顺序
+        """
+        from rail_store import csr_reorder
+        offsets = np.zeros(len(self.counts) + 1, dtype=np.int64)
+        np.cumsum(np.frombuffer(self.counts, dtype=np.int64), out=offsets[1:])
+        keys = np.frombuffer(self.keys, dtype=np.int32)
+        values = np.frombuffer(self.values, dtype=np.int32)
+        if order is not None:
+            _, keys = csr_reorder(offsets, keys, order)
+            offsets, values = csr_reorder(offsets, values, order)
+        blob = '\0'.join(self.strings).encode('utf-8')
+        return {
+            'tag_strings': np.frombuffer(blob, dtype=np.uint8),
+            'way_tag_offsets': offsets,
+            'way_tag_keys': keys.astype(np.int32),
+            'way_tag_values': values.astype(np.int32),
+        }
+
+
+class TagStore:
+    """按way下标读取标签，字符串表在第一次使用时解码"""
+
+    def __init__(self, arrays):
+        self.offsets = arrays['way_tag_offsets']
+        self.keys = arrays['way_tag_keys']
+        self.values = arrays['way_tag_values']
+        self._blob = arrays['tag_strings']
+        self._strings = None
+        self._key_ids = None
+
+    @property
+    def strings(self):
+        if self._strings is None:
+            self._strings = self._blob.tobytes().decode('utf-8').split('\0') if len(self._blob) else ['']
+        return self._strings
+
+    def _key_id(self, key):
+        if self._key_ids is None:
+            strings = self.strings
+            self._key_ids = {strings[i]: i for i in np.unique(self.keys).tolist()}
+        return self._key_ids.get(key, -1)
+
+    def tags(self, wi, keys=None):
+        """
+        第 wi 条way的标签 dict
+        :param keys: 只取这些键，None 为全部
+        """
+        strings = self.strings
+        start, end = int(self.offsets[wi]), int(self.offsets[wi + 1])
+        pairs = zip(self.keys[start:end].tolist(), self.values[start:end].tolist())
+        if keys is None:
+            return {strings[k]: strings[v] for k, v in pairs}
+        wanted = {self._key_id(key) for key in keys}
+        return {strings[k]: strings[v] for k, v in pairs if k in wanted}
+
+    def meta(self, wi, way_id):
+        """元数据 {'id', 'name', 'ref', 'operator', 'tags'}"""
+        tags = self.tags(wi)
+        meta = {'id': way_id}
+        for field in META_FIELDS:
+            meta[field] = tags.get(field)
+        meta['tags'] = tags
+        return meta
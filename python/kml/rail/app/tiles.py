@@ -0,0 +1,289 @@
+"""
+铁路网的矢量瓦片(Mapbox Vector Tile)
+
+/tiles/{z}/{x}/{y}.mvt 由索引直接生成，前端用作全网底图：
+- 用空间索引取出与瓦片相交的way，按缩放级别取简化后的折线(见 simplify.py)
+- 坐标投影到瓦片坐标系(extent 4096)，只保留与瓦片(含缓冲区)相交的线段
+- 图层名 rail，要素 id 为 way id，属性 id/name/ref/railway
+- MVT 的 protobuf 编码很简单，这里直接手写，不依赖第三方库
+
+瓦片缓存在磁盘上，按加载索引时 manifest 记录的 generation 分代，重建索引后自动失效。
+也可以提前生成:
+    python3 tiles.py --min-zoom 5 --max-zoom 10
+"""
+import argparse
+import math
+import os
+import shutil
+import struct
+import threading
+
+import numpy as np
+
+from simplify import tolerance_for_zoom
+
+EXTENT = 4096
+BUFFER = 64  # 瓦片外缓冲区(瓦片坐标单位)，避免线宽在瓦片边缘被截断
+LAYER_NAME = 'rail'
+MIN_ZOOM = 4
+MAX_ZOOM = 18
+PIXEL = EXTENT // 256  # 一个屏幕像素对应的瓦片坐标单位
+SNAP_ZOOM = 12  # 低于此级别时坐标对齐到整像素
+TILE_TAGS = ('name', 'ref', 'railway')
+
+CMD_MOVE_TO, CMD_LINE_TO = 1, 2
+GEOM_LINESTRING = 2
+
+
+# ---------- protobuf 编码 ----------
+def _varint(value):
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def _field(number, wire_type, payload):
+    """wire_type 0 时 payload 为整数，2 时为字节串"""
+    key = _varint((number << 3) | wire_type)
+    if wire_type == 0:
+        return key + _varint(payload)
+    return key + _varint(len(payload)) + payload
+
+
+def _packed(number, values):
+    return _field(number, 2, b''.join(_varint(v) for v in values))
+
+
+def _encode_value(value):
+    if isinstance(value, bool):
+        return _field(7, 0, int(value))
+    if isinstance(value, int):
+        return _field(5, 0, value) if value >= 0 else _field(6, 0, _zigzag(value))
+    if isinstance(value, float):
+        return _varint((3 << 3) | 1) + struct.pack('<d', value)
+    return _field(1, 2, str(value).encode('utf-8'))
+
+
+def _line_geometry(parts):
+    """多段折线 → MVT 几何命令序列，parts 中每段是 [(x, y), ...] 整数坐标"""
+    cmds = []
+    cx = cy = 0
+    for part in parts:
+        x, y = part[0]
+        cmds += [CMD_MOVE_TO | (1 << 3), _zigzag(x - cx), _zigzag(y - cy)]
+        cx, cy = x, y
+        cmds.append(CMD_LINE_TO | ((len(part) - 1) << 3))
+        for x, y in part[1:]:
+            cmds += [_zigzag(x - cx), _zigzag(y - cy)]
+            cx, cy = x, y
+    return cmds
+
+
+def encode_tile(features, layer_name=LAYER_NAME, extent=EXTENT):
+    """
+    编码单图层的线要素瓦片
+    :param features: [(要素id, {属性}, [折线, ...]), ...]
+    :return: MVT 字节串，没有要素时为空字节串
+    """
+    if not features:
+        return b''
+    keys, values = {}, {}
+    body = []
+    for feature_id, props, parts in features:
+        tags = []
+        for k, v in props.items():
+            if v is None:
+                continue
+            tags.append(keys.setdefault(k, len(keys)))
+            tags.append(values.setdefault((type(v), v), len(values)))
+        feature = (_field(1, 0, feature_id) + _packed(2, tags)
+                   + _field(3, 0, GEOM_LINESTRING) + _packed(4, _line_geometry(parts)))
+        body.append(_field(2, 2, feature))
+    layer = [_field(15, 0, 2), _field(1, 2, layer_name.encode('utf-8'))]
+    layer += body
+    layer += [_field(3, 2, k.encode('utf-8')) for k in keys]
+    layer += [_field(4, 2, _encode_value(v)) for _, v in values]
+    layer.append(_field(5, 0, extent))
+    return _field(3, 2, b''.join(layer))
+
+
+# ---------- 瓦片坐标 ----------
+def tile_bounds(z, x, y):
+    """瓦片的经纬度范围 (min_lat, min_lon, max_lat, max_lon)"""
+    n = 2 ** z
+    def lat_of(ty):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * ty / n))))
+    return lat_of(y + 1), x / n * 360 - 180, lat_of(y), (x + 1) / n * 360 - 180
+
+
+def lonlat_to_tile(lat, lon, z):
+    """经纬度数组 → 全局瓦片坐标(以瓦片为单位的浮点数)"""
+    n = 2 ** z
+    lat = np.clip(lat, -85.0511, 85.0511)
+    tx = (lon + 180) / 360 * n
+    ty = (1 - np.log(np.tan(np.radians(lat)) + 1 / np.cos(np.radians(lat))) / math.pi) / 2 * n
+    return tx, ty
+
+
+def _clip_parts(px, py, lo, hi):
+    """保留与 [lo, hi] 方框相交的线段，拆成若干段并去掉相邻重复点"""
+    if len(px) < 2:
+        return []
+    seg_ok = ~(((px[:-1] < lo) & (px[1:] < lo)) | ((px[:-1] > hi) & (px[1:] > hi))
+               | ((py[:-1] < lo) & (py[1:] < lo)) | ((py[:-1] > hi) & (py[1:] > hi)))
+    parts = []
+    i = 0
+    n = len(seg_ok)
+    while i < n:
+        if not seg_ok[i]:
+            i += 1
+            continue
+        j = i
+        while j < n and seg_ok[j]:
+            j += 1
+        part = []
+        for x, y in zip(px[i:j + 1].tolist(), py[i:j + 1].tolist()):
+            if not part or part[-1] != (x, y):
+                part.append((x, y))
+        if len(part) >= 2:
+            parts.append(part)
+        i = j
+    return parts
+
+
+class TileRenderer:
+    """由 RailGraph/SpatialIndex 生成矢量瓦片，可选磁盘缓存"""
+
+    def __init__(self, graph, spatial, cache_dir=None):
+        self.graph = graph
+        self.spatial = spatial
+        self.cache_dir = None
+        if cache_dir:
+            self.cache_dir = os.path.join(cache_dir, graph.generation)
+            self._drop_old_generations(cache_dir)
+
+    def _drop_old_generations(self, cache_dir):
+        try:
+            names = os.listdir(cache_dir)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(cache_dir, name)
+            if path != self.cache_dir and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _cache_path(self, z, x, y):
+        return os.path.join(self.cache_dir, str(z), str(x), f'{y}.mvt')
+
+    def tile(self, z, x, y):
+        """取瓦片，命中磁盘缓存时直接读取"""
+        if self.cache_dir is None:
+            return self.render(z, x, y)
+        path = self._cache_path(z, x, y)
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            pass
+        data = self.render(z, x, y)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        return data
+
+    def render(self, z, x, y):
+        """生成瓦片，不读写缓存"""
+        if z < MIN_ZOOM:
+            return b''
+        min_lat, min_lon, max_lat, max_lon = tile_bounds(z, x, y)
+        pad_lat = (max_lat - min_lat) * BUFFER / EXTENT
+        pad_lon = (max_lon - min_lon) * BUFFER / EXTENT
+        ways = self.spatial.bbox_way_indices(min_lat - pad_lat, min_lon - pad_lon,
+                                             max_lat + pad_lat, max_lon + pad_lon)
+        if not len(ways):
+            return b''
+        g = self.graph
+        # 一次取出全部候选way的点，按缩放级别筛掉简化掉的点
+        starts = g.way_node_offsets[ways]
+        lengths = g.way_node_offsets[ways + 1] - starts
+        pos = np.repeat(starts, lengths) + (np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths))
+        owner = np.repeat(np.arange(len(ways)), lengths)
+        tolerance = tolerance_for_zoom(z)
+        if g.way_node_tol is not None and tolerance > 0:
+            keep = g.way_node_tol[pos] >= tolerance
+        else:
+            keep = ~np.isnan(g.node_lat[g.way_node_idx[pos]])
+        pos, owner = pos[keep], owner[keep]
+        idx = g.way_node_idx[pos]
+        tx, ty = lonlat_to_tile(g.node_lat[idx], g.node_lon[idx], z)
+        # 低缩放级别下对齐到整像素：共享node落在同一像素，不足一像素的way整条退化后丢弃，线路不会断开
+        snap = PIXEL if z < SNAP_ZOOM else 1
+        px = np.round((tx - x) * EXTENT / snap).astype(np.int64) * snap
+        py = np.round((ty - y) * EXTENT / snap).astype(np.int64) * snap
+        bounds = np.searchsorted(owner, np.arange(len(ways) + 1))
+        nonempty = bounds[1:] > bounds[:-1]
+        first = bounds[:-1][nonempty]
+        degenerate = np.zeros(len(ways), dtype=bool)
+        degenerate[nonempty] = ((np.minimum.reduceat(px, first) == np.maximum.reduceat(px, first))
+                                & (np.minimum.reduceat(py, first) == np.maximum.reduceat(py, first)))
+
+        features = []
+        for i in np.nonzero(nonempty & ~degenerate)[0].tolist():
+            wi = int(ways[i])
+            a, b = bounds[i], bounds[i + 1]
+            parts = _clip_parts(px[a:b], py[a:b], -BUFFER, EXTENT + BUFFER)
+            if not parts:
+                continue
+            way_id = int(g.way_ids[wi])
+            tags = g.way_tags(way_id, TILE_TAGS)
+            props = {'id': way_id}
+            props.update((k, tags.get(k)) for k in TILE_TAGS)
+            features.append((way_id, props, parts))
+        return encode_tile(features)
+
+    def tiles_with_data(self, z):
+        """缩放级别 z 下有轨道经过的瓦片 (x, y)，按way外包框估算"""
+        bbox = self.graph.arrays['way_bbox']
+        ok = ~np.isnan(bbox[:, 0])
+        x0, y1 = lonlat_to_tile(bbox[ok, 0], bbox[ok, 1], z)
+        x1, y0 = lonlat_to_tile(bbox[ok, 2], bbox[ok, 3], z)
+        n = 2 ** z
+        tiles = set()
+        for a, b, c, d in zip(np.floor(x0).astype(np.int64).tolist(), np.floor(x1).astype(np.int64).tolist(),
+                              np.floor(y0).astype(np.int64).tolist(), np.floor(y1).astype(np.int64).tolist()):
+            for tx in range(max(a, 0), min(b, n - 1) + 1):
+                for ty in range(max(c, 0), min(d, n - 1) + 1):
+                    tiles.add((tx, ty))
+        return sorted(tiles)
+
+
+def seed(renderer, min_zoom, max_zoom):
+    """预先生成并缓存各级瓦片"""
+    from tqdm import tqdm
+    for z in range(min_zoom, max_zoom + 1):
+        tiles = renderer.tiles_with_data(z)
+        for x, y in tqdm(tiles, desc=f'z{z}', unit='tile'):
+            renderer.tile(z, x, y)
+
+
+if __name__ == '__main__':
+    from rail_store import RailGraph
+    from spatial import SpatialIndex
+
+    parser = argparse.ArgumentParser(description='预先生成铁路矢量瓦片缓存')
+    parser.add_argument('--graph', default=os.path.join('data', 'graph'), help='索引目录')
+    parser.add_argument('--cache', default=os.path.join('data', 'tiles'), help='瓦片缓存目录')
+    parser.add_argument('--min-zoom', type=int, default=MIN_ZOOM)
+    parser.add_argument('--max-zoom', type=int, default=10)
+    args = parser.parse_args()
+    graph = RailGraph.load(args.graph)
+    seed(TileRenderer(graph, SpatialIndex(graph), args.cache), max(args.min_zoom, MIN_ZOOM), args.max_zoom)
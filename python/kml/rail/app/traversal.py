@@ -0,0 +1,67 @@
+"""
+铁路way的迭代遍历
+
+用显式栈/队列代替递归，不受Python递归深度限制；
+以生成器逐条产出结果，调用方可以边遍历边处理，也可以随时停止。
+"""
+from collections import deque
+
+
+def iter_connected_ways(neighbors, start_way_id, max_depth=None, max_ways=None, stop=None, order='dfs'):
+    """
+    从 start_way_id 出发遍历相连的way，逐条产出 (way_id, depth)，起点深度为1
+    :param neighbors: 函数 way_id → 相邻way id的可迭代对象
+    :param max_depth: 最大深度，None为不限
+    :param max_ways: 最多产出的way数，None为不限
+    :param stop: 谓词 stop(way_id, depth)，返回真时产出该way后立即结束遍历
+    :param order: 'dfs' 深度优先，同一way的邻居按 id 升序访问(结果与集合的迭代顺序无关，可复现)；'bfs' 按深度由浅到深
+    """
+    if order == 'bfs':
+        walker = _bfs(neighbors, start_way_id, max_depth)
+    elif order == 'dfs':
+        walker = _dfs(neighbors, start_way_id, max_depth)
+    else:
+        raise ValueError(f'未知的遍历顺序: {order}')
+    count = 0
+    for way_id, depth in walker:
+        yield way_id, depth
+        count += 1
+        if max_ways is not None and count >= max_ways:
+            return
+        if stop is not None and stop(way_id, depth):
+            return
+
+
+def _dfs(neighbors, start_way_id, max_depth):
+    # 栈中保存每层尚未展开的邻居迭代器，内存只与当前深度有关
+    visited = {start_way_id}
+    yield start_way_id, 1
+    stack = [iter(sorted(neighbors(start_way_id)))]
+    while stack:
+        depth = len(stack) + 1
+        for way_id in stack[-1]:
+            if way_id in visited:
+                continue
+            if max_depth is not None and depth > max_depth:
+                # 超过深度的way不标记为已访问，与递归版本一致
+                continue
+            visited.add(way_id)
+            yield way_id, depth
+            stack.append(iter(sorted(neighbors(way_id))))
+            break
+        else:
+            stack.pop()
+
+
+def _bfs(neighbors, start_way_id, max_depth):
+    visited = {start_way_id}
+    queue = deque([(start_way_id, 1)])
+    while queue:
+        way_id, depth = queue.popleft()
+        yield way_id, depth
+        if max_depth is not None and depth >= max_depth:
+            continue
+        for next_way in sorted(neighbors(way_id)):
+            if next_way not in visited:
+                visited.add(next_way)
+                queue.append((next_way, depth + 1))
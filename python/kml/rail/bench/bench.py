@@ -0,0 +1,283 @@
+"""
+铁路子系统性能测试
+
+在临时目录中生成合成网络(见 synth.py)或使用给定的 PBF，依次计时：
+索引构建(parse_osm.py)、索引加载、find_next_choices、find_connected_ways、
+经 Flask test client 的 /ways、/map、/geojson 请求，以及 RailExplorer 的两种加载方式。
+结果写成 JSON，可与其他提交的结果对比：
+
+    python3 bench.py --ways 20000 -o results/$(git rev-parse --short HEAD).json
+    python3 bench.py --diff results/old.json results/new.json
+
+--scaling 只测不同进程数(parse_osm.py -j)下的建索引耗时和加速比：
+
+    python3 bench.py --pbf china-latest.osm.pbf --scaling 1,4,8,16 --repeat 1 -o results/scaling.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(HERE, '..', 'app')
+CLIENT_DIR = os.path.join(HERE, '..', 'client')
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, CLIENT_DIR)
+sys.path.insert(0, HERE)
+
+import synth  # noqa: E402
+
+
+def summarize(samples):
+    """毫秒统计"""
+    samples = sorted(samples)
+    n = len(samples)
+    if not n:
+        return {'n': 0}
+    return {
+        'n': n,
+        'mean_ms': round(sum(samples) / n * 1000, 3),
+        'p50_ms': round(samples[n // 2] * 1000, 3),
+        'p95_ms': round(samples[min(n - 1, int(n * 0.95))] * 1000, 3),
+        'max_ms': round(samples[-1] * 1000, 3),
+    }
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+@contextlib.contextmanager
+def quiet():
+    """屏蔽被测代码的进度输出"""
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        yield
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=HERE, stderr=subprocess.DEVNULL,
+                                       text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_build(pbf, graph_dir, net, workers, repeat):
+    import parse_osm
+    samples = []
+    for _ in range(repeat):
+        shutil.rmtree(graph_dir, ignore_errors=True)
+        with quiet():
+            if pbf:
+                seconds, _ = timed(parse_osm.build_and_save_index, pbf, workers, graph_dir)
+            else:
+                seconds, _ = timed(synth.write_graph, graph_dir, net)
+        samples.append(seconds)
+    return summarize(samples)
+
+
+def bench_scaling(pbf, graph_dir, workers_list, repeat):
+    """
+    不同进程数下建索引的耗时。两遍扫描(按进程数并行)与计算PBF指纹、保存索引(单进程)分开计时，
+    加速比相对 workers_list 中第一个进程数计算
+    """
+    import parse_osm
+    results = {}
+    for workers in workers_list:
+        scan, total = [], []
+        for _ in range(repeat):
+            shutil.rmtree(graph_dir, ignore_errors=True)
+            with quiet():
+                start = time.perf_counter()
+                source = parse_osm.pbf_fingerprint(pbf)
+                scan_start = time.perf_counter()
+                ways = parse_osm.extract_rail_ways(pbf, workers)
+                coords = parse_osm.extract_rail_nodes(pbf, ways.node_ids(), workers)
+                scan_end = time.perf_counter()
+                parse_osm.save_index(ways, coords, graph_dir, extra={'source': source})
+            scan.append(scan_end - scan_start)
+            total.append(time.perf_counter() - start)
+        results[str(workers)] = {'scan': summarize(scan), 'total': summarize(total)}
+    base = results[str(workers_list[0])]
+    for r in results.values():
+        r['scan_speedup'] = round(base['scan']['p50_ms'] / r['scan']['p50_ms'], 2)
+        r['total_speedup'] = round(base['total']['p50_ms'] / r['total']['p50_ms'], 2)
+    return results
+
+
+def bench_load(graph_dir, repeat):
+    from rail_store import RailGraph
+    load, meta = [], []
+    for _ in range(repeat):
+        seconds, graph = timed(RailGraph.load, graph_dir)
+        load.append(seconds)
+        seconds, _ = timed(graph.way_meta, int(graph.way_ids[0]))
+        meta.append(seconds)
+    return {'index_load': summarize(load), 'way_meta_first': summarize(meta)}
+
+
+def bench_app(start_ways, walk_steps, connected_samples):
+    """需在工作目录下调用，app.py 按相对路径 data/graph 读取索引"""
+    import app
+    results = {}
+    client = app.app.test_client()
+    with quiet():
+        seconds, _ = timed(client.get, '/ready')
+    results['first_request_s'] = round(seconds, 3)
+
+    samples = [timed(app.find_next_choices, wid)[0] for wid in start_ways]
+    results['find_next_choices'] = summarize(samples)
+    samples = []
+    for wid in start_ways[:connected_samples]:
+        seconds, found = timed(app.find_connected_ways, wid)
+        samples.append(seconds)
+    results['find_connected_ways'] = summarize(samples)
+    results['connected_ways_found'] = len(found) if samples else 0
+
+    ways, map_page, geojson_path, geojson_way = [], [], [], []
+    for wid in start_ways:
+        seconds, resp = timed(client.get, f'/ways/{wid}?reset=1')
+        ways.append(seconds)
+        data = resp.get_json()
+        for _ in range(walk_steps):
+            if not data['choices']:
+                break
+            choice = data['choices'][0]
+            seconds, resp = timed(client.get, f'/ways/{choice}?since={data["total_path_length"]}&zoom=12')
+            ways.append(seconds)
+            data = resp.get_json()
+        highlight = data['choices'][0] if data['choices'] else wid
+        map_page.append(timed(client.get, f'/map/{wid}?highlight={highlight}')[0])
+        geojson_path.append(timed(client.get, f'/geojson/path/{wid}')[0])
+        geojson_way.append(timed(client.get, f'/geojson/way/{highlight}?zoom=12')[0])
+    results['ways'] = summarize(ways)
+    results['map'] = summarize(map_page)
+    results['geojson_path'] = summarize(geojson_path)
+    results['geojson_way'] = summarize(geojson_way)
+    return results
+
+
+def bench_explorer(pbf, graph_dir):
+    import RailExplorer
+    results = {}
+    with quiet():
+        results['explorer_index_load_s'] = round(timed(RailExplorer.RailwayGraph.from_index, graph_dir)[0], 3)
+        if pbf:
+            results['explorer_pbf_load_s'] = round(timed(RailExplorer.RailwayGraph, pbf)[0], 3)
+    return results
+
+
+def run(args):
+    workdir = args.workdir or tempfile.mkdtemp(prefix='rail_bench_')
+    graph_dir = os.path.join(workdir, 'data', 'graph')
+    os.makedirs(os.path.dirname(graph_dir), exist_ok=True)
+    net = None
+    pbf = args.pbf
+    if not pbf:
+        net = synth.network_from_args(args)
+        if not args.no_pbf:
+            pbf = os.path.join(workdir, 'synth.osm.pbf')
+            synth.write_pbf(pbf, net)
+    report = {
+        'revision': git_revision(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': {k: v for k, v in vars(args).items() if k not in ('output', 'diff', 'workdir')},
+        'results': {},
+    }
+    results = report['results']
+    if args.scaling:
+        report['cpu_count'] = os.cpu_count()
+        results['index_build_scaling'] = bench_scaling(pbf, graph_dir, args.scaling, args.repeat)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+        return report
+    results['index_build'] = bench_build(pbf, graph_dir, net, args.workers, args.repeat)
+    results.update(bench_load(graph_dir, args.repeat))
+
+    from rail_store import RailGraph
+    graph = RailGraph.load(graph_dir)
+    report['network'] = {'ways': graph.way_count, 'nodes': graph.node_count}
+    rng = random.Random(args.seed)
+    start_ways = [int(w) for w in rng.sample(list(graph.way_ids), min(args.samples, graph.way_count))]
+
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        results.update(bench_app(start_ways, args.walk_steps, args.connected_samples))
+    finally:
+        os.chdir(cwd)
+    results.update(bench_explorer(pbf, graph_dir))
+
+    if not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+def diff(old_path, new_path, threshold=0.1):
+    """对比两份结果的耗时(p50 或秒数)，变化超过 threshold 的标出"""
+    with open(old_path) as f:
+        old = json.load(f)['results']
+    with open(new_path) as f:
+        new = json.load(f)['results']
+
+    def value(x):
+        if isinstance(x, dict):
+            return x.get('p50_ms')
+        return x if isinstance(x, (int, float)) else None
+
+    print(f'{"指标":<28}{"旧":>12}{"新":>12}{"变化":>10}')
+    for key in sorted(set(old) | set(new)):
+        a, b = value(old.get(key)), value(new.get(key))
+        if a is None or b is None:
+            print(f'{key:<28}{str(a):>12}{str(b):>12}')
+            continue
+        change = (b - a) / a if a else 0
+        flag = ' ↑' if change > threshold else (' ↓' if change < -threshold else '')
+        print(f'{key:<28}{a:>12.3f}{b:>12.3f}{change:>+9.0%}{flag}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='铁路子系统性能测试')
+    synth.add_network_arguments(parser)
+    parser.add_argument('--pbf', help='使用已有的 PBF，不生成合成网络')
+    parser.add_argument('--no-pbf', action='store_true', help='合成网络直接生成索引，不经过 PBF(无需 osmium)')
+    parser.add_argument('-j', '--workers', type=int, default=1, help='建索引的进程数')
+    parser.add_argument('--scaling', type=lambda text: [int(x) for x in text.split(',')], metavar='N1,N2,...',
+                        help='只测这些进程数下的建索引耗时和加速比(需要 PBF)')
+    parser.add_argument('--repeat', type=int, default=3, help='建索引、加载索引的重复次数')
+    parser.add_argument('--samples', type=int, default=50, help='随机起点way数量')
+    parser.add_argument('--walk-steps', type=int, default=5, help='每个起点沿 /ways 前进的步数')
+    parser.add_argument('--connected-samples', type=int, default=3, help='find_connected_ways 的起点数')
+    parser.add_argument('--workdir', help='工作目录(默认临时目录，结束后删除)')
+    parser.add_argument('-o', '--output', help='结果 JSON 路径，默认输出到标准输出')
+    parser.add_argument('--diff', nargs=2, metavar=('OLD', 'NEW'), help='对比两份结果，不运行测试')
+    args = parser.parse_args()
+    if args.diff:
+        diff(*args.diff)
+        return
+    if args.scaling and args.no_pbf:
+        parser.error('--scaling 需要 PBF，不能与 --no-pbf 同时使用')
+    report = run(args)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""
+合成铁路网络，用于在没有全国 PBF 的情况下做性能测试
+
+从一个起点开始按广度优先生长线路：每条way有 nodes_per_way 个点，way 的末端按 branching
+(平均分出的线路数，1 为无分叉的长链)分出后续way，少量way的末端接回已有路口形成环；
+此外混入一定比例的非铁路way，让 PBF 解析的过滤也参与计时。
+
+    python3 synth.py --ways 20000 --branching 1.3 --pbf synth.osm.pbf
+    python3 synth.py --ways 20000 --graph data/graph   # 直接生成索引，不需要 osmium
+"""
+import argparse
+import math
+import os
+import random
+import sys
+from collections import deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+RAIL_TYPES = ('rail', 'rail', 'rail', 'subway', 'light_rail')
+STEP_DEG = 0.002  # 相邻点间距(约200米)
+
+
+class SyntheticNetwork:
+    """node 坐标与 way 列表，way 为 (id, [node id], tags)"""
+
+    def __init__(self):
+        self.node_ids = []
+        self.lat = []
+        self.lon = []
+        self.ways = []
+        self.noise_ways = []
+
+    def add_node(self, lat, lon):
+        self.node_ids.append(len(self.node_ids) + 1)
+        self.lat.append(lat)
+        self.lon.append(lon)
+        return self.node_ids[-1]
+
+    def node_pos(self, node_id):
+        return self.lat[node_id - 1], self.lon[node_id - 1]
+
+
+def generate_network(ways=1000, nodes_per_way=8, branching=1.3, loops=0.02, noise=0.1, seed=1):
+    """
+    :param ways: 铁路way数量
+    :param nodes_per_way: 每条way的点数(>=2)
+    :param branching: way末端平均分出的后续way数
+    :param loops: way末端接回已有路口的概率
+    :param noise: 非铁路way占铁路way数量的比例
+    """
+    rng = random.Random(seed)
+    net = SyntheticNetwork()
+    nodes_per_way = max(nodes_per_way, 2)
+    way_id = 1000
+    line_count = 0
+    junctions = []
+    # 待生长的末端: (node id, 方向, 线路编号)
+    frontier = deque([(net.add_node(30.0, 110.0), 0.0, 0)])
+    while len(net.ways) < ways:
+        if not frontier:
+            # 网络长不动时从已有way的中间点分出新线路
+            _, nodes, _ = rng.choice(net.ways)
+            line_count += 1
+            frontier.append((rng.choice(nodes[1:-1] or nodes), rng.uniform(0, 2 * math.pi), line_count))
+        start, heading, line = frontier.popleft()
+        lat, lon = net.node_pos(start)
+        nodes = [start]
+        for _ in range(nodes_per_way - 1):
+            heading += rng.gauss(0, 0.15)
+            lat += STEP_DEG * math.cos(heading)
+            lon += STEP_DEG * math.sin(heading)
+            nodes.append(net.add_node(lat, lon))
+        if junctions and rng.random() < loops:
+            nodes[-1] = rng.choice(junctions)
+            net.lat.pop()
+            net.lon.pop()
+            net.node_ids.pop()
+        else:
+            children = int(branching) + (rng.random() < branching - int(branching))
+            for k in range(children):
+                if k:
+                    line_count += 1
+                frontier.append((nodes[-1], heading + (rng.uniform(-0.8, 0.8) if k else 0), line if not k else line_count))
+            if children > 1:
+                junctions.append(nodes[-1])
+        tags = {'railway': RAIL_TYPES[line % len(RAIL_TYPES)], 'name': f'测试线{line}', 'ref': str(line)}
+        way_id += rng.randint(1, 50)
+        net.ways.append((way_id, nodes, tags))
+    for _ in range(int(ways * noise)):
+        lat, lon = rng.uniform(29, 31), rng.uniform(109, 111)
+        nodes = [net.add_node(lat + i * STEP_DEG, lon) for i in range(3)]
+        way_id += rng.randint(1, 50)
+        net.noise_ways.append((way_id, nodes, {'highway': 'residential'}))
+    return net
+
+
+def write_pbf(path, net):
+    """写出 OSM PBF(需要 osmium)"""
+    import osmium
+    if os.path.exists(path):
+        os.remove(path)
+    writer = osmium.SimpleWriter(path)
+    try:
+        for node_id, lat, lon in zip(net.node_ids, net.lat, net.lon):
+            writer.add_node(osmium.osm.mutable.Node(id=node_id, location=(lon, lat)))
+        for way_id, nodes, tags in sorted(net.ways + net.noise_ways):
+            writer.add_way(osmium.osm.mutable.Way(id=way_id, nodes=nodes, tags=tags))
+    finally:
+        writer.close()
+
+
+def write_graph(graph_dir, net):
+    """不经过 PBF，直接生成与 parse_osm.py 相同的索引"""
+    import numpy as np
+    import parse_osm
+    from tag_store import TagTable
+
+    way_ids = np.array([w[0] for w in net.ways], dtype=np.int64)
+    offsets = np.zeros(len(net.ways) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(w[1]) for w in net.ways])
+    refs = np.array([n for w in net.ways for n in w[1]], dtype=np.int64)
+    raw = (way_ids, offsets, refs, np.array(net.node_ids, dtype=np.int64),
+           np.array(net.lat, dtype=np.float64), np.array(net.lon, dtype=np.float64))
+    tags = TagTable()
+    for _, _, way_tags in net.ways:
+        tags.append(way_tags)
+    parse_osm.save_arrays(raw, tags, graph_dir)
+
+
+def add_network_arguments(parser):
+    parser.add_argument('--ways', type=int, default=5000, help='铁路way数量')
+    parser.add_argument('--nodes-per-way', type=int, default=8)
+    parser.add_argument('--branching', type=float, default=1.3, help='way末端平均分出的后续way数')
+    parser.add_argument('--loops', type=float, default=0.02, help='way末端接回已有路口的概率')
+    parser.add_argument('--noise', type=float, default=0.1, help='非铁路way的比例')
+    parser.add_argument('--seed', type=int, default=1)
+
+
+def network_from_args(args):
+    return generate_network(args.ways, args.nodes_per_way, args.branching, args.loops, args.noise, args.seed)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='生成合成铁路网络(PBF 或索引)')
+    add_network_arguments(parser)
+    parser.add_argument('--pbf', help='输出 PBF 路径')
+    parser.add_argument('--graph', help='输出索引目录')
+    args = parser.parse_args()
+    if not args.pbf and not args.graph:
+        parser.error('至少指定 --pbf 或 --graph')
+    net = network_from_args(args)
+    print(f'way: {len(net.ways)}，node: {len(net.node_ids)}，非铁路way: {len(net.noise_ways)}')
+    if args.pbf:
+        write_pbf(args.pbf, net)
+    if args.graph:
+        write_graph(args.graph, net)
@@ -1,5 +1,17 @@
+import argparse
+import os
+import sys
 import osmium as osm
 from collections import defaultdict
+from collections.abc import Mapping
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+sys.path.insert(0, APP_DIR)
+import parse_osm  # noqa: E402
+from components import Components  # noqa: E402
+from name_search import NameIndex  # noqa: E402
+from rail_store import RailGraph  # noqa: E402
+from traversal import iter_connected_ways  # noqa: E402
 """
 ======================================================
 RailMapper - 铁路轨道网络探索工具
@@ -74,17 +86,89 @@ RailMapper 是一个交互式工具，用于从OSM PBF文件中提取和分析
 数据准备：
 ----------------------
 - 下载OSM PBF格式地图文件
-- 安装Python依赖: pip install osmium
+- 安装Python依赖: pip install osmium numpy tqdm
+- 默认与 app 共用 parse_osm.py 生成的索引(../app/data/graph)：首次启动或PBF有变化时自动重建，
+  之后启动直接 mmap 加载索引，约一秒即可开始；--no-index 时按旧方式直接解析PBF
+    python3 RailExplorer.py [PBF路径] [--graph 索引目录] [--rebuild]
 """
 
+PBF_PATH = "/Users/sowevo/Downloads/china-latest.osm.pbf"  # 替换为你的PBF文件路径
+GRAPH_DIR = os.path.join(APP_DIR, 'data', 'graph')
+
+
+class _WayDataView(Mapping):
+    """把CSR索引包装成 way_data 字典的只读视图，按需解码"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def __getitem__(self, way_id):
+        if not self.store.has_way(way_id):
+            raise KeyError(way_id)
+        return {'id': way_id, 'nodes': self.store.way_nodes(way_id), 'tags': self.store.way_tags(way_id)}
+
+    def __contains__(self, way_id):
+        return self.store.has_way(way_id)
+
+    def __iter__(self):
+        return self.store.iter_way_ids()
+
+    def __len__(self):
+        return self.store.way_count
+
+
+class _NodeWaysView(Mapping):
+    """node_ways 的只读视图，与 defaultdict(set) 一样，不存在的节点返回空集合"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def __getitem__(self, node_id):
+        return self.store.node_ways(node_id)
+
+    def __iter__(self):
+        return (int(n) for n in self.store.node_ids)
+
+    def __len__(self):
+        return self.store.node_count
+
+
 class RailwayGraph:
     def __init__(self, pbf_file):
+        self.store = None  # 从索引加载时为 RailGraph
         self.node_ways = defaultdict(set)  # 节点ID → 连接的轨道Way IDs
         self.way_data = {}  # Way ID → {id, nodes, tags}
         print("正在加载铁路网络数据...")
         self._load_railway_data(pbf_file)
         print(f"数据加载完成! 共找到 {len(self.way_data)} 条铁路轨道")
 
+    @classmethod
+    def from_index(cls, graph_dir):
+        """从 parse_osm.py 生成的CSR索引加载(mmap)，无需解析PBF"""
+        graph = cls.__new__(cls)
+        store = RailGraph.load(graph_dir)
+        graph.store = store
+        graph.name_index = NameIndex(store)
+        try:
+            graph.components = Components(store)
+        except KeyError:
+            graph.components = None  # 旧索引没有连通分量数据
+        graph.way_data = _WayDataView(store)
+        graph.node_ways = _NodeWaysView(store)
+        print(f"索引加载完成! 共 {len(graph.way_data)} 条铁路轨道")
+        return graph
+
+    @classmethod
+    def open(cls, pbf_file, graph_dir=GRAPH_DIR, rebuild=False, workers=0):
+        """
+        加载持久化索引，索引不存在或PBF有变化时先重建，见 parse_osm.ensure_index
+        :param rebuild: 强制重建
+        :param workers: 重建时的解析进程数，0表示使用全部CPU核心
+        """
+        if parse_osm.ensure_index(pbf_file, graph_dir, workers or os.cpu_count(), force=rebuild):
+            print("索引已重建")
+        return cls.from_index(graph_dir)
+
     def _load_railway_data(self, pbf_file):
         """从PBF文件加载铁路轨道数据"""
 
@@ -108,19 +192,47 @@ class RailwayGraph:
         handler = RailwayHandler(self)
         handler.apply_file(pbf_file)
 
+    def network_summary(self, way_id):
+        """way 所在网络(连通分量)的统计，只有索引模式下可用，否则返回 None"""
+        components = getattr(self, 'components', None)
+        if components is None:
+            return None
+        component = components.component_of(way_id)
+        return components.summary(component) if component >= 0 else None
+
+    def search_ways(self, term, offset=0, limit=20):
+        """
+        按名称搜索轨道，索引模式下使用 n-gram 倒排索引并按相关度排序
+        :return: (匹配总数, 当前页的轨道数据列表)
+        """
+        if self.store is not None:
+            total, hits = self.name_index.search(term, offset, limit)
+            return total, [self.way_data[way_id] for way_id, _ in hits]
+        found = [way for way in self.way_data.values() if term in way['tags'].get('name', '').lower()]
+        return len(found), found[offset:offset + limit]
+
+    def connected_way_ids(self, way_id):
+        """通过节点直接相连的其他轨道ID，索引模式下直接读预计算的邻接表"""
+        if self.store is not None:
+            return self.store.neighbor_ways(way_id)
+        connections = set()
+        for node_id in self.way_data[way_id]['nodes']:
+            connections.update(self.node_ways[node_id])
+        connections.discard(way_id)
+        return connections
+
     def get_connected_railways(self, start_way_id, max_level=100):
         """提取相连的铁路轨道（含分支处理）"""
         visited = set()  # 已访问的Way ID
         result = []  # 最终结果序列
 
-        def traverse(way_id, level):
-            if level > max_level or way_id in visited:
-                return
-
+        # 逐层前进的循环，不再每层递归一次；任何一步结束都意味着整条路径探索结束
+        way_id, level = start_way_id, 1
+        while way_id is not None and level <= max_level and way_id not in visited:
             way = self.way_data.get(way_id)
             if not way:
                 print(f"警告: 轨道 {way_id} 不存在于数据中!")
-                return
+                break
 
             visited.add(way_id)
             result.append(way)
@@ -129,64 +241,68 @@ class RailwayGraph:
 
             # 收集通过节点连接的其他轨道
             branches = {}
-            for node_id in way['nodes']:
-                for connected_way_id in self.node_ways[node_id]:
-                    # 排除自身和已访问轨道
-                    if connected_way_id != way_id and connected_way_id not in visited:
-                        connected_way = self.way_data[connected_way_id]
-                        branches[connected_way_id] = connected_way
+            for connected_way_id in sorted(self.connected_way_ids(way_id)):
+                # 排除已访问轨道
+                if connected_way_id not in visited:
+                    branches[connected_way_id] = self.way_data[connected_way_id]
 
+            way_id, level = None, level + 1
             # 处理分支
-            if branches:
-                if len(branches) == 1:
-                    # 只有一个分支自动选择
-                    next_way_id = next(iter(branches))
-                    way_name = branches[next_way_id]['tags'].get('name', '未命名')
-                    print(f"自动选择唯一分支: {next_way_id} ({way_name})")
-                    traverse(next_way_id, level + 1)
-                else:
-                    # 多个分支需用户选择
-                    print("\n发现多条分支轨道:")
-                    for idx, (wid, way) in enumerate(branches.items(), 1):
-                        name = way['tags'].get('name', '未命名轨道')
-                        nodes_count = len(way['nodes'])
-                        print(f"  {idx}> Way {wid}: {name} (含{nodes_count}节点)")
-                        log_list(result,wid)
-                    print("  b> 返回上一级")
-                    print("  e> 结束当前路径探索")
-
-                    choice = input("请选择操作: ").lower()
-
-                    if choice == 'b' and level > 1:
-                        print("返回上一级轨道...")
-                        return  # 返回上一级
-                    elif choice == 'e':
-                        print("结束当前路径探索")
-                        return
-                    elif choice.isdigit():
-                        choice_idx = int(choice)
-                        if 1 <= choice_idx <= len(branches):
-                            selected_id = list(branches.keys())[choice_idx - 1]
-                            traverse(selected_id, level + 1)
-                        else:
-                            print("无效选择，返回上一级")
-                            return
-                    else:
-                        print("无效输入，返回上一级")
-                        return
-            else:
+            if not branches:
                 print("此轨道无未访问分支")
+            elif len(branches) == 1:
+                # 只有一个分支自动选择
+                way_id = next(iter(branches))
+                way_name = branches[way_id]['tags'].get('name', '未命名')
+                print(f"自动选择唯一分支: {way_id} ({way_name})")
+            else:
+                # 多个分支需用户选择
+                print("\n发现多条分支轨道:")
+                for idx, (wid, way) in enumerate(branches.items(), 1):
+                    name = way['tags'].get('name', '未命名轨道')
+                    nodes_count = len(way['nodes'])
+                    print(f"  {idx}> Way {wid}: {name} (含{nodes_count}节点)")
+                    log_list(result,wid)
+                print("  b> 返回上一级")
+                print("  e> 结束当前路径探索")
+
+                choice = input("请选择操作: ").lower()
+
+                if choice == 'b' and level > 2:
+                    print("返回上一级轨道...")
+                elif choice == 'e':
+                    print("结束当前路径探索")
+                elif choice.isdigit():
+                    choice_idx = int(choice)
+                    if 1 <= choice_idx <= len(branches):
+                        way_id = list(branches.keys())[choice_idx - 1]
+                    else:
+                        print("无效选择，返回上一级")
+                else:
+                    print("无效输入，返回上一级")
 
-        traverse(start_way_id, 1)
         return result
 
+    def iter_connected(self, start_way_id, max_depth=None, max_ways=None):
+        """非交互地遍历整个相连网络，逐条产出轨道数据，内存只与遍历深度有关"""
+        for way_id, _ in iter_connected_ways(self.connected_way_ids, start_way_id, max_depth, max_ways):
+            yield self.way_data[way_id]
+
 
 # 主程序循环
 def main():
-    pbf_path = "/Users/sowevo/Downloads/china-latest.osm.pbf"  # 替换为你的PBF文件路径
+    parser = argparse.ArgumentParser(description='铁路轨道网络探索工具')
+    parser.add_argument('pbf', nargs='?', default=PBF_PATH, help='OSM PBF文件路径')
+    parser.add_argument('--graph', default=GRAPH_DIR, help='索引目录(与 app 共用)')
+    parser.add_argument('--rebuild', action='store_true', help='强制由PBF重建索引')
+    parser.add_argument('--no-index', action='store_true', help='不使用索引，每次直接解析PBF')
+    args = parser.parse_args()
 
     try:
-        graph = RailwayGraph(pbf_path)
+        if args.no_index:
+            graph = RailwayGraph(args.pbf)
+        else:
+            graph = RailwayGraph.open(args.pbf, args.graph, rebuild=args.rebuild)
     except Exception as e:
         print(f"加载OSM文件失败: {e}")
         return
@@ -205,28 +321,29 @@ def main():
 
         if start_input == 's':
             search_term = input("请输入轨道名称关键词: ").strip().lower()
-            found = []
-
-            # 搜索轨道名称包含关键词的轨道
-            for way_id, way in graph.way_data.items():
-                if search_term in way['tags'].get('name', '').lower():
-                    found.append(way)
-                    if len(found) >= 20:  # 限制结果数量
-                        break
-
-            if found:
+            page_size = 20
+            offset = 0
+            while True:
+                total, found = graph.search_ways(search_term, offset, page_size)
+                if not found:
+                    break
                 print("\n找到以下匹配的轨道:")
                 for i, way in enumerate(found, 1):
                     name = way['tags'].get('name', '未命名')
                     print(f"{i}. Way {way['id']}: {name}")
 
                 # 显示更多结果信息
-                if len(found) > 20:
-                    print(f"(省略了 {len(found) - 20} 条结果)")
+                if total > offset + len(found):
+                    print(f"(第 {offset + 1}-{offset + len(found)} 条，共 {total} 条，输入 n 查看下一页)")
 
                 # 灵活的输入处理
                 choice = input("\n请选择轨道编号或输入轨道ID (按回车返回): ").strip()
+                if choice.lower() == 'n' and total > offset + len(found):
+                    offset += page_size
+                    continue
+                break
 
+            if found:
                 if choice == "":
                     print("返回主菜单...")
                 elif choice.isdigit():
@@ -273,13 +390,13 @@ def main():
                     print(f"名称: {way['tags'].get('name', '未命名')}")
                     print(f"类型: {way['tags'].get('railway', '未指定')}")
                     print(f"节点数: {len(way['nodes'])}")
+                    network = graph.network_summary(way_id)
+                    if network:
+                        print(f"所属网络: #{network['component']}，共 {network['ways']} 条轨道，"
+                              f"{network['length_km']:.1f} km")
 
                     # 检查连接点
-                    connections = set()
-                    for node_id in way['nodes']:
-                        for w_id in graph.node_ways[node_id]:
-                            if w_id != way_id:
-                                connections.add(w_id)
+                    connections = graph.connected_way_ids(way_id)
 
                     if connections:
                         print(f"\n此轨道连接到以下轨道:")